@@ -0,0 +1,3 @@
+"""
+Офлайн-бенчмарки парсера OZON на сохраненных страницах
+"""
@@ -0,0 +1,127 @@
+"""
+Классификатор страниц против прежних проверок парсера
+
+    python -m benchmarks.classifier [page1.html page2.html]
+
+before - прежние _detect_antibot, _parse_stock и поиск цены двумя регулярками
+         (каждая проверка заново приводит страницу к нижнему регистру)
+after  - один проход classify_page
+
+Для каждой страницы выводятся CPU-время, пик выделенной памяти и совпадение
+ответов (антибот, наличие, цена). Без аргументов - страницы корпуса
+benchmarks/fixtures; ответы на корпусе проверяет и tests/test_page_classifier.py.
+Код выхода 1 - разошлись антибот или цена. Наличие classify_page определяет
+только по виджетам статуса, поэтому оно может не совпадать с прежним
+ответом - наличие сверяется с manifest.json в тестах.
+"""
+
+import re
+import sys
+
+from benchmarks.corpus import load_corpus
+from benchmarks.extraction import _measure
+from page_classifier import classify_page
+from parser import PRICE_MAX, PRICE_MIN
+
+# Копия прежней логики parser.py для сравнения
+LEGACY_ANTIBOT_KEYWORDS = [
+    'antibot', 'доступ ограничен', 'access denied', 'captcha',
+    'подтвердите, что вы не робот', 'я не робот', 'recaptcha',
+    'hcaptcha', 'cloudflare', 'checking your browser', 'just a moment',
+    'fastly', 'bot management', 'challenge', 'fab_chlg_',
+]
+LEGACY_OZON_INDICATORS = [
+    'data-widget="webProductHeading"',
+    'data-widget="webPrice"',
+    'ozon.ru/product/',
+]
+LEGACY_STOCK_OUT_PHRASES = ['нет в наличии', 'закончился', 'товар закончился']
+
+
+def legacy_detect_antibot(html: str) -> bool:
+    html_lower = html.lower()
+    if any(keyword in html_lower for keyword in LEGACY_ANTIBOT_KEYWORDS):
+        return True
+    if 150000 < len(html) < 250000:
+        return not any(indicator in html for indicator in LEGACY_OZON_INDICATORS)
+    return False
+
+
+def legacy_out_of_stock(html: str) -> bool:
+    text = html.lower()
+    return any(p in text for p in LEGACY_STOCK_OUT_PHRASES)
+
+
+def legacy_price(html: str):
+    for pattern in (r'(\d[\d\s]{2,})\s*₽', r'₽\s*(\d[\d\s]{2,})'):
+        match = re.search(pattern, html)
+        if match:
+            price = float(match.group(1).replace(' ', '').replace('\xa0', ''))
+            if PRICE_MIN <= price <= PRICE_MAX:
+                return price
+    return None
+
+
+def _price(page_class):
+    for candidate in page_class.price_candidates():
+        price = float(candidate.replace(' ', '').replace('\xa0', ''))
+        if PRICE_MIN <= price <= PRICE_MAX:
+            return price
+    return None
+
+
+def check_before(html: str):
+    antibot = legacy_detect_antibot(html)
+    return antibot, legacy_out_of_stock(html), None if antibot else legacy_price(html)
+
+
+def agree(before, after) -> bool:
+    """Совпадение антибота и цены (наличие на странице-заглушке не проверяется)"""
+    if before[0] or after[0]:
+        return before[0] == after[0]
+    return before[2] == after[2]
+
+
+def check_after(html: str):
+    page_class = classify_page(html)
+    return page_class.is_antibot, page_class.out_of_stock, None if page_class.is_antibot else _price(page_class)
+
+
+def _pages(argv):
+    """(имя, HTML) страниц из аргументов или корпуса"""
+    if not argv:
+        for fixture in load_corpus():
+            yield fixture.name, fixture.html
+        return
+    for path in argv:
+        with open(path, 'r', encoding='utf-8') as f:
+            yield path, f.read()
+
+
+def main(argv):
+    if '--help' in argv:
+        print(__doc__)
+        return 0
+
+    mismatches = 0
+    print(f"{'страница':<40} {'размер':>9} {'режим':>8} {'CPU, мс':>9} {'пик, КБ':>10}  антибот/нет в наличии/цена")
+    for path, html in _pages(argv):
+        before, cpu_before, mem_before = _measure(check_before, html)
+        after, cpu_after, mem_after = _measure(check_after, html)
+        same = agree(before, after)
+        mismatches += not same
+        if not same:
+            note = '  НЕ СОВПАЛО'
+        elif before != after and not before[0]:
+            note = '  (наличие по виджетам)'
+        else:
+            note = ''
+        size = f"{len(html) // 1024} КБ"
+        print(f"{path[-40:]:<40} {size:>9} {'before':>8} {cpu_before:>9.1f} {mem_before:>10.0f}  {before}")
+        print(f"{'':<40} {'':>9} {'after':>8} {cpu_after:>9.1f} {mem_after:>10.0f}  {after}"
+              f"{note}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,158 @@
+"""
+Корпус страниц OZON для офлайн-бенчмарков
+
+Страницы лежат в benchmarks/fixtures, ожидаемые ответы парсера - в
+manifest.json: антибот, цена, наличие, название. Размер живой страницы
+OZON - сотни килобайт встроенного состояния виджетов; чтобы не хранить
+их в репозитории, страница дополняется до pad_to байт детерминированным
+наполнителем перед </body> (без знаков рубля и ключевых слов антибота).
+
+    python -m benchmarks.corpus                    состав корпуса
+    python -m benchmarks.corpus add page.html KIND [--sku N]
+
+add копирует сохраненную страницу (page.content() или "Сохранить как")
+в корпус, а ожидаемые ответы записывает по текущему парсеру - их нужно
+проверить глазами перед коммитом. KIND: product, out_of_stock, no_price, antibot.
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+from typing import Dict, List, Optional
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+MANIFEST = 'manifest.json'
+KINDS = ('product', 'out_of_stock', 'no_price', 'antibot')
+
+# Слова наполнителя: похоже на состояние виджетов, но без ₽, фраз наличия и антибота
+_FILLER_WORDS = (
+    'item', 'tile', 'sku', 'rating', 'reviews', 'seller', 'brand', 'delivery', 'size',
+    'color', 'товар', 'отзывы', 'продавец', 'доставка', 'размер', 'цвет', 'бренд',
+    'рейтинг', 'склад', 'магазин', 'подборка', 'похожие', 'характеристики',
+)
+
+
+class Fixture:
+    """Страница корпуса и ожидаемые ответы парсера"""
+
+    def __init__(self, name: str, kind: str, html: str, expected: Dict, sku: Optional[int] = None):
+        self.name = name
+        self.kind = kind
+        self.html = html
+        self.expected = expected
+        self.sku = sku
+
+    @property
+    def is_antibot(self) -> bool:
+        return self.kind == 'antibot'
+
+    def __repr__(self):
+        return f"Fixture({self.name}, {self.kind}, {len(self.html) // 1024} КБ)"
+
+
+def pad(html: str, size: int, seed=0) -> str:
+    """Страница, дополненная до size символов блоками состояния виджетов"""
+    missing = size - len(html)
+    if missing <= 0:
+        return html
+    rng = random.Random(seed)
+    blocks = []
+    length = 0
+    index = 0
+    while length < missing:
+        words = ' '.join(rng.choice(_FILLER_WORDS) for _ in range(rng.randint(8, 24)))
+        block = (f'<div data-state="tile-{index}" hidden>'
+                 f'{{"id":{rng.randint(10**8, 10**10)},"title":"{words}","score":{rng.randint(1, 50)}}}</div>\n')
+        blocks.append(block)
+        length += len(block)
+        index += 1
+    filler = ''.join(blocks)[:missing]
+    position = html.rfind('</body>')
+    if position == -1:
+        return html + filler
+    return html[:position] + filler + html[position:]
+
+
+def _read_manifest(directory: str) -> Dict:
+    try:
+        with open(os.path.join(directory, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def load_corpus(directory: str = FIXTURES_DIR, kinds: Optional[List[str]] = None) -> List[Fixture]:
+    """Страницы корпуса (дополненные до размера живых страниц)"""
+    fixtures = []
+    for name, entry in sorted(_read_manifest(directory).items()):
+        if kinds and entry['kind'] not in kinds:
+            continue
+        with open(os.path.join(directory, name), 'r', encoding='utf-8') as f:
+            html = f.read()
+        if entry.get('pad_to'):
+            html = pad(html, entry['pad_to'], seed=name)
+        fixtures.append(Fixture(name, entry['kind'], html, entry['expected'], entry.get('sku')))
+    return fixtures
+
+
+def expected_from_parser(html: str) -> Dict:
+    """Ответы текущего парсера по странице (для новых страниц корпуса)"""
+    from parser import OzonParser
+
+    from bs4 import BeautifulSoup
+
+    parser = OzonParser()
+    antibot = parser._detect_antibot(html)
+    result = None if antibot else parser._parse_html(html)
+    in_stock, _ = parser._parse_stock(html)
+    name = None
+    if not antibot:
+        # Название есть и у страницы без цены
+        name = result['name'] if result else parser._parse_name(BeautifulSoup(html, 'html.parser'))
+    return {
+        'antibot': antibot,
+        'price': result['price'] if result else None,
+        'in_stock': in_stock,
+        'name': name,
+    }
+
+
+def add(path: str, kind: str, sku: Optional[int] = None, directory: str = FIXTURES_DIR) -> Dict:
+    """Добавление сохраненной страницы в корпус"""
+    if kind not in KINDS:
+        raise ValueError(f"Неизвестный вид страницы {kind}: {', '.join(KINDS)}")
+    name = os.path.basename(path)
+    shutil.copyfile(path, os.path.join(directory, name))
+    with open(path, 'r', encoding='utf-8') as f:
+        expected = expected_from_parser(f.read())
+
+    manifest = _read_manifest(directory)
+    manifest[name] = {'kind': kind, 'expected': expected}
+    if sku:
+        manifest[name]['sku'] = sku
+    with open(os.path.join(directory, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    return expected
+
+
+def main(argv):
+    if argv[:1] == ['add'] and len(argv) >= 3:
+        sku = int(argv[argv.index('--sku') + 1]) if '--sku' in argv else None
+        expected = add(argv[1], argv[2], sku)
+        print(f"Добавлено: {os.path.basename(argv[1])}, ожидается {expected} - проверьте перед коммитом")
+        return 0
+    if argv:
+        print(__doc__)
+        return 1
+
+    print(f"{'страница':<28} {'вид':<13} {'размер':>9}  ожидается")
+    for fixture in load_corpus():
+        print(f"{fixture.name:<28} {fixture.kind:<13} {len(fixture.html) // 1024:>6} КБ  {fixture.expected}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
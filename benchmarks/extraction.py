@@ -0,0 +1,109 @@
+"""
+Сравнение извлечения данных: весь документ против нужных виджетов
+
+    python -m benchmarks.extraction page1.html page2.html [--browser]
+
+before - page.content() + полное дерево BeautifulSoup + регулярки по всей строке
+after  - дерево только для h1 и webPrice (режим html)
+dom    - извлечение на странице через page.evaluate (режим dom, нужен Chromium)
+
+Для каждого режима выводятся CPU-время Python и пик выделенной памяти.
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+
+from parser import OzonParser
+
+REPEAT = 5
+
+
+def _measure(func, *args):
+    """CPU-время (мс на вызов) и пик памяти Python (КБ)"""
+    tracemalloc.start()
+    started = time.process_time()
+    for _ in range(REPEAT):
+        result = func(*args)
+    cpu_ms = (time.process_time() - started) / REPEAT * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu_ms, peak / 1024
+
+
+def parse_before(parser: OzonParser, html: str):
+    """Прежний путь: полное дерево документа"""
+    soup = BeautifulSoup(html, 'html.parser')
+    price = parser._parse_price(html, soup)
+    return {'name': parser._parse_name(soup), 'price': price, 'in_stock': parser._parse_stock(html)[0]}
+
+
+def parse_after(parser: OzonParser, html: str):
+    """Режим html: дерево только для нужных виджетов"""
+    result = parser._parse_html(html)
+    return result and {k: result[k] for k in ('name', 'price', 'in_stock')}
+
+
+async def _measure_browser(parser: OzonParser, pages: dict):
+    """Python-сторона режимов html и dom на реальной странице Chromium"""
+    from playwright.async_api import async_playwright
+
+    rows = []
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(args=['--no-sandbox'])
+        page = await browser.new_page()
+        for path, html in pages.items():
+            await page.set_content(html, wait_until='domcontentloaded')
+
+            async def via_content():
+                return parse_after(parser, await page.content())
+
+            async def via_dom():
+                return await parser._extract_in_page(page)
+
+            for mode, func in (('content', via_content), ('dom', via_dom)):
+                tracemalloc.start()
+                started = time.process_time()
+                for _ in range(REPEAT):
+                    await func()
+                cpu_ms = (time.process_time() - started) / REPEAT * 1000
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                rows.append((path, mode, cpu_ms, peak / 1024))
+        await browser.close()
+    return rows
+
+
+def main(argv):
+    paths = [a for a in argv if not a.startswith('--')]
+    if not paths:
+        print(__doc__)
+        return 1
+
+    parser = OzonParser()
+    pages = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            pages[path] = f.read()
+
+    print(f"{'страница':<40} {'размер':>9} {'режим':>8} {'CPU, мс':>9} {'пик, КБ':>10}  результат совпал")
+    for path, html in pages.items():
+        before, cpu_before, mem_before = _measure(parse_before, parser, html)
+        after, cpu_after, mem_after = _measure(parse_after, parser, html)
+        same = before == after or (after is None and not before['price'])
+        size = f"{len(html) // 1024} КБ"
+        print(f"{path[-40:]:<40} {size:>9} {'before':>8} {cpu_before:>9.1f} {mem_before:>10.0f}")
+        print(f"{'':<40} {'':>9} {'after':>8} {cpu_after:>9.1f} {mem_after:>10.0f}  {'да' if same else 'НЕТ'}")
+
+    if '--browser' in argv:
+        print()
+        for path, mode, cpu_ms, peak in asyncio.run(_measure_browser(parser, pages)):
+            print(f"{path[-40:]:<40} {mode:>8} {cpu_ms:>9.1f} {peak:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,164 @@
+"""
+Нагрузочный прогон parse_product_async на локальном стенде OZON
+
+    python -m benchmarks.load [--products 40] [--concurrency 4] [--latency 0.2] [--jitter 0.1]
+                              [--challenge-rate 0.1] [--sticky] [--fast-path] [--no-delays]
+
+Стенд (benchmarks.stand) запускается в этом же процессе и подключается к
+парсеру как единственный прокси, товары - страницы корпуса. Без
+--fast-path каждый товар проходит весь путь через Chromium (нужен
+playwright install chromium): warm-up, goto, ожидание контента, антибот,
+разбор. --fast-path сначала пробует HTTP с заранее подготовленной сессией -
+такой прогон идет и без Chromium, пока стенд не отвечает антиботом.
+--no-delays убирает паузы "человеческого поведения" (PAGE_LOAD_DELAY и
+другие) и показывает чистую стоимость конвейера.
+
+Выводятся пропускная способность, p50/p95 времени товара, доля успешных
+проверок, расхождения цены с корпусом и время этапов из метрик
+(ozon_stage_seconds). Код выхода 1 - есть расхождения с корпусом.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.corpus import load_corpus
+from benchmarks.stand import STAND_BASE_URL, OzonStand, _option
+from browser_pool import BrowserPool
+from http_fast_path import HttpFastPath
+from metrics import STAGE_SECONDS
+from parser import OzonParser
+from request_filter import RequestFilter
+from session_store import SessionStore
+
+STAGES = (
+    'fast_path', 'browser_launch', 'new_context', 'warm_up', 'goto', 'wait_for_content',
+    'page_load_delay', 'bypass_antibot', 'extract', 'parse',
+)
+
+
+async def _no_delay(*args, **kwargs):
+    await asyncio.sleep(0)
+
+
+def _seed_session(sessions: SessionStore, proxy: str):
+    """Сессия OZON для быстрого пути без warm-up в браузере"""
+    os.makedirs(sessions.directory, exist_ok=True)
+    state = {'cookies': [{'name': 'stand_session', 'value': '1', 'domain': '.ozon.ru', 'path': '/',
+                          'expires': -1}], 'origins': []}
+    with open(sessions.path(proxy), 'w') as f:
+        json.dump(state, f)
+
+
+def _percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))] if ordered else 0.0
+
+
+async def run_load(products: int, concurrency: int, stand: OzonStand, fast_path: bool,
+                   no_delays: bool, runtime_dir: str) -> Dict:
+    """Прогон products проверок по concurrency одновременно"""
+    sessions = SessionStore(os.path.join(runtime_dir, 'sessions'))
+    pool = BrowserPool(headless=True, sessions=sessions, request_filter=RequestFilter())
+    parser = OzonParser(
+        pool=pool,
+        max_per_proxy=concurrency,
+        fast_path=HttpFastPath(base_url=STAND_BASE_URL) if fast_path else None,
+        base_url=STAND_BASE_URL,
+    )
+    proxy_file = os.path.join(runtime_dir, 'proxies.txt')
+    with open(proxy_file, 'w') as f:
+        f.write(stand.proxy + "\n")
+    parser.load_proxies(proxy_file)
+    if fast_path:
+        _seed_session(sessions, stand.proxy)
+    if no_delays:
+        parser._human_delay = _no_delay
+
+    fixtures = [stand.products[i % len(stand.products)] for i in range(products)]
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+    succeeded = 0
+    mismatches = []
+
+    async def check(fixture):
+        nonlocal succeeded
+        async with semaphore:
+            started = time.perf_counter()
+            result = await parser.parse_product_async(f"{STAND_BASE_URL}/product/stand-{fixture.sku}/")
+            durations.append(time.perf_counter() - started)
+        price = result['price'] if result else None
+        succeeded += result is not None
+        if price != fixture.expected['price']:
+            mismatches.append((fixture.name, fixture.expected['price'], price))
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(check(fixture) for fixture in fixtures))
+    finally:
+        elapsed = time.perf_counter() - started
+        await parser.close()
+    return {
+        'elapsed': elapsed,
+        'durations': durations,
+        'succeeded': succeeded,
+        'mismatches': mismatches,
+        'pool': pool.stats(),
+        'fast_path': (parser.fast_path.hits, parser.fast_path.fallbacks) if parser.fast_path else None,
+    }
+
+
+def report(result: Dict, products: int, stand: OzonStand):
+    durations = result['durations']
+    print(f"\nТоваров: {products}, за {result['elapsed']:.1f} с - "
+          f"{products / result['elapsed'] * 60:.0f} товаров/мин")
+    print(f"Время товара: p50 {_percentile(durations, 0.5):.2f} с, p95 {_percentile(durations, 0.95):.2f} с")
+    # Страницы без цены в корпусе проверкой не считаются успешными
+    print(f"Успешно: {result['succeeded']}/{products}, расхождений с корпусом: {len(result['mismatches'])}")
+    for name, expected, price in result['mismatches'][:10]:
+        print(f"  {name}: ожидалась цена {expected}, получено {price}")
+    if result['fast_path']:
+        print(f"Быстрый путь: успешно {result['fast_path'][0]}, через браузер {result['fast_path'][1]}")
+    print(f"Пул браузеров: {result['pool']}")
+    print(f"Стенд: {stand.stats()}")
+
+    print(f"\n{'этап':<18} {'раз':>6} {'всего, с':>10} {'среднее, мс':>12}")
+    for stage in STAGES:
+        count = STAGE_SECONDS.count(stage=stage)
+        if count:
+            total = STAGE_SECONDS.total(stage=stage)
+            print(f"{stage:<18} {count:>6} {total:>10.2f} {total / count * 1000:>12.1f}")
+
+
+async def main(argv) -> int:
+    products = _option(argv, '--products', 40, int)
+    concurrency = _option(argv, '--concurrency', 4, int)
+    stand = OzonStand(
+        load_corpus(),
+        latency=_option(argv, '--latency', 0.2),
+        jitter=_option(argv, '--jitter', 0.1),
+        challenge_rate=_option(argv, '--challenge-rate', 0.0),
+        sticky='--sticky' in argv,
+    )
+    await stand.start()
+    try:
+        with tempfile.TemporaryDirectory() as runtime_dir:
+            result = await run_load(products, concurrency, stand, '--fast-path' in argv,
+                                    '--no-delays' in argv, runtime_dir)
+    finally:
+        await stand.close()
+    report(result, products, stand)
+    return 1 if result['mismatches'] else 0
+
+
+if __name__ == "__main__":
+    if '--help' in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(main(sys.argv[1:])))
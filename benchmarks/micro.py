@@ -0,0 +1,127 @@
+"""
+Микро-бенчмарки разбора страниц на корпусе benchmarks/fixtures
+
+    python -m benchmarks.micro [--save base.json] [--compare base.json] [--tolerance 0.5]
+
+Для каждой страницы корпуса замеряются _detect_antibot, _parse_price,
+_parse_name, _parse_stock (каждая - сама по себе, с классификацией страницы
+внутри) и весь _parse_html. Время - лучшее из нескольких прогонов, мкс на
+вызов. Ответы сверяются с manifest.json корпуса; --compare сравнивает время
+с сохраненным прогоном. Код выхода 1 - ответ разошелся с ожидаемым или
+замер медленнее базового больше чем на tolerance.
+"""
+
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.corpus import Fixture, load_corpus
+from parser import OzonParser
+
+RUNS = 5
+# Минимальная длительность одного прогона (секунды)
+MIN_RUN_TIME = 0.05
+# Допуск замедления: разброс между прогонами на загруженной машине доходит до десятков процентов
+TOLERANCE = 0.5
+
+
+def _soup(parser: OzonParser, html: str):
+    """Дерево только для h1 и webPrice - как в _parse_html"""
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    strainer = SoupStrainer(lambda name, attrs: name == 'h1' or (attrs or {}).get('data-widget') == 'webPrice')
+    return BeautifulSoup(parser._widget_fragments(html) or html, 'html.parser', parse_only=strainer)
+
+
+def time_call(func: Callable, runs: int = RUNS) -> Tuple[float, object]:
+    """Лучшее время вызова (мкс) и результат"""
+    # Подбор числа вызовов на прогон, как в timeit.autorange
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            result = func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_RUN_TIME:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(runs - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - started)
+    return best / number * 1e6, result
+
+
+def cases(parser: OzonParser, fixture: Fixture) -> List[Tuple[str, Callable, object]]:
+    """(функция, вызов, ожидаемый ответ) для страницы"""
+    html = fixture.html
+    expected = fixture.expected
+    rows = [('_detect_antibot', lambda: parser._detect_antibot(html), expected['antibot'])]
+    if fixture.is_antibot:
+        return rows
+    soup = _soup(parser, html)
+    rows += [
+        ('_parse_price', lambda: parser._parse_price(html, soup), expected['price']),
+        ('_parse_name', lambda: parser._parse_name(soup), expected['name']),
+        ('_parse_stock', lambda: parser._parse_stock(html)[0], expected['in_stock']),
+        ('_parse_html', lambda: (parser._parse_html(html) or {}).get('price'), expected['price']),
+    ]
+    return rows
+
+
+def run(fixtures: List[Fixture]) -> Tuple[Dict[str, float], int]:
+    """Замеры {страница:функция: мкс} и число расхождений с ожидаемым"""
+    parser = OzonParser()
+    timings = {}
+    mismatches = 0
+    print(f"{'страница':<24} {'функция':<16} {'мкс/вызов':>11} {'вызовов/с':>11}  ответ")
+    for fixture in fixtures:
+        for name, func, expected in cases(parser, fixture):
+            micros, result = time_call(func)
+            ok = result == expected
+            mismatches += not ok
+            timings[f"{fixture.name}:{name}"] = micros
+            mark = '' if ok else f"  НЕ СОВПАЛО (ожидается {expected!r})"
+            print(f"{fixture.name[:24]:<24} {name:<16} {micros:>11.1f} {1e6 / micros:>11,.0f}  {result!r}{mark}")
+    return timings, mismatches
+
+
+def compare(timings: Dict[str, float], baseline: Dict[str, float], tolerance: float) -> int:
+    """Число замеров, ставших медленнее базовых больше чем на tolerance"""
+    regressions = 0
+    print(f"\nСравнение с базовым прогоном (допуск +{tolerance:.0%}):")
+    for key, micros in timings.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        change = micros / base - 1
+        if change > tolerance:
+            regressions += 1
+            print(f"  {key:<42} {base:>9.1f} -> {micros:>9.1f} мкс  {change:+.0%}  МЕДЛЕННЕЕ")
+    if not regressions:
+        print("  замедлений нет")
+    return regressions
+
+
+def main(argv):
+    if '--help' in argv:
+        print(__doc__)
+        return 0
+    tolerance = float(argv[argv.index('--tolerance') + 1]) if '--tolerance' in argv else TOLERANCE
+
+    timings, mismatches = run(load_corpus())
+    regressions = 0
+    if '--compare' in argv:
+        with open(argv[argv.index('--compare') + 1], 'r') as f:
+            regressions = compare(timings, json.load(f), tolerance)
+    if '--save' in argv:
+        with open(argv[argv.index('--save') + 1], 'w') as f:
+            json.dump(timings, f, indent=2)
+    return 1 if mismatches or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
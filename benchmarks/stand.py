@@ -0,0 +1,200 @@
+"""
+Локальный стенд OZON для нагрузочных прогонов без сети
+
+Сервер отдает страницы корпуса benchmarks/fixtures и работает как
+HTTP-прокси для http://www.ozon.ru: парсер открывает обычные ссылки OZON
+(SKU из ссылки, фильтр запросов и учет прокси работают как в бою),
+а отвечает стенд.
+
+    /                                   главная для warm-up, ставит cookie сессии
+    /product/<slug>-<sku>/              страница товара из корпуса
+    /api/entrypoint-api.bx/page/json/v2 состояния виджетов для быстрого пути
+
+Страница выбирается по SKU из manifest.json, для остальных SKU - по остатку
+от деления среди страниц товаров. Каждый ответ задерживается на latency
+и случайную добавку до jitter. С вероятностью challenge_rate вместо страницы
+отдается страница антибота с cookie проверки; следующий запрос с этой
+cookie (перезагрузка в _bypass_antibot) проходит, а с sticky - нет.
+
+    python -m benchmarks.stand [--port 8088] [--latency 0.2] [--jitter 0.1] [--challenge-rate 0.1] [--sticky]
+    curl -x 127.0.0.1:8088 http://www.ozon.ru/product/1628022641/
+"""
+
+import asyncio
+import json
+import logging
+import random
+import re
+import sys
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import Fixture, load_corpus
+
+STAND_BASE_URL = "http://www.ozon.ru"
+PRODUCT_KINDS = ('product', 'out_of_stock', 'no_price')
+SESSION_COOKIE = 'stand_session'
+CHALLENGE_COOKIE = 'stand_challenge'
+
+logger = logging.getLogger(__name__)
+
+
+def _option(argv: List[str], name: str, default, cast=float):
+    return cast(argv[argv.index(name) + 1]) if name in argv else default
+
+
+def widget_states(fixture: Fixture) -> Dict:
+    """Ответ entrypoint-api по ожидаемым ответам страницы корпуса"""
+    expected = fixture.expected
+    states = {}
+    if expected['price']:
+        price = f"{expected['price']:,.0f}".replace(',', ' ') + ' ₽'
+        states['webPrice-3121879-default-1'] = json.dumps(
+            {'cardPrice': price, 'price': price, 'isAvailable': expected['in_stock']}, ensure_ascii=False
+        )
+    if expected['name']:
+        states['webProductHeading-3385933-default-1'] = json.dumps({'title': expected['name']}, ensure_ascii=False)
+    if not expected['in_stock']:
+        states['webOutOfStock-3829334-default-1'] = json.dumps({}, ensure_ascii=False)
+    return {'widgetStates': states, 'seo': {'title': expected['name'] or ''}}
+
+
+class OzonStand:
+    """Стенд OZON на aiohttp: страницы корпуса, задержка и антибот"""
+
+    def __init__(self, corpus: Optional[List[Fixture]] = None, latency: float = 0.2, jitter: float = 0.1,
+                 challenge_rate: float = 0.0, sticky: bool = False, seed: int = 0):
+        corpus = corpus if corpus is not None else load_corpus()
+        self.products = [f for f in corpus if f.kind in PRODUCT_KINDS]
+        self.by_sku = {f.sku: f for f in self.products if f.sku}
+        self.challenge = next((f for f in corpus if f.kind == 'antibot' and 'fab_chlg_' in f.html), None)
+        self.latency = latency
+        self.jitter = jitter
+        self.challenge_rate = challenge_rate if self.challenge else 0.0
+        self.sticky = sticky
+        self._random = random.Random(seed)
+        self._runner = None
+        self.port: Optional[int] = None
+
+        self.requests = 0
+        self.pages = 0
+        self.api_calls = 0
+        self.challenges = 0
+        self.challenges_passed = 0
+
+    @property
+    def proxy(self) -> str:
+        """Строка прокси для парсера"""
+        return f"127.0.0.1:{self.port}"
+
+    def fixture_for(self, sku: int) -> Fixture:
+        """Страница корпуса для SKU"""
+        return self.by_sku.get(sku) or self.products[sku % len(self.products)]
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/', self._home)
+        app.router.add_get(r'/product/{slug}', self._product)
+        app.router.add_get(r'/product/{slug}/', self._product)
+        app.router.add_get('/api/entrypoint-api.bx/page/json/v2', self._api)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"🧪 Стенд OZON: прокси {self.proxy}, {len(self.products)} страниц товаров")
+
+    async def _delay(self):
+        self.requests += 1
+        await asyncio.sleep(self.latency + self._random.uniform(0, self.jitter))
+
+    def _challenged(self, request) -> bool:
+        """Отдать ли антибот вместо страницы"""
+        if request.cookies.get(CHALLENGE_COOKIE) and not self.sticky:
+            self.challenges_passed += 1
+            return False
+        return self._random.random() < self.challenge_rate
+
+    def _challenge_response(self):
+        from aiohttp import web
+
+        self.challenges += 1
+        response = web.Response(status=403, text=self.challenge.html, content_type='text/html')
+        response.set_cookie(CHALLENGE_COOKIE, '1', max_age=60)
+        return response
+
+    async def _home(self, request):
+        from aiohttp import web
+
+        await self._delay()
+        response = web.Response(text='<html><body><div id="__ozon">OZON</div></body></html>', content_type='text/html')
+        response.set_cookie(SESSION_COOKIE, str(self._random.randint(1, 10**9)), max_age=6 * 3600)
+        return response
+
+    @staticmethod
+    def _sku(path: str) -> int:
+        match = re.search(r'(\d{4,})/?$', path)
+        return int(match.group(1)) if match else 0
+
+    async def _product(self, request):
+        from aiohttp import web
+
+        await self._delay()
+        if self._challenged(request):
+            return self._challenge_response()
+        self.pages += 1
+        response = web.Response(text=self.fixture_for(self._sku(request.path)).html, content_type='text/html')
+        response.del_cookie(CHALLENGE_COOKIE)
+        return response
+
+    async def _api(self, request):
+        from aiohttp import web
+
+        await self._delay()
+        if self._challenged(request):
+            return self._challenge_response()
+        self.api_calls += 1
+        fixture = self.fixture_for(self._sku(request.query.get('url', '')))
+        return web.json_response(widget_states(fixture))
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'pages': self.pages,
+            'api_calls': self.api_calls,
+            'challenges': self.challenges,
+            'challenges_passed': self.challenges_passed,
+        }
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(argv: List[str]):
+    stand = OzonStand(
+        latency=_option(argv, '--latency', 0.2),
+        jitter=_option(argv, '--jitter', 0.1),
+        challenge_rate=_option(argv, '--challenge-rate', 0.0),
+        sticky='--sticky' in argv,
+    )
+    await stand.start(port=_option(argv, '--port', 8088, int))
+    print(f"Стенд OZON: curl -x {stand.proxy} {STAND_BASE_URL}/product/{stand.products[0].sku}/")
+    try:
+        while True:
+            await asyncio.sleep(60)
+            print(f"Запросов: {stand.stats()}")
+    finally:
+        await stand.close()
+
+
+if __name__ == "__main__":
+    if '--help' in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(_serve(sys.argv[1:]))
+    except KeyboardInterrupt:
+        pass
@@ -2,19 +2,30 @@
 Telegram бот для мониторинга цен OZON
 """
 
+# Учет времени импортов - до остальных модулей
+import startup_report
+startup_report.install()
+
 import asyncio
 import logging
-import os
 import re
+from datetime import datetime, timedelta
+from typing import Optional
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, BufferedInputFile
+from aiogram.types import Message, BufferedInputFile, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.enums import ParseMode
-
-from config import BOT_TOKEN, MAX_PRODUCTS_PER_USER, LOG_LEVEL, LOG_FORMAT, PROXY_STORAGE_PATH
-from database import Database
-from parser import OzonParser
-from chart_generator import ChartGenerator
+from aiogram.exceptions import TelegramBadRequest
+
+from config import (BOT_TOKEN, CHECK_INTERVAL, MAX_PRODUCTS_PER_USER, LOG_LEVEL, LOG_FORMAT,
+                    MAX_CHART_RECORDS, CHART_HOURLY_MAX_DAYS, HISTORY_PAGE_SIZE, METRICS_PORT_BOT)
+from database import ROLLUP_PERIODS, database_from_config
+from parser import parser_from_config
+from proxy_registry import proxy_registry_from_config
+from ozon_url import extract_sku
+from chart_generator import ChartQueueFull, chart_renderer_from_config
+from chart_cache import chart_cache_from_config
+from metrics import metrics_server_from_config, register_stats
 
 # Настройка логирования
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
@@ -23,13 +34,15 @@ logger = logging.getLogger(__name__)
 # Инициализация
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
-db = Database("ozon_tracker.db")
-parser = OzonParser()
-chart_gen = ChartGenerator()
+db = database_from_config()
+parser = parser_from_config()
+charts = chart_renderer_from_config()
+chart_cache = chart_cache_from_config()
+metrics = metrics_server_from_config(METRICS_PORT_BOT)
 
-# Загрузка прокси
-if os.path.exists(PROXY_STORAGE_PATH):
-    parser.load_proxies(PROXY_STORAGE_PATH)
+# Прокси: общий с планировщиком реестр в памяти
+proxy_registry = proxy_registry_from_config()
+parser.use_registry(proxy_registry)
 
 
 def _clean_text(text: str) -> str:
@@ -39,50 +52,48 @@ def _clean_text(text: str) -> str:
     return text.replace("\u00a0", " ").replace("\u200b", "").strip()
 
 
-def _normalize_proxy(proxy: str) -> str:
-    """Нормализация формата прокси"""
-    proxy = _clean_text(proxy)
-    if not proxy:
-        return ""
+# Ответ, когда очередь отрисовки графиков заполнена
+CHARTS_BUSY_TEXT = "⏳ Сейчас строится слишком много графиков, попробуйте через минуту"
 
-    # Формат IP:PORT:LOGIN:PASSWORD
-    if re.match(r"^\d{1,3}(\.\d{1,3}){3}:\d{2,5}:.+:.+$", proxy):
-            return proxy
+# Период графика: 7d, 4w, 6m, 1y
+CHART_RANGE_UNITS = {'d': 1, 'w': 7, 'm': 30, 'y': 365}
+# Самый длинный период графика (дни): дальше - переполнение datetime
+CHART_RANGE_MAX_DAYS = 10 * 365
 
-    # Формат IP:PORT
-    if re.match(r"^\d{1,3}(\.\d{1,3}){3}:\d{2,5}$", proxy):
-        return proxy
 
-    # socks5:// или http:// URL
-    if proxy.startswith(("socks5://", "http://", "https://")):
-        return proxy
+def _parse_chart_range(text: str) -> Optional[timedelta]:
+    """Период графика из аргумента команды (None, если формат неверный)"""
+    match = re.fullmatch(r'(\d{1,4})([dwmy])', text.lower())
+    if not match:
+        return None
+    days = int(match.group(1)) * CHART_RANGE_UNITS[match.group(2)]
+    if not 0 < days <= CHART_RANGE_MAX_DAYS:
+        return None
+    return timedelta(days=days)
 
-    return ""
 
+async def _tracked_notice(user_id: int, sku: int) -> Optional[str]:
+    """Текст ответа, если товар с этим SKU уже отслеживается пользователем"""
+    existing = await db.get_user_product_by_sku(user_id, sku)
+    if existing:
+        return f"ℹ️ Товар уже отслеживается (ID {existing['id']})"
+    return None
 
-def _load_proxies() -> list:
-    """Загрузка списка прокси"""
-    if not os.path.exists(PROXY_STORAGE_PATH):
-        return []
-    try:
-        proxies = []
-        with open(PROXY_STORAGE_PATH, "r") as f:
-            for line in f:
-                normalized = _normalize_proxy(line)
-                if normalized:
-                    proxies.append(normalized)
-        return proxies
-    except Exception:
-        return []
-
-
-def _save_proxies(proxies: list) -> None:
-    """Сохранение списка прокси"""
-    os.makedirs(os.path.dirname(PROXY_STORAGE_PATH), exist_ok=True)
-    with open(PROXY_STORAGE_PATH, "w") as f:
-        f.write("\n".join(proxies) + ("\n" if proxies else ""))
-    # Перезагружаем прокси в парсере
-    parser.load_proxies(PROXY_STORAGE_PATH)
+
+async def _get_fresh_catalog_data(sku: int) -> Optional[dict]:
+    """Данные о товаре из каталога, если он проверялся в текущем цикле"""
+    item = await db.get_catalog_item(sku)
+    if not item or not item['last_check'] or item['current_price'] is None:
+        return None
+    age = datetime.now() - datetime.fromisoformat(str(item['last_check']))
+    if age.total_seconds() > CHECK_INTERVAL:
+        return None
+    return {
+        'name': item['product_name'],
+        'price': item['current_price'],
+        'in_stock': bool(item['in_stock']),
+        'stock_quantity': item['stock_quantity'],
+    }
 
 
 @dp.message(CommandStart())
@@ -129,6 +140,7 @@ async def cmd_help(message: Message):
 <b>/history ID</b> — История цен товара
 
 <b>/chart ID</b> — График изменения цены
+Пример за год: <code>/chart 1 1y</code> (также 7d, 4w, 6m)
 
 <b>/proxy_add IP:PORT:LOGIN:PASSWORD</b> — Добавить прокси
 
@@ -137,7 +149,7 @@ async def cmd_help(message: Message):
 <b>/proxy_del №</b> — Удалить прокси по номеру
 
 📊 Лимит товаров: {MAX_PRODUCTS_PER_USER}
-⏱ Проверка цен: каждые 10 минут
+⏱ Проверка цен: от 5 минут до 6 часов — чаще для товаров, цена которых меняется
 """
     await message.answer(help_text, parse_mode=ParseMode.HTML)
 
@@ -148,8 +160,7 @@ async def cmd_add(message: Message):
     text = message.text
     url_match = re.search(r'https?://(?:www\.)?ozon\.ru/\S+', text)
     
-    proxies = _load_proxies()
-    if not proxies:
+    if not proxy_registry.proxies():
         await message.answer(
             "⚠️ Добавьте прокси для стабильной работы:\n"
             "<code>/proxy_add IP:PORT:LOGIN:PASSWORD</code>",
@@ -165,6 +176,13 @@ async def cmd_add(message: Message):
         return
     
     url = url_match.group(0)
+    sku = extract_sku(url)
+    
+    # Один товар OZON - одна подписка, независимо от вида ссылки
+    notice = await _tracked_notice(message.from_user.id, sku) if sku else None
+    if notice:
+        await message.answer(notice)
+        return
     
     # Проверяем лимит
     count = await db.count_user_products(message.from_user.id)
@@ -179,10 +197,28 @@ async def cmd_add(message: Message):
     status_msg = await message.answer("⏳ Получаю данные о товаре...")
     
     try:
-        # Парсим товар в отдельном потоке
-        product_data = await asyncio.get_event_loop().run_in_executor(
-            None, lambda: parser.parse_product(url)
-        )
+        # Свежие данные из общего каталога избавляют от загрузки страницы
+        product_data = await _get_fresh_catalog_data(sku) if sku else None
+        
+        if product_data is None:
+            # Парсим в цикле событий бота - браузеры пула живут между запросами
+            product_data = await parser.parse_product_async(url)
+            
+            if product_data and product_data['price'] is not None and product_data.get('sku'):
+                if not sku:
+                    sku = product_data['sku']
+                    notice = await _tracked_notice(message.from_user.id, sku)
+                    if notice:
+                        await status_msg.edit_text(notice)
+                        return
+                await db.update_catalog_item(
+                    sku,
+                    product_data.get('url') or url,
+                    product_data['price'],
+                    product_data['in_stock'],
+                    product_data['stock_quantity'],
+                    product_data['name']
+                )
         
         if not product_data or product_data['price'] is None:
             await status_msg.edit_text(
@@ -197,7 +233,7 @@ async def cmd_add(message: Message):
             return
         
         # Добавляем в БД
-        product_id = await db.add_product(message.from_user.id, url)
+        product_id = await db.add_product(message.from_user.id, url, sku)
         
         await db.update_product_price(
             product_id,
@@ -217,7 +253,7 @@ async def cmd_add(message: Message):
 💰 Цена: {product_data['price']:.0f} ₽
 {stock_emoji} {product_data['stock_quantity']}
 
-Буду проверять цену каждые 10 минут!
+⏱ Буду проверять цену от 5 минут до 6 часов — чаще, если цена меняется!
 """
         await status_msg.edit_text(response, parse_mode=ParseMode.HTML)
         
@@ -244,21 +280,7 @@ async def cmd_proxy_add(message: Message):
 
     raw = _clean_text(args[1])
     candidates = re.split(r"[\s,;]+", raw.strip())
-    added = []
-
-    proxies = _load_proxies()
-    existing = set(proxies)
-
-    for c in candidates:
-        if not c:
-            continue
-        normalized = _normalize_proxy(c)
-        if normalized and normalized not in existing:
-            proxies.append(normalized)
-            existing.add(normalized)
-            added.append(normalized)
-
-    _save_proxies(proxies)
+    added = proxy_registry.add(candidates)
 
     if added:
         await message.answer(f"✅ Добавлено прокси: {len(added)}")
@@ -269,7 +291,7 @@ async def cmd_proxy_add(message: Message):
 @dp.message(Command("proxy_list"))
 async def cmd_proxy_list(message: Message):
     """Список прокси"""
-    proxies = _load_proxies()
+    proxies = proxy_registry.proxies()
     if not proxies:
         await message.answer("📭 Список прокси пуст. Добавьте: /proxy_add")
         return
@@ -281,7 +303,12 @@ async def cmd_proxy_list(message: Message):
             return f"{parts[0]}:{parts[1]}:{parts[2]}:***"
         return p
 
-    lines = [f"{i+1}. {mask(p)}" for i, p in enumerate(proxies[:20])]
+    # Статистику пишет и планировщик - берем свежую из файла
+    parser.health.reload()
+    lines = [
+        f"{i+1}. {mask(p)}\n    <i>{parser.health.describe(p)}</i>"
+        for i, p in enumerate(proxies[:20])
+    ]
     suffix = f"\n... и ещё {len(proxies) - 20}" if len(proxies) > 20 else ""
     
     await message.answer(
@@ -304,13 +331,11 @@ async def cmd_proxy_del(message: Message):
         await message.answer("❌ Неверный номер")
         return
 
-    proxies = _load_proxies()
-    if idx < 0 or idx >= len(proxies):
+    removed = proxy_registry.remove(idx)
+    if removed is None:
         await message.answer("❌ Неверный номер прокси")
         return
 
-    removed = proxies.pop(idx)
-    _save_proxies(proxies)
     await message.answer(f"✅ Удалено: {removed[:40]}...")
 
 
@@ -382,30 +407,85 @@ async def cmd_history(message: Message):
             await message.answer("❌ Товар не найден")
             return
         
-        history = await db.get_price_history(product_id, limit=30)
+        # Первая страница - самые свежие записи
+        page = await db.get_history_page(product_id, HISTORY_PAGE_SIZE)
         
-        if not history:
+        if not page['items']:
             await message.answer("📭 История пуста")
             return
         
-        response = f"📊 <b>История цен</b>\n📦 {product['product_name']}\n\n"
-        
-        for record in history[-20:]:
-            date = record['checked_at'][:16]
-            price = record['price']
-            stock = "✅" if record['in_stock'] else "❌"
-            response += f"{date} — {price:.0f} ₽ {stock}\n"
-        
-        if len(history) > 20:
-            response += f"\n... и еще {len(history) - 20} записей"
-        
-        response += "\n\n💡 /chart для графика"
-        await message.answer(response, parse_mode=ParseMode.HTML)
+        text, keyboard = _history_page_view(product, page)
+        await message.answer(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
         
     except ValueError:
         await message.answer("❌ Неверный ID")
 
 
+def _history_page_view(product: dict, page: dict) -> tuple:
+    """Текст страницы истории и кнопки перехода к соседним страницам"""
+    response = f"📊 <b>История цен</b>\n📦 {product['product_name']}\n\n"
+    
+    for record in page['items']:
+        # Время в истории - секунды Unix (UTC)
+        date = datetime.utcfromtimestamp(record['checked_at']).strftime('%Y-%m-%d %H:%M')
+        price = record['price']
+        stock = "✅" if record['in_stock'] else "❌"
+        response += f"{date} — {price:.0f} ₽ {stock}"
+        # Запись - интервал без изменений цены и наличия
+        last_seen = datetime.utcfromtimestamp(record['last_seen_at']).strftime('%Y-%m-%d %H:%M')
+        if last_seen != date:
+            response += f" (до {last_seen})"
+        response += "\n"
+    
+    response += "\n💡 /chart для графика"
+    
+    # Курсор в кнопке - checked_at крайней записи страницы
+    items = page['items']
+    buttons = []
+    if page['has_newer']:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Новее", callback_data=f"hist:{product['id']}:n:{items[0]['checked_at']}"
+        ))
+    if page['has_older']:
+        buttons.append(InlineKeyboardButton(
+            text="Старее ➡️", callback_data=f"hist:{product['id']}:o:{items[-1]['checked_at']}"
+        ))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return response, keyboard
+
+
+@dp.callback_query(F.data.startswith("hist:"))
+async def history_page(callback: CallbackQuery):
+    """Листание истории цен кнопками"""
+    try:
+        _, product_id, direction, cursor = callback.data.split(":")
+        product_id, cursor = int(product_id), int(cursor)
+    except ValueError:
+        await callback.answer()
+        return
+    
+    product = await db.get_product(product_id)
+    if not product or product['user_id'] != callback.from_user.id:
+        await callback.answer("❌ Товар не найден")
+        return
+    
+    if direction == "o":
+        page = await db.get_history_page(product_id, HISTORY_PAGE_SIZE, before=cursor)
+    else:
+        page = await db.get_history_page(product_id, HISTORY_PAGE_SIZE, after=cursor)
+    
+    if not page['items']:
+        await callback.answer("📭 Больше записей нет")
+        return
+    
+    text, keyboard = _history_page_view(product, page)
+    try:
+        await callback.message.edit_text(text, parse_mode=ParseMode.HTML, reply_markup=keyboard)
+    except Exception as e:
+        logger.debug(f"Не удалось обновить страницу истории: {e}")
+    await callback.answer()
+
+
 @dp.message(Command("chart"))
 async def cmd_chart(message: Message):
     """Команда /chart"""
@@ -417,27 +497,83 @@ async def cmd_chart(message: Message):
         
         product_id = int(args[1])
         
+        chart_range = None
+        if len(args) > 2:
+            chart_range = _parse_chart_range(args[2])
+            if not chart_range:
+                await message.answer("❌ Период: <code>7d</code>, <code>4w</code>, <code>6m</code>, <code>1y</code> "
+                                     f"(не больше {CHART_RANGE_MAX_DAYS // 365}y)",
+                                     parse_mode=ParseMode.HTML)
+                return
+        
         product = await db.get_product(product_id)
         if not product or product['user_id'] != message.from_user.id:
             await message.answer("❌ Товар не найден")
             return
         
-        history = await db.get_price_history(product_id)
-        
-        if len(history) < 2:
-            await message.answer("❌ Недостаточно данных (нужно минимум 2 проверки)")
-            return
+        caption = f"📊 {product['product_name'][:100]}"
+        if chart_range:
+            # Длинный период - по часовым или дневным агрегатам, а не по всей истории
+            period = 'hour' if chart_range.days <= CHART_HOURLY_MAX_DAYS else 'day'
+            since = datetime.utcnow() - chart_range
+            options = (product['product_name'], period, args[2].lower(), since.strftime(ROLLUP_PERIODS[period][1]))
+        else:
+            options = (product['product_name'], MAX_CHART_RECORDS)
         
-        status_msg = await message.answer("📊 Создаю график...")
+        # История не менялась с прошлого графика - отправляем готовый
+        cache_key = chart_cache.key(product_id, await db.get_history_version(product_id), *options)
+        file_id = chart_cache.get_file_id(cache_key)
+        if file_id:
+            try:
+                await message.answer_photo(file_id, caption=caption)
+                return
+            except TelegramBadRequest as e:
+                logger.debug(f"file_id графика не принят: {e}")
+                chart_cache.forget_file_id(cache_key)
         
-        chart_buffer = chart_gen.generate_price_chart(history, product['product_name'])
+        png = chart_cache.get_png(cache_key)
+        status_msg = None
+        if png is None:
+            if charts.is_busy():
+                await message.answer(CHARTS_BUSY_TEXT)
+                return
+            
+            if chart_range:
+                rollups = await db.get_price_rollups(product_id, period, since)
+                if len(rollups) < 2:
+                    await message.answer("❌ Недостаточно данных за этот период")
+                    return
+                
+                status_msg = await message.answer("📊 Создаю график...")
+                render = charts.rollup_chart(rollups, product['product_name'], args[2].lower())
+            else:
+                # Последних MAX_CHART_RECORDS интервалов хватает на столько же проверок
+                history = await db.get_recent_price_history(product_id, MAX_CHART_RECORDS)
+                
+                # Запись истории - интервал из нескольких проверок с одной ценой
+                if sum(record['checks'] or 1 for record in history) < 2:
+                    await message.answer("❌ Недостаточно данных (нужно минимум 2 проверки)")
+                    return
+                
+                status_msg = await message.answer("📊 Создаю график...")
+                render = charts.price_chart(history, product['product_name'])
+            
+            try:
+                chart_buffer = await render
+            except ChartQueueFull:
+                # Очередь заполнилась, пока читалась история
+                await status_msg.edit_text(CHARTS_BUSY_TEXT)
+                return
+            if not chart_buffer:
+                await status_msg.edit_text("❌ Ошибка создания графика")
+                return
+            png = chart_buffer.read()
+            chart_cache.put_png(cache_key, png)
         
-        if chart_buffer:
-            photo = BufferedInputFile(chart_buffer.read(), filename="chart.png")
-            await message.answer_photo(photo, caption=f"📊 {product['product_name'][:100]}")
+        sent = await message.answer_photo(BufferedInputFile(png, filename="chart.png"), caption=caption)
+        chart_cache.set_file_id(cache_key, sent.photo[-1].file_id)
+        if status_msg:
             await status_msg.delete()
-        else:
-            await status_msg.edit_text("❌ Ошибка создания графика")
         
     except ValueError:
         await message.answer("❌ Неверный ID")
@@ -452,10 +588,26 @@ async def handle_url(message: Message):
 
 async def main():
     """Запуск бота"""
+    # Процессы графиков создаются fork до открытия соединений с БД
+    charts.start()
     await db.init_db()
     logger.info("✅ База данных инициализирована")
+    if metrics:
+        register_stats('ozon_browser_pool', 'Пул браузеров', parser.pool.stats)
+        register_stats('ozon_db_pool', 'Соединения с БД', db.stats)
+        register_stats('ozon_chart_renderer', 'Отрисовка графиков', charts.stats)
+        register_stats('ozon_chart_cache', 'Кэш графиков', chart_cache.stats)
+        await metrics.start()
     logger.info("🚀 Бот запущен!")
-    await dp.start_polling(bot)
+    startup_report.report(logger, "Бот готов принимать команды")
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await parser.close()
+        await db.close()
+        charts.close()
+        if metrics:
+            await metrics.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,396 @@
+"""
+Пул долгоживущих браузеров Playwright для парсера OZON
+
+Браузеры запускаются один раз и живут между проверками. На каждый прокси
+создается один контекст, страницы выдаются в аренду на время проверки
+и возвращаются обратно. Контексты пересоздаются по числу выданных страниц
+или по возрасту.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from metrics import STAGE_SECONDS
+from request_filter import RequestFilter
+from session_store import SessionStore
+
+# Настройки по умолчанию
+HEADLESS_MODE = True
+PARSER_TIMEOUT = 30000  # миллисекунды
+POOL_BROWSERS = 1
+CONTEXT_MAX_PAGES = 50
+CONTEXT_MAX_AGE = 1800  # секунды
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+STEALTH_SCRIPT = """
+    // Удаляем navigator.webdriver
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => undefined
+    });
+
+    // Добавляем window.chrome
+    window.chrome = {
+        runtime: {},
+        loadTimes: function() {},
+        csi: function() {},
+        app: {}
+    };
+
+    // Настраиваем plugins
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5]
+    });
+
+    // Настраиваем languages
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['ru-RU', 'ru', 'en-US', 'en']
+    });
+
+    // Маскируем permissions
+    const originalQuery = window.navigator.permissions.query;
+    window.navigator.permissions.query = (parameters) => (
+        parameters.name === 'notifications' ?
+            Promise.resolve({ state: Notification.permission }) :
+            originalQuery(parameters)
+    );
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def build_proxy_config(proxy: Optional[str]) -> Optional[Dict]:
+    """Преобразование строки прокси в настройки Playwright"""
+    if not proxy:
+        return None
+
+    # Формат: IP:PORT:LOGIN:PASSWORD или socks5://...
+    if proxy.startswith("socks5://") or proxy.startswith("http://"):
+        return {"server": proxy}
+
+    parts = proxy.split(":")
+    if len(parts) >= 4:
+        ip, port, login, password = parts[0], parts[1], parts[2], ":".join(parts[3:])
+        return {
+            "server": f"http://{ip}:{port}",
+            "username": login,
+            "password": password
+        }
+    if len(parts) == 2:
+        return {"server": f"http://{proxy}"}
+    return None
+
+
+class _ContextSlot:
+    """Контекст браузера, закрепленный за одним прокси"""
+
+    def __init__(self, proxy: Optional[str], browser, context, warm: bool = False):
+        self.proxy = proxy
+        self.browser = browser
+        self.context = context
+        # Сессия OZON уже установлена (восстановлена из файла или после warm-up)
+        self.warm = warm
+        self.created_at = time.monotonic()
+        self.pages_served = 0
+        self.in_use = 0
+        self.idle_pages: List = []
+        self.retired = False
+
+    def is_expired(self, max_pages: int, max_age: float) -> bool:
+        if self.retired or not self.browser.is_connected():
+            return True
+        if max_pages and self.pages_served >= max_pages:
+            return True
+        return bool(max_age) and time.monotonic() - self.created_at >= max_age
+
+
+class BrowserPool:
+    """Пул браузеров с одним контекстом на прокси и арендой страниц"""
+
+    def __init__(self, headless: bool = HEADLESS_MODE, timeout: int = PARSER_TIMEOUT,
+                 browsers: int = POOL_BROWSERS, max_pages: int = CONTEXT_MAX_PAGES,
+                 max_age: float = CONTEXT_MAX_AGE, sessions: Optional[SessionStore] = None,
+                 request_filter: Optional[RequestFilter] = None):
+        self.headless = headless
+        self.timeout = timeout
+        self.browsers_count = max(1, browsers)
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.sessions = sessions
+        self.request_filter = request_filter
+
+        self._playwright = None
+        self._browsers: List = []
+        self._browser_index = 0
+        self._slots: Dict[Optional[str], _ContextSlot] = {}
+        self._page_slots: Dict = {}
+        self._lock = asyncio.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.launches = 0
+        self.recycled = 0
+        self.leases = 0
+
+    async def _launch_browser(self):
+        """Запуск браузера с параметрами для обхода детекции"""
+        with STAGE_SECONDS.time(stage='browser_launch'):
+            browser = await self._playwright.chromium.launch(
+                headless=self.headless,
+                args=[
+                    '--no-sandbox',
+                    '--disable-dev-shm-usage',
+                    '--disable-blink-features=AutomationControlled',
+                    '--disable-features=IsolateOrigins,site-per-process',
+                ]
+            )
+        self.launches += 1
+        logger.info(f"✅ Браузер Playwright запущен (запусков: {self.launches})")
+        return browser
+
+    async def _get_browser(self):
+        """Браузер для нового контекста (по кругу, с перезапуском упавших)"""
+        if self._playwright is None:
+            from playwright.async_api import async_playwright
+            self._playwright = await async_playwright().start()
+
+        self._browsers = [b for b in self._browsers if b.is_connected()]
+        if len(self._browsers) < self.browsers_count:
+            browser = await self._launch_browser()
+            self._browsers.append(browser)
+            return browser
+
+        browser = self._browsers[self._browser_index % len(self._browsers)]
+        self._browser_index += 1
+        return browser
+
+    async def _new_context(self, browser, proxy: Optional[str], storage_state: Optional[str] = None):
+        """Создание контекста с маскировкой"""
+        proxy_config = build_proxy_config(proxy)
+        if proxy_config:
+            logger.info(f"🌐 Используется прокси: {proxy[:40]}...")
+        if storage_state:
+            logger.info("🍪 Восстановлена сохраненная сессия")
+
+        context = await browser.new_context(
+            viewport={"width": 1920, "height": 1080},
+            user_agent=USER_AGENT,
+            locale="ru-RU",
+            timezone_id="Europe/Moscow",
+            proxy=proxy_config,
+            storage_state=storage_state,
+            java_script_enabled=True,
+            bypass_csp=True,
+            ignore_https_errors=True,
+            extra_http_headers={
+                "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
+                "Accept-Encoding": "gzip, deflate, br",
+                "Connection": "keep-alive",
+                "Upgrade-Insecure-Requests": "1",
+                "Sec-Fetch-Dest": "document",
+                "Sec-Fetch-Mode": "navigate",
+                "Sec-Fetch-Site": "none",
+                "Sec-Fetch-User": "?1",
+                "Cache-Control": "max-age=0",
+            }
+        )
+
+        # Скрипты для маскировки автоматизации
+        await context.add_init_script(STEALTH_SCRIPT)
+        if self.request_filter:
+            await self.request_filter.attach(context)
+        return context
+
+    async def _close_slot(self, slot: _ContextSlot):
+        """Закрытие контекста вместе со всеми страницами"""
+        # Свежие cookies рабочего контекста пригодятся следующему
+        if self.sessions and slot.warm and slot.browser.is_connected():
+            await self.sessions.save(slot.proxy, slot.context)
+        for page in slot.idle_pages:
+            self._forget_page(page)
+        slot.idle_pages = []
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+
+    async def _acquire(self, proxy: Optional[str]):
+        """Выдача страницы из контекста прокси"""
+        async with self._lock:
+            slot = self._slots.get(proxy)
+            if slot and slot.is_expired(self.max_pages, self.max_age):
+                del self._slots[proxy]
+                slot.retired = True
+                self.recycled += 1
+                if slot.in_use == 0:
+                    await self._close_slot(slot)
+                slot = None
+
+            if slot:
+                self.hits += 1
+            else:
+                self.misses += 1
+                browser = await self._get_browser()
+                storage_state = self.sessions.load_path(proxy) if self.sessions else None
+                with STAGE_SECONDS.time(stage='new_context'):
+                    context = await self._new_context(browser, proxy, storage_state)
+                slot = _ContextSlot(proxy, browser, context, warm=bool(storage_state))
+                self._slots[proxy] = slot
+
+            slot.pages_served += 1
+            slot.in_use += 1
+            self.leases += 1
+
+            page = slot.idle_pages.pop() if slot.idle_pages else None
+
+        if page is None or page.is_closed():
+            try:
+                page = await slot.context.new_page()
+            except Exception:
+                # Контекст закрыт или браузер упал: резерв снимается, слот больше не выдается
+                slot.in_use -= 1
+                slot.retired = True
+                raise
+            page.set_default_timeout(self.timeout)
+            page.set_default_navigation_timeout(self.timeout)
+        self._page_slots[page] = slot
+        if self.request_filter:
+            self.request_filter.reset(page)
+        return page
+
+    async def _release(self, page, broken: bool = False):
+        """Возврат страницы в пул"""
+        slot = self._page_slots.get(page)
+        if slot is None:
+            return
+        slot.in_use -= 1
+        if broken:
+            slot.retired = True
+
+        if slot.retired:
+            self._forget_page(page)
+            if slot.in_use == 0:
+                if self._slots.get(slot.proxy) is slot:
+                    del self._slots[slot.proxy]
+                await self._close_slot(slot)
+        elif not page.is_closed():
+            slot.idle_pages.append(page)
+        else:
+            self._forget_page(page)
+
+    def _forget_page(self, page):
+        """Страница больше не принадлежит пулу"""
+        self._page_slots.pop(page, None)
+        if self.request_filter:
+            self.request_filter.forget(page)
+
+    @asynccontextmanager
+    async def lease(self, proxy: Optional[str] = None):
+        """Аренда страницы: async with pool.lease(proxy) as page"""
+        page = await self._acquire(proxy)
+        broken = False
+        try:
+            yield page
+        except BaseException:
+            broken = True
+            raise
+        finally:
+            await self._release(page, broken=broken)
+
+    def discard(self, page):
+        """Пометить контекст страницы как испорченный (антибот, бан прокси)"""
+        slot = self._page_slots.get(page)
+        if slot:
+            slot.retired = True
+            self.flag_session(page)
+
+    def needs_warm_up(self, page) -> bool:
+        """Нужен ли warm-up: у контекста нет действующей сессии OZON"""
+        slot = self._page_slots.get(page)
+        return not (slot and slot.warm)
+
+    def flag_session(self, page):
+        """Сессия контекста замечена антиботом - сбросить ее"""
+        slot = self._page_slots.get(page)
+        if slot:
+            slot.warm = False
+            if self.sessions:
+                self.sessions.invalidate(slot.proxy)
+
+    async def save_session(self, page):
+        """Сессия контекста установлена (warm-up или антибот пройден)"""
+        slot = self._page_slots.get(page)
+        if slot:
+            slot.warm = True
+            if self.sessions:
+                await self.sessions.save(slot.proxy, slot.context)
+
+    def traffic(self, page) -> Optional[Dict]:
+        """Трафик страницы за текущую аренду (None без фильтрации запросов)"""
+        if not self.request_filter:
+            return None
+        return self.request_filter.page_stats(page)
+
+    def stats(self) -> Dict:
+        """Счетчики пула"""
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'launches': self.launches,
+            'recycled': self.recycled,
+            'leases': self.leases,
+            'contexts': len(self._slots),
+            'browsers': len(self._browsers),
+        }
+        if self.request_filter:
+            stats['blocked_requests'] = self.request_filter.total_blocked
+            stats['saved_bytes'] = self.request_filter.total_saved_bytes
+        return stats
+
+    async def close(self):
+        """Закрытие всех контекстов и браузеров"""
+        async with self._lock:
+            for slot in list(self._slots.values()):
+                await self._close_slot(slot)
+            self._slots = {}
+            self._page_slots = {}
+            for browser in self._browsers:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+            self._browsers = []
+            if self._playwright:
+                try:
+                    await self._playwright.stop()
+                except Exception:
+                    pass
+                self._playwright = None
+        # Пул может быть снова запущен уже в другом цикле событий
+        self._lock = asyncio.Lock()
+
+
+def pool_from_config() -> BrowserPool:
+    """Пул с настройками из config.py (общий для бота и планировщика)"""
+    import config
+
+    request_filter = None
+    if config.REQUEST_FILTER_ENABLED:
+        request_filter = RequestFilter(
+            block_types=config.BLOCK_RESOURCE_TYPES,
+            block_third_party=config.BLOCK_THIRD_PARTY,
+            allow_domains=config.ALLOW_DOMAINS,
+        )
+    return BrowserPool(
+        headless=config.HEADLESS_MODE,
+        timeout=config.PARSER_TIMEOUT * 1000,
+        browsers=config.BROWSER_POOL_SIZE,
+        max_pages=config.CONTEXT_MAX_PAGES,
+        max_age=config.CONTEXT_MAX_AGE,
+        sessions=SessionStore(config.SESSIONS_DIR, max_age=config.SESSION_MAX_AGE),
+        request_filter=request_filter,
+    )
@@ -0,0 +1,173 @@
+"""
+Кэш готовых графиков цен
+
+Ключ графика - товар, версия его истории (последняя запись и число проверок
+в ней) и параметры графика. Пока история товара не изменилась, повторный
+/chart отдает готовый PNG с диска без отрисовки, а после первой отправки -
+file_id Telegram без повторной загрузки. Файлы лежат под RUNTIME_DIR,
+давно не запрошенные вытесняются по числу и общему размеру.
+"""
+
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Настройки по умолчанию
+MAX_ENTRIES = 500
+MAX_BYTES = 100 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(*parts) -> str:
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:12]
+
+
+class ChartCache:
+    """PNG графиков и их file_id Telegram на диске с вытеснением LRU"""
+
+    def __init__(self, directory: str, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # Ключ -> размер PNG, от давно запрошенных к недавним
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+
+        self.file_id_hits = 0
+        self.png_hits = 0
+        self.misses = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Индекс по файлам, оставшимся с прошлого запуска"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.png'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+            self._bytes += size
+        self._evict()
+
+    @staticmethod
+    def key(product_id: int, version, *options) -> str:
+        """Ключ графика: товар, версия истории и параметры (период, название)"""
+        return f"{product_id}-{_digest(*options)}-{_digest(version)}"
+
+    def _path(self, key: str, suffix: str = '.png') -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    def _touch(self, key: str):
+        self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key))
+        except OSError:
+            pass
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        """file_id уже отправленного графика"""
+        if key not in self._entries:
+            return None
+        try:
+            with open(self._path(key, '.file_id'), 'r') as f:
+                file_id = f.read().strip()
+        except OSError:
+            return None
+        if file_id:
+            self.file_id_hits += 1
+            self._touch(key)
+        return file_id or None
+
+    def get_png(self, key: str) -> Optional[bytes]:
+        """Готовый PNG графика"""
+        if key in self._entries:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                self._drop(key)
+            else:
+                self.png_hits += 1
+                self._touch(key)
+                return data
+        self.misses += 1
+        return None
+
+    def put_png(self, key: str, data: bytes):
+        """Сохранение PNG; графики прежних версий истории того же вида удаляются"""
+        prefix = key.rsplit('-', 1)[0] + '-'
+        for old in [k for k in self._entries if k.startswith(prefix) and k != key]:
+            self._drop(old)
+
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.debug(f"Не удалось сохранить график в кэш: {e}")
+            return
+        self._bytes += len(data) - self._entries.pop(key, 0)
+        self._entries[key] = len(data)
+        self._evict()
+
+    def set_file_id(self, key: str, file_id: str):
+        """Запоминание file_id после первой отправки графика"""
+        if key not in self._entries:
+            return
+        try:
+            with open(self._path(key, '.file_id'), 'w') as f:
+                f.write(file_id)
+        except OSError as e:
+            logger.debug(f"Не удалось сохранить file_id графика: {e}")
+
+    def forget_file_id(self, key: str):
+        """file_id больше не принимается Telegram - следующая отправка загрузит PNG"""
+        try:
+            os.remove(self._path(key, '.file_id'))
+        except OSError:
+            pass
+
+    def _drop(self, key: str):
+        self._bytes -= self._entries.pop(key, 0)
+        for suffix in ('.png', '.file_id'):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def stats(self) -> Dict:
+        """Статистика кэша"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'file_id_hits': self.file_id_hits,
+            'png_hits': self.png_hits,
+            'misses': self.misses,
+        }
+
+
+def chart_cache_from_config() -> ChartCache:
+    """Кэш графиков с настройками из config.py"""
+    import config
+
+    return ChartCache(
+        config.CHART_CACHE_DIR,
+        max_entries=config.CHART_CACHE_MAX_ENTRIES,
+        max_bytes=config.CHART_CACHE_MAX_MB * 1024 * 1024,
+    )
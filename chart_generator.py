@@ -10,20 +10,91 @@ MPLCONFIGDIR = getattr(cfg, "MPLCONFIGDIR", f"{RUNTIME_DIR}/mpl")
 os.makedirs(MPLCONFIGDIR, exist_ok=True)
 os.environ.setdefault("MPLCONFIGDIR", MPLCONFIGDIR)
 
-import matplotlib
-matplotlib.use('Agg')  # Backend без GUI для серверов
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+import asyncio
 import io
 import logging
+import multiprocessing
+import time
 
 from config import CHART_SIZE, CHART_DPI, MAX_CHART_RECORDS
 
+# Настройки пула по умолчанию
+RENDER_WORKERS = 2
+RENDER_QUEUE_SIZE = 8  # запросов сверх занятых процессов, остальные отклоняются
+
 logger = logging.getLogger(__name__)
 
 
+def _matplotlib():
+    """Модули matplotlib (импорт около полусекунды - только при первой отрисовке)"""
+    import matplotlib
+    matplotlib.use('Agg')  # Backend без GUI для серверов
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    import matplotlib.dates as mdates
+    return Figure, FigureCanvasAgg, mdates
+
+
+def _dates(timestamps: list):
+    """Массив datetime64 из секунд Unix - одним преобразованием, без разбора строк"""
+    import numpy as np  # загружается вместе с matplotlib
+    
+    return (np.asarray(timestamps, dtype='float64') * 1e6).astype('int64').astype('datetime64[us]')
+
+
+def last_checks(price_history: List[Dict], limit: int) -> List[Dict]:
+    """Интервалы истории, покрывающие последние limit проверок
+    
+    Начало самого раннего интервала сдвигается пропорционально отброшенным
+    проверкам (проверки внутри интервала считаются равномерными).
+    """
+    result = []
+    total = 0
+    for record in reversed(price_history):
+        checks = record.get('checks') or 1
+        if total + checks > limit:
+            need = limit - total
+            if need > 0:
+                start = record['checked_at']
+                end = record.get('last_seen_at') or start
+                start = end - (end - start) * (need - 1) / (checks - 1)
+                result.append(dict(record, checked_at=start, checks=need))
+            break
+        result.append(record)
+        total += checks
+    return result[::-1]
+
+
+def history_points(price_history: List[Dict]) -> Tuple[list, list, list]:
+    """Точки графика из интервалов истории: начало и конец каждого интервала
+    
+    checked_at и last_seen_at - секунды Unix. Возвращает даты (datetime64),
+    цены и веса точек (число проверок) - средняя цена считается так же, как
+    по отдельным проверкам.
+    """
+    times, prices, weights = [], [], []
+    for record in price_history:
+        if record['price'] is None:
+            continue
+        start = record['checked_at']
+        end = record.get('last_seen_at') or start
+        checks = record.get('checks') or 1
+        times.append(start)
+        prices.append(record['price'])
+        if end > start and checks > 1:
+            # Вес делится между началом и концом интервала
+            weights.append(1)
+            times.append(end)
+            prices.append(record['price'])
+            weights.append(checks - 1)
+        else:
+            weights.append(checks)
+    return _dates(times), prices, weights
+
+
 class ChartGenerator:
     """Генератор графиков изменения цен"""
     
@@ -41,120 +112,292 @@ class ChartGenerator:
             None: Если данных недостаточно
         """
         try:
-            if not price_history or len(price_history) < 2:
+            if not price_history or sum(r.get('checks') or 1 for r in price_history) < 2:
                 logger.warning("Недостаточно данных для построения графика")
                 return None
             
-            # Ограничиваем количество записей
-            if len(price_history) > MAX_CHART_RECORDS:
-                price_history = price_history[-MAX_CHART_RECORDS:]
+            # Ограничиваем количество проверок
+            price_history = last_checks(price_history, MAX_CHART_RECORDS)
             
-            # Подготовка данных
-            dates = []
-            prices = []
+            # Подготовка данных: интервалы истории -> точки
+            dates, prices, weights = history_points(price_history)
             
-            for record in price_history:
-                if record['price'] is not None:
-                    try:
-                        # Парсим дату
-                        date_str = record['checked_at']
-                        if '.' in date_str:
-                            date_obj = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S.%f')
-                        else:
-                            date_obj = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                        
-                        dates.append(date_obj)
-                        prices.append(record['price'])
-                    except Exception as e:
-                        logger.error(f"Ошибка парсинга даты: {e}")
-                        continue
-            
-            if len(prices) < 2:
+            if sum(weights) < 2 or len(prices) < 2:
                 logger.warning("Недостаточно валидных данных для графика")
                 return None
             
-            # Создание графика
-            plt.figure(figsize=CHART_SIZE)
-            plt.plot(dates, prices, marker='o', linestyle='-', linewidth=2, 
-                    markersize=6, color='#2E86DE', markerfacecolor='#54A0FF')
-            
-            # Настройка заголовка
-            title = f'История изменения цены\n{product_name[:60]}'
-            if len(product_name) > 60:
-                title += '...'
-            plt.title(title, fontsize=14, fontweight='bold', pad=20)
-            
-            # Подписи осей
-            plt.xlabel('Дата и время', fontsize=12)
-            plt.ylabel('Цена (₽)', fontsize=12)
-            
-            # Сетка
-            plt.grid(True, alpha=0.3, linestyle='--')
-            
-            # Форматирование оси X (даты)
-            plt.gcf().autofmt_xdate()
-            if len(dates) > 20:
-                date_format = mdates.DateFormatter('%d.%m')
-            else:
-                date_format = mdates.DateFormatter('%d.%m %H:%M')
-            plt.gca().xaxis.set_major_formatter(date_format)
+            return ChartGenerator._render(dates, prices, product_name, weights=weights)
             
-            # Добавление значений на точки (не для всех, если их много)
-            step = max(1, len(dates) // 10)  # Показываем максимум 10 значений
-            for i in range(0, len(dates), step):
-                plt.annotate(f'{prices[i]:.0f}₽', 
-                           (dates[i], prices[i]),
-                           textcoords="offset points",
-                           xytext=(0, 10),
-                           ha='center',
-                           fontsize=9,
-                           bbox=dict(boxstyle='round,pad=0.3', 
-                                   facecolor='yellow', 
-                                   alpha=0.7))
-            
-            # Расчет статистики
-            min_price = min(prices)
-            max_price = max(prices)
-            avg_price = sum(prices) / len(prices)
-            current_price = prices[-1]
+        except Exception as e:
+            logger.error(f"Ошибка при создании графика: {e}", exc_info=True)
+            return None
+    
+    @staticmethod
+    def generate_rollup_chart(rollups: List[Dict], product_name: str, range_label: str) -> Optional[io.BytesIO]:
+        """
+        Генерация графика за длинный период по часовым или дневным агрегатам
+        
+        Args:
+            rollups: Агрегаты цены (bucket в секундах Unix, open, high, low, close, price_sum, checks)
+            product_name: Название товара
+            range_label: Подпись периода (например, "30d")
             
-            # Изменение цены
-            if len(prices) > 1:
-                price_change = current_price - prices[0]
-                price_change_percent = (price_change / prices[0]) * 100
-                change_symbol = '📉' if price_change < 0 else ('📈' if price_change > 0 else '➡️')
-            else:
-                price_change = 0
-                price_change_percent = 0
-                change_symbol = '➡️'
+        Returns:
+            BytesIO: Буфер с изображением графика
+            None: Если данных недостаточно
+        """
+        try:
+            rollups = [r for r in rollups if r['close'] is not None]
+            if len(rollups) < 2:
+                logger.warning("Недостаточно данных для построения графика")
+                return None
             
-            # Статистика внизу
-            stats_text = (
-                f'Текущая: {current_price:.0f}₽ {change_symbol} '
-                f'| Мин: {min_price:.0f}₽ | Макс: {max_price:.0f}₽ '
-                f'| Средняя: {avg_price:.0f}₽ | Изменение: {price_change:+.0f}₽ ({price_change_percent:+.1f}%)'
+            # Линия по ценам закрытия, полоса - от минимума до максимума корзины
+            dates = _dates([r['bucket'] for r in rollups])
+            return ChartGenerator._render(
+                dates,
+                [r['close'] for r in rollups],
+                product_name,
+                lows=[r['low'] for r in rollups],
+                highs=[r['high'] for r in rollups],
+                opening=rollups[0]['open'],
+                average=sum(r['price_sum'] for r in rollups) / sum(r['checks'] for r in rollups),
+                title_suffix=f' за {range_label}',
             )
             
-            plt.figtext(0.5, 0.02, stats_text, ha='center', fontsize=10,
-                       bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.7))
-            
-            # Отступы
-            plt.tight_layout()
-            plt.subplots_adjust(bottom=0.15)
-            
-            # Сохранение в буфер
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png', dpi=CHART_DPI, bbox_inches='tight')
-            buf.seek(0)
-            plt.close()
-            
-            logger.info(f"График успешно создан ({len(prices)} точек)")
-            return buf
-            
         except Exception as e:
             logger.error(f"Ошибка при создании графика: {e}", exc_info=True)
-            plt.close()
             return None
+    
+    @staticmethod
+    def _render(dates: list, prices: list, product_name: str, weights: list = None,
+                lows: list = None, highs: list = None, opening: float = None,
+                average: float = None, title_suffix: str = '') -> io.BytesIO:
+        """Отрисовка графика цены со статистикой
+        
+        Рисует на собственном объекте Figure без глобального состояния pyplot,
+        поэтому несколько графиков можно строить параллельно.
+        """
+        Figure, FigureCanvasAgg, mdates = _matplotlib()
+        
+        # Создание графика
+        fig = Figure(figsize=CHART_SIZE)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        if lows and highs:
+            ax.fill_between(dates, lows, highs, color='#54A0FF', alpha=0.25, linewidth=0)
+            ax.plot(dates, prices, linestyle='-', linewidth=2, color='#2E86DE')
+        else:
+            ax.plot(dates, prices, marker='o', linestyle='-', linewidth=2, 
+                    markersize=6, color='#2E86DE', markerfacecolor='#54A0FF')
+        
+        # Настройка заголовка
+        title = f'История изменения цены{title_suffix}\n{product_name[:60]}'
+        if len(product_name) > 60:
+            title += '...'
+        ax.set_title(title, fontsize=14, fontweight='bold', pad=20)
+        
+        # Подписи осей
+        ax.set_xlabel('Дата и время', fontsize=12)
+        ax.set_ylabel('Цена (₽)', fontsize=12)
+        
+        # Сетка
+        ax.grid(True, alpha=0.3, linestyle='--')
+        
+        # Форматирование оси X (даты)
+        fig.autofmt_xdate()
+        if len(dates) > 20:
+            date_format = mdates.DateFormatter('%d.%m')
+        else:
+            date_format = mdates.DateFormatter('%d.%m %H:%M')
+        ax.xaxis.set_major_formatter(date_format)
+        
+        # Добавление значений на точки (не для всех, если их много)
+        step = max(1, len(dates) // 10)  # Показываем максимум 10 значений
+        for i in range(0, len(dates), step):
+            ax.annotate(f'{prices[i]:.0f}₽', 
+                       (dates[i], prices[i]),
+                       textcoords="offset points",
+                       xytext=(0, 10),
+                       ha='center',
+                       fontsize=9,
+                       bbox=dict(boxstyle='round,pad=0.3', 
+                               facecolor='yellow', 
+                               alpha=0.7))
+        
+        # Расчет статистики
+        min_price = min(lows or prices)
+        max_price = max(highs or prices)
+        if average is None:
+            weights = weights or [1] * len(prices)
+            average = sum(p * w for p, w in zip(prices, weights)) / sum(weights)
+        avg_price = average
+        current_price = prices[-1]
+        first_price = prices[0] if opening is None else opening
+        
+        # Изменение цены
+        if len(prices) > 1:
+            price_change = current_price - first_price
+            price_change_percent = (price_change / first_price) * 100
+            change_symbol = '📉' if price_change < 0 else ('📈' if price_change > 0 else '➡️')
+        else:
+            price_change = 0
+            price_change_percent = 0
+            change_symbol = '➡️'
+        
+        # Статистика внизу
+        stats_text = (
+            f'Текущая: {current_price:.0f}₽ {change_symbol} '
+            f'| Мин: {min_price:.0f}₽ | Макс: {max_price:.0f}₽ '
+            f'| Средняя: {avg_price:.0f}₽ | Изменение: {price_change:+.0f}₽ ({price_change_percent:+.1f}%)'
+        )
+        
+        fig.text(0.5, 0.02, stats_text, ha='center', fontsize=10,
+                 bbox=dict(boxstyle='round', facecolor='wheat', alpha=0.7))
+        
+        # Отступы
+        fig.tight_layout()
+        fig.subplots_adjust(bottom=0.15)
+        
+        # Сохранение в буфер
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=CHART_DPI, bbox_inches='tight')
+        buf.seek(0)
+        
+        logger.info(f"График успешно создан ({len(prices)} точек)")
+        return buf
+
+
+def _price_chart_png(price_history: List[Dict], product_name: str) -> Optional[bytes]:
+    """PNG графика по истории цен (выполняется в процессе пула)"""
+    buf = ChartGenerator.generate_price_chart(price_history, product_name)
+    return buf.getvalue() if buf else None
+
+
+def _rollup_chart_png(rollups: List[Dict], product_name: str, range_label: str) -> Optional[bytes]:
+    """PNG графика по агрегатам (выполняется в процессе пула)"""
+    buf = ChartGenerator.generate_rollup_chart(rollups, product_name, range_label)
+    return buf.getvalue() if buf else None
+
+
+def _timed(func, *args):
+    """Результат функции и время ее выполнения в процессе пула"""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+def _warm_up() -> int:
+    """Первая отрисовка в процессе: загрузка шрифтов и модулей matplotlib"""
+    buf = ChartGenerator._render([datetime(2026, 1, 1), datetime(2026, 1, 2)], [1000, 1100], 'warm-up')
+    return len(buf.getvalue())
+
+
+class ChartQueueFull(Exception):
+    """Очередь отрисовки заполнена - запрос отклонен, а не провален"""
+
+
+class ChartRenderer:
+    """Отрисовка графиков в пуле процессов вне цикла событий бота
+    
+    Одновременно рисуется не больше workers графиков, еще queue_size запросов
+    ждут очереди, остальные сразу отклоняются (is_busy, ChartQueueFull) - всплеск
+    /chart не копит бесконечную очередь и не задерживает другие команды.
+    """
+    
+    def __init__(self, workers: int = RENDER_WORKERS, queue_size: int = RENDER_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        
+        self.renders = 0
+        self.rejected = 0
+        self.render_total = 0.0
+        self.render_max = 0.0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    def start(self):
+        """Запуск процессов пула
+        
+        Процессы создаются fork сразу все при первой задаче, поэтому пул
+        запускается до открытия соединений с БД и сетевых сессий.
+        matplotlib импортируют сами процессы при прогреве - бот его не загружает.
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+            for _ in range(self.workers):
+                self._executor.submit(_warm_up)
+            logger.info(f"📊 Пул отрисовки графиков: {self.workers} процесс(ов)")
+    
+    def is_busy(self) -> bool:
+        """Очередь отрисовки заполнена"""
+        return self._pending >= self.workers + self.queue_size
+    
+    async def price_chart(self, price_history: List[Dict], product_name: str) -> Optional[io.BytesIO]:
+        """График по истории цен (None - мало данных или ошибка; ChartQueueFull - очередь заполнена)"""
+        return await self._render(_price_chart_png, price_history, product_name)
+    
+    async def rollup_chart(self, rollups: List[Dict], product_name: str, range_label: str) -> Optional[io.BytesIO]:
+        """График за период по агрегатам (None - мало данных или ошибка; ChartQueueFull - очередь заполнена)"""
+        return await self._render(_rollup_chart_png, rollups, product_name, range_label)
+    
+    async def _render(self, func, *args) -> Optional[io.BytesIO]:
+        if self.is_busy():
+            self.rejected += 1
+            logger.warning(f"⏳ Очередь графиков заполнена ({self._pending}), запрос отклонен")
+            raise ChartQueueFull()
+        self.start()
+        
+        self._pending += 1
+        submitted = time.monotonic()
+        try:
+            future = self._executor.submit(_timed, func, *args)
+            png, elapsed = await asyncio.wrap_future(future)
+        except Exception as e:
+            logger.error(f"Ошибка отрисовки графика: {e}", exc_info=True)
+            return None
+        finally:
+            self._pending -= 1
+        
+        # Ожидание свободного процесса: от постановки в очередь до начала отрисовки
+        wait = max(0.0, time.monotonic() - submitted - elapsed)
+        self.renders += 1
+        self.render_total += elapsed
+        self.render_max = max(self.render_max, elapsed)
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        logger.info(f"📊 График за {elapsed * 1000:.0f} мс (ожидание {wait * 1000:.0f} мс)")
+        return io.BytesIO(png) if png else None
+    
+    def stats(self) -> Dict:
+        """Статистика отрисовки"""
+        return {
+            'workers': self.workers,
+            'pending': self._pending,
+            'renders': self.renders,
+            'rejected': self.rejected,
+            'render_avg_ms': round(self.render_total / self.renders * 1000, 1) if self.renders else 0.0,
+            'render_max_ms': round(self.render_max * 1000, 1),
+            'wait_avg_ms': round(self.wait_total / self.renders * 1000, 1) if self.renders else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 1),
+        }
+    
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def chart_renderer_from_config() -> ChartRenderer:
+    """Пул отрисовки графиков с настройками из config.py"""
+    import config
+    
+    return ChartRenderer(
+        workers=config.CHART_WORKERS,
+        queue_size=config.CHART_QUEUE_SIZE,
+    )
 
 
 # Тестирование
@@ -163,11 +406,11 @@ if __name__ == "__main__":
     
     # Тестовые данные
     test_data = [
-        {'checked_at': '2026-01-10 10:00:00', 'price': 15990},
-        {'checked_at': '2026-01-10 12:00:00', 'price': 15890},
-        {'checked_at': '2026-01-10 14:00:00', 'price': 15990},
-        {'checked_at': '2026-01-11 10:00:00', 'price': 14990},
-        {'checked_at': '2026-01-11 12:00:00', 'price': 14890},
+        {'checked_at': 1768039200, 'price': 15990},  # 2026-01-10 10:00 UTC
+        {'checked_at': 1768046400, 'price': 15890},
+        {'checked_at': 1768053600, 'price': 15990},
+        {'checked_at': 1768125600, 'price': 14990},  # 2026-01-11 10:00 UTC
+        {'checked_at': 1768132800, 'price': 14890},
     ]
     
     chart_gen = ChartGenerator()
@@ -0,0 +1,118 @@
+"""
+Адаптивные интервалы проверки товаров
+
+Интервал товара считается по его недавней истории цен: чем чаще менялись
+цена и наличие, тем чаще проверка. Товар без изменений за окно истории
+проверяется с максимальным интервалом, только что добавленный - не реже
+базового CHECK_INTERVAL, пока по нему не накопится история. Очередь
+проверок - куча по времени следующей проверки.
+"""
+
+import heapq
+import itertools
+from datetime import datetime
+from typing import Dict, Hashable, Iterable, List, Optional
+
+# Настройки по умолчанию
+MIN_INTERVAL = 300  # секунды
+MAX_INTERVAL = 6 * 3600
+# Проверок на одно ожидаемое изменение цены
+CHECKS_PER_CHANGE = 6
+# Изменение цены меньше этой доли не считается (копеечные колебания)
+PRICE_EPSILON = 0.005
+# Смена наличия важнее изменения цены
+STOCK_WEIGHT = 2
+# Пока товар моложе, история не учитывается (секунды)
+NEW_PRODUCT_AGE = 24 * 3600
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """datetime без часового пояса из секунд Unix или значения TIMESTAMP SQLite
+
+    Секунды Unix (checked_at, last_seen_at) и CURRENT_TIMESTAMP (added_at) -
+    время UTC, а last_check пишется локальным datetime.now(): его .timestamp()
+    дает секунды Unix, время UTC сравнивается только с datetime.utcnow().
+    """
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def count_changes(history: List[Dict], epsilon: float = PRICE_EPSILON) -> float:
+    """Взвешенное число изменений цены и наличия в истории"""
+    changes = 0
+    for prev, cur in zip(history, history[1:]):
+        if prev['price'] and cur['price'] and abs(cur['price'] - prev['price']) > prev['price'] * epsilon:
+            changes += 1
+        if bool(prev['in_stock']) != bool(cur['in_stock']):
+            changes += STOCK_WEIGHT
+    return changes
+
+
+def check_interval(history: List[Dict], added_at, now: datetime, base_interval: float,
+                   min_interval: float = MIN_INTERVAL, max_interval: float = MAX_INTERVAL) -> float:
+    """Интервал до следующей проверки товара (секунды)
+
+    history - интервалы price_history за окно волатильности по возрастанию checked_at
+    (секунды Unix), added_at и now - в UTC, как CURRENT_TIMESTAMP SQLite.
+    """
+    added = parse_timestamp(added_at)
+    first = parse_timestamp(history[0]['checked_at']) if history else None
+    last = parse_timestamp(history[-1]['last_seen_at']) if history else None
+    checks = sum(record.get('checks') or 1 for record in history)
+
+    if checks < 2 or not first or not last or (added and (now - added).total_seconds() < NEW_PRODUCT_AGE):
+        interval = base_interval
+    else:
+        # Среднее время между изменениями за наблюдаемый период
+        span = (last - first).total_seconds()
+        interval = span / (count_changes(history) + 1) / CHECKS_PER_CHANGE
+    return max(min_interval, min(max_interval, interval))
+
+
+class CheckQueue:
+    """Очередь проверок: товар с самым ранним сроком - первый"""
+
+    def __init__(self):
+        self._heap = []
+        self._due: Dict[Hashable, float] = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def schedule(self, key: Hashable, due: float):
+        """Назначение (или перенос) срока проверки товара"""
+        self._due[key] = due
+        # Старая запись в куче остается и пропускается при извлечении
+        heapq.heappush(self._heap, (due, next(self._counter), key))
+
+    def retain(self, keys: Iterable[Hashable]):
+        """Удаление товаров, которых больше нет среди активных"""
+        keys = set(keys)
+        for key in [k for k in self._due if k not in keys]:
+            del self._due[key]
+
+    def pop_due(self, now: float) -> List[Hashable]:
+        """Товары, срок проверки которых наступил, в порядке срока"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            when, _, key = heapq.heappop(self._heap)
+            if self._due.get(key) == when:
+                del self._due[key]
+                due.append(key)
+        return due
+
+    def next_due(self) -> Optional[float]:
+        """Ближайший срок проверки"""
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
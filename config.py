@@ -13,11 +13,70 @@ BOT_TOKEN = "8564510707:AAHMnir2-66R5-NqPM0nr7vgBm2uLfUL17A"
 
 DATABASE_PATH = "ozon_tracker.db"
 
+# Число долгоживущих соединений с БД в процессе
+DB_POOL_SIZE = 3
+
+# Результаты проверки пишутся пачками: не больше N записей...
+WRITE_BATCH_SIZE = 50
+
+# ...и не дольше N секунд в буфере
+WRITE_BATCH_DELAY = 5
+
 # ============= МОНИТОРИНГ =============
 
 # Интервал проверки цен (секунды) - 10 минут
 CHECK_INTERVAL = 600
 
+# Число параллельных воркеров проверки в процессе (1 - последовательная проверка)
+CHECK_WORKERS = 1
+
+# Максимум одновременных проверок через один прокси
+MAX_CHECKS_PER_PROXY = 2
+
+# Проверка в отдельных процессах: планировщик ставит задания в очередь, воркеры (worker.py) парсят
+JOB_QUEUE_ENABLED = False
+
+# Локальных процессов воркеров планировщика (0 - только воркеры, запущенные вручную, в том числе на других машинах)
+WORKER_PROCESSES = 2
+
+# Аренда задания воркером (секунды): воркер продлевает ее, задание упавшего воркера возвращается в очередь
+JOB_LEASE_TIMEOUT = 300
+
+# Аренд задания, после которых проверка товара считается неудачной
+JOB_MAX_ATTEMPTS = 3
+
+# Как часто воркеры ищут задания, а планировщик - результаты (секунды)
+JOB_POLL_INTERVAL = 1.0
+
+# Сколько планировщик ждет результатов без единого нового (секунды): дальше товары остаются
+# в очереди проверок, а цикл завершается - иначе без живых воркеров проверки встанут навсегда
+JOB_WAIT_TIMEOUT = 3 * JOB_LEASE_TIMEOUT
+
+# Неудач подряд, после которых прокси уходит в карантин
+PROXY_QUARANTINE_FAILURES = 3
+
+# Первый карантин прокси (секунды), каждый следующий вдвое дольше, но не больше максимума
+PROXY_QUARANTINE_BASE = 600
+PROXY_QUARANTINE_MAX = 6 * 3600
+
+# Адаптивные интервалы: товары с часто меняющейся ценой проверяются чаще
+ADAPTIVE_INTERVALS = True
+
+# Минимальный интервал проверки товара (секунды)
+CHECK_INTERVAL_MIN = 300
+
+# Максимальный интервал проверки товара (секунды) - 6 часов
+CHECK_INTERVAL_MAX = 6 * 3600
+
+# Окно истории цен для оценки волатильности (секунды) - 7 дней
+VOLATILITY_WINDOW = 7 * 24 * 3600
+
+# Как часто перечитывать список товаров (секунды)
+SCHEDULE_REFRESH = 60
+
+# Записей истории цен на одной странице /history
+HISTORY_PAGE_SIZE = 20
+
 # Максимум товаров на пользователя
 MAX_PRODUCTS_PER_USER = 15
 
@@ -35,6 +94,48 @@ PARSER_DELAY = 2
 # Задержка после загрузки страницы (секунды)
 PAGE_LOAD_DELAY = 5
 
+# Извлечение данных: "dom" - только нужные виджеты на странице, "html" - разбор page.content()
+EXTRACTION_MODE = "dom"
+
+# Пул браузеров: число браузеров Chromium
+BROWSER_POOL_SIZE = 1
+
+# Пересоздавать контекст прокси после N страниц
+CONTEXT_MAX_PAGES = 50
+
+# Пересоздавать контекст прокси не реже (секунды)
+CONTEXT_MAX_AGE = 1800
+
+# Фильтрация запросов страницы (экономия трафика прокси)
+REQUEST_FILTER_ENABLED = True
+
+# Отбрасываемые типы ресурсов Playwright
+BLOCK_RESOURCE_TYPES = ["image", "media", "font"]
+
+# Отбрасывать запросы к сторонним доменам (не OZON)
+BLOCK_THIRD_PARTY = True
+
+# Домены, которые никогда не блокируются (нужны антибот-челленджу)
+ALLOW_DOMAINS = [
+    "challenges.cloudflare.com",
+    "hcaptcha.com",
+    "recaptcha.net",
+    "google.com",
+    "gstatic.com",
+]
+
+# Быстрый путь: цена по HTTP с cookies браузерной сессии (Playwright - запасной)
+FAST_PATH_ENABLED = True
+
+# Адрес OZON для быстрого пути (можно подменить локальным стендом)
+FAST_PATH_BASE_URL = "https://www.ozon.ru"
+
+# Таймаут HTTP-запроса быстрого пути (секунды)
+FAST_PATH_TIMEOUT = 10
+
+# Пауза быстрого пути для прокси после ответа антибота (секунды)
+FAST_PATH_COOLDOWN = 900
+
 # ============= ПУТИ =============
 
 # Базовая директория для данных
@@ -43,19 +144,76 @@ RUNTIME_DIR = os.path.expanduser("~/ozon_runtime")
 # Путь к файлу прокси
 PROXY_STORAGE_PATH = os.path.join(RUNTIME_DIR, "proxies.txt")
 
+# Как часто проверять, не изменился ли файл прокси (секунды)
+PROXY_REFRESH_INTERVAL = 1.0
+
+# Очередь проверок (для воркеров других машин - на общем диске)
+JOB_QUEUE_PATH = os.path.join(RUNTIME_DIR, "jobs.db")
+
+# WAL для очереди; на сетевой файловой системе (NFS, SMB) WAL не работает - False
+JOB_QUEUE_WAL = True
+
+# Статистика здоровья прокси (успешность, антибот, задержка)
+PROXY_STATS_PATH = os.path.join(RUNTIME_DIR, "proxy_stats.json")
+
+# Сохраненные сессии OZON (cookies) по прокси
+SESSIONS_DIR = os.path.join(RUNTIME_DIR, "sessions")
+
+# Срок жизни сохраненной сессии (секунды)
+SESSION_MAX_AGE = 6 * 3600
+
 # Путь для кэша matplotlib
 MPLCONFIGDIR = os.path.join(RUNTIME_DIR, "mpl")
 
+# Кэш готовых графиков
+CHART_CACHE_DIR = os.path.join(RUNTIME_DIR, "charts")
+
 # Создаем директории
 os.makedirs(RUNTIME_DIR, exist_ok=True)
 os.makedirs(MPLCONFIGDIR, exist_ok=True)
 
+# ============= УВЕДОМЛЕНИЯ =============
+
+# Сообщений в секунду на бота (лимит Telegram - 30) и пауза между сообщениями в один чат (секунды)
+NOTIFY_RATE = 25
+NOTIFY_CHAT_INTERVAL = 1.0
+
+# События чата за цикл проверки уходят одним сообщением, но не позже чем через N секунд
+NOTIFY_DIGEST_DELAY = 60
+
+# Повторов отправки при сетевых ошибках (пауза удваивается)
+NOTIFY_RETRIES = 5
+
 # ============= ГРАФИКИ =============
 
 CHART_SIZE = (12, 6)
 CHART_DPI = 100
 MAX_CHART_RECORDS = 100
 
+# График за период до N дней строится по часовым агрегатам, длиннее - по дневным
+CHART_HOURLY_MAX_DAYS = 14
+
+# Процессов отрисовки графиков и запросов в очереди сверх них (остальные отклоняются)
+CHART_WORKERS = 2
+CHART_QUEUE_SIZE = 8
+
+# Размер кэша графиков: файлов и мегабайт (давно не запрошенные вытесняются)
+CHART_CACHE_MAX_ENTRIES = 500
+CHART_CACHE_MAX_MB = 100
+
+# ============= МЕТРИКИ =============
+
+# Метрики Prometheus на локальном адресе /metrics
+METRICS_ENABLED = True
+METRICS_HOST = "127.0.0.1"
+
+# Порты метрик планировщика и бота (процессы разные)
+METRICS_PORT_SCHEDULER = 9101
+METRICS_PORT_BOT = 9102
+
+# Порт метрик первого локального воркера, следующие - по порядку
+METRICS_PORT_WORKERS = 9110
+
 # ============= ЛОГИРОВАНИЕ =============
 
 LOG_LEVEL = "INFO"
@@ -1,24 +1,232 @@
 """
 Модуль для работы с базой данных SQLite
+
+Процесс держит небольшой пул долгоживущих соединений в режиме WAL: бот и
+планировщик пишут в один файл и не блокируют читателей друг друга, а кэш
+подготовленных выражений sqlite3 живет столько же, сколько соединение.
 """
 
+import asyncio
+import calendar
 import aiosqlite
-from datetime import datetime
-from typing import List, Dict, Optional
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Tuple
 import logging
 
+from metrics import STAGE_SECONDS
+from ozon_url import extract_sku
+
 logger = logging.getLogger(__name__)
 
+# Настройки по умолчанию
+POOL_SIZE = 3
+BUSY_TIMEOUT = 5000  # миллисекунды
+# Ожидание миграции схемы, которую выполняет другой процесс (миллисекунды)
+MIGRATION_LOCK_TIMEOUT = 600000
+CACHED_STATEMENTS = 256
+
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    f'PRAGMA busy_timeout={BUSY_TIMEOUT}',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-8000',
+)
+
+# Версия схемы (PRAGMA user_version): 2 - компактная price_history
+SCHEMA_VERSION = 2
+
+# История цен: интервал с одной ценой и наличием от checked_at до last_seen_at
+# (секунды Unix, UTC), цена в копейках, наличие кодом. Строки товара лежат
+# рядом и по порядку времени - таблица кластеризована по первичному ключу.
+PRICE_HISTORY_TABLE = '''
+    CREATE TABLE IF NOT EXISTS {name} (
+        product_id INTEGER NOT NULL,
+        checked_at INTEGER NOT NULL,
+        last_seen_at INTEGER NOT NULL,
+        checks INTEGER NOT NULL DEFAULT 1,
+        price INTEGER,
+        stock INTEGER NOT NULL,
+        PRIMARY KEY (product_id, checked_at)
+    ) WITHOUT ROWID
+'''
+
+# Колонки истории для чтения: цена в рублях, наличие флагом
+HISTORY_COLUMNS = 'product_id, checked_at, last_seen_at, checks, price / 100.0 AS price, stock = 1 AS in_stock, stock'
+
+# Коды наличия в price_history
+STOCK_OUT = 0
+STOCK_IN = 1
+STOCK_UNKNOWN = 2
+
+CATALOG_UPSERT = '''
+    INSERT INTO catalog (sku, url, product_name, current_price, in_stock, stock_quantity, last_check)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(sku) DO UPDATE SET
+        url = excluded.url,
+        product_name = COALESCE(excluded.product_name, catalog.product_name),
+        current_price = excluded.current_price,
+        in_stock = excluded.in_stock,
+        stock_quantity = excluded.stock_quantity,
+        last_check = excluded.last_check
+'''
+
+# Агрегаты истории цен: длина корзины и формат ее начала (UTC)
+ROLLUP_PERIODS = {
+    'hour': (timedelta(hours=1), '%Y-%m-%d %H:00:00'),
+    'day': (timedelta(days=1), '%Y-%m-%d 00:00:00'),
+}
+
+ROLLUP_UPSERT = '''
+    INSERT INTO price_rollups (product_id, period, bucket, open, high, low, close, price_sum, checks, in_stock_checks)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(product_id, period, bucket) DO UPDATE SET
+        high = MAX(high, excluded.high),
+        low = MIN(low, excluded.low),
+        close = excluded.close,
+        price_sum = price_sum + excluded.price_sum,
+        checks = checks + excluded.checks,
+        in_stock_checks = in_stock_checks + excluded.in_stock_checks
+'''
+
+
+def to_epoch(moment: datetime) -> int:
+    """Секунды Unix для datetime в UTC без часового пояса"""
+    return calendar.timegm(moment.timetuple())
+
+
+def stock_code(in_stock) -> int:
+    """Код наличия для price_history"""
+    if in_stock is None:
+        return STOCK_UNKNOWN
+    return STOCK_IN if in_stock else STOCK_OUT
+
+
+def _kopecks(price) -> Optional[int]:
+    return None if price is None else int(round(price * 100))
+
+
+def _spread_checks(start: datetime, end: datetime, checks: int, period: str) -> List[tuple]:
+    """Распределение проверок интервала истории по корзинам периода
+    
+    Проверки внутри интервала считаются равномерными: первая в start,
+    последняя в end. Возвращает пары (начало корзины, число проверок).
+    """
+    length, fmt = ROLLUP_PERIODS[period]
+    bucket = datetime.strptime(start.strftime(fmt), '%Y-%m-%d %H:%M:%S')
+    if checks <= 1 or end <= start:
+        return [(bucket, checks)]
+    
+    step = (end - start).total_seconds() / (checks - 1)
+    
+    def before(moment: datetime) -> int:
+        # Сколько проверок раньше moment
+        return min(checks, max(0, math.ceil((moment - start).total_seconds() / step - 1e-9)))
+    
+    result = []
+    while bucket <= end:
+        count = before(bucket + length) - before(bucket)
+        if count:
+            result.append((bucket, count))
+        bucket += length
+    return result
+
 
 class Database:
     """Класс для работы с базой данных приложения"""
     
-    def __init__(self, db_path: str):
+    def __init__(self, db_path: str, pool_size: int = POOL_SIZE):
         self.db_path = db_path
+        self.pool_size = pool_size
+        self._idle: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._open_lock: Optional[asyncio.Lock] = None
+        
+        # Метрики ожидания соединения
+        self.acquisitions = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+    
+    async def open(self):
+        """Открытие пула соединений (повторный вызов ничего не делает)"""
+        # Блокировка создается в цикле событий, который открывает пул
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self._idle is not None:
+                return
+            idle = asyncio.Queue()
+            for _ in range(self.pool_size):
+                db = await aiosqlite.connect(self.db_path, cached_statements=CACHED_STATEMENTS)
+                db.row_factory = aiosqlite.Row
+                for pragma in PRAGMAS:
+                    await db.execute(pragma)
+                self._connections.append(db)
+                idle.put_nowait(db)
+            self._idle = idle
+            logger.info(f"Пул соединений с БД открыт: {self.pool_size} (WAL)")
+    
+    async def close(self):
+        """Закрытие всех соединений пула"""
+        connections, self._connections = self._connections, []
+        self._idle = None
+        for db in connections:
+            try:
+                await db.close()
+            except Exception as e:
+                logger.debug(f"Ошибка закрытия соединения: {e}")
+    
+    @asynccontextmanager
+    async def _connection(self):
+        """Соединение из пула на время одной операции"""
+        if self._idle is None:
+            await self.open()
+        idle = self._idle
+        
+        started = time.monotonic()
+        db = await idle.get()
+        waited = time.monotonic() - started
+        self.acquisitions += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        
+        try:
+            yield db
+        finally:
+            try:
+                # Незавершенная операция не должна оставить транзакцию следующему
+                if db.in_transaction:
+                    await db.rollback()
+            finally:
+                idle.put_nowait(db)
+    
+    def stats(self) -> Dict:
+        """Статистика пула соединений"""
+        return {
+            'connections': len(self._connections),
+            'idle': self._idle.qsize() if self._idle else 0,
+            'acquisitions': self.acquisitions,
+            'wait_avg_ms': round(self.wait_total / self.acquisitions * 1000, 2) if self.acquisitions else 0.0,
+            'wait_max_ms': round(self.wait_max * 1000, 2),
+        }
     
     async def init_db(self):
-        """Инициализация базы данных и создание таблиц"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Инициализация базы данных и создание таблиц
+        
+        Вся инициализация и миграции - одна транзакция с блокировкой записи: бот и
+        планировщик, запущенные одновременно, мигрируют базу по очереди (второй видит
+        уже новую версию схемы), а сбой посреди миграции откатывает ее целиком.
+        """
+        async with self._connection() as db:
+            await db.execute(f'PRAGMA busy_timeout={MIGRATION_LOCK_TIMEOUT}')
+            try:
+                await db.execute('BEGIN IMMEDIATE')
+            finally:
+                await db.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+            
             # Таблица пользователей
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -41,23 +249,80 @@ class Database:
                     stock_quantity TEXT,
                     added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     is_active BOOLEAN DEFAULT 1,
+                    sku INTEGER,
                     FOREIGN KEY (user_id) REFERENCES users (user_id)
                 )
             ''')
             
-            # Таблица истории цен
+            # Таблица истории цен (в базе прежней версии остается до миграции ниже);
+            # версия схемы читается под блокировкой - другой процесс мог уже мигрировать
+            async with db.execute('PRAGMA user_version') as cursor:
+                schema_version = (await cursor.fetchone())[0]
+            async with db.execute('PRAGMA table_info(price_history)') as cursor:
+                history_columns = [row[1] for row in await cursor.fetchall()]
+            await db.execute(PRICE_HISTORY_TABLE.format(name='price_history'))
+            
+            # Общий каталог товаров OZON по SKU (одна загрузка на цикл)
             await db.execute('''
-                CREATE TABLE IF NOT EXISTS price_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    product_id INTEGER,
-                    price REAL,
+                CREATE TABLE IF NOT EXISTS catalog (
+                    sku INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    product_name TEXT,
+                    current_price REAL,
                     in_stock BOOLEAN,
                     stock_quantity TEXT,
-                    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (product_id) REFERENCES products (id)
+                    last_check TIMESTAMP
                 )
             ''')
             
+            # Часовые и дневные агрегаты истории (open/high/low/close, доля наличия)
+            async with db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'price_rollups'"
+            ) as cursor:
+                rollups_exist = await cursor.fetchone() is not None
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS price_rollups (
+                    product_id INTEGER NOT NULL,
+                    period TEXT NOT NULL,
+                    bucket TIMESTAMP NOT NULL,
+                    open REAL,
+                    high REAL,
+                    low REAL,
+                    close REAL,
+                    price_sum REAL,
+                    checks INTEGER,
+                    in_stock_checks INTEGER,
+                    PRIMARY KEY (product_id, period, bucket)
+                ) WITHOUT ROWID
+            ''')
+            
+            # Миграция: SKU у подписок на товары
+            async with db.execute('PRAGMA table_info(products)') as cursor:
+                columns = [row[1] for row in await cursor.fetchall()]
+            if 'sku' not in columns:
+                await db.execute('ALTER TABLE products ADD COLUMN sku INTEGER')
+                async with db.execute('SELECT id, url FROM products') as cursor:
+                    rows = await cursor.fetchall()
+                updates = [(extract_sku(url), product_id) for product_id, url in rows if extract_sku(url)]
+                await db.executemany('UPDATE products SET sku = ? WHERE id = ?', updates)
+                logger.info(f"Миграция: SKU проставлен для {len(updates)}/{len(rows)} товаров")
+            
+            compacted = migrated = 0
+            if schema_version < 2 and 'id' in history_columns:
+                # Миграция: история цен интервалами (строка на изменение цены или наличия)
+                if 'last_seen_at' not in history_columns:
+                    await db.execute('ALTER TABLE price_history ADD COLUMN last_seen_at TIMESTAMP')
+                    await db.execute('ALTER TABLE price_history ADD COLUMN checks INTEGER DEFAULT 1')
+                    compacted = await self._compact_history(db)
+                
+                # Миграция 2: компактная схема истории
+                migrated = await self._migrate_history_v2(db)
+            await db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            
+            # Миграция: агрегаты по уже накопленной истории
+            if not rollups_exist:
+                await self._backfill_rollups(db)
+            
             # Создание индексов для ускорения запросов
             await db.execute('''
                 CREATE INDEX IF NOT EXISTS idx_products_user 
@@ -65,36 +330,241 @@ class Database:
             ''')
             
             await db.execute('''
-                CREATE INDEX IF NOT EXISTS idx_price_history_product 
-                ON price_history(product_id, checked_at)
+                CREATE INDEX IF NOT EXISTS idx_products_sku 
+                ON products(sku, is_active)
             ''')
             
             await db.commit()
+            
+            if compacted or migrated:
+                # Файл базы уменьшается только после VACUUM (вне транзакции)
+                await db.execute('VACUUM')
             logger.info("База данных инициализирована")
     
+    @staticmethod
+    async def _compact_history(db) -> int:
+        """Схлопывание подряд идущих одинаковых записей истории в интервалы"""
+        keep = []    # (last_seen_at, checks, id) первой записи каждого интервала
+        delete = []
+        run = None   # [product_id, ключ, id, last_seen_at, checks]
+        async with db.execute(
+            '''SELECT id, product_id, price, in_stock, stock_quantity, checked_at FROM price_history
+               ORDER BY product_id, checked_at, id'''
+        ) as cursor:
+            async for row_id, product_id, price, in_stock, stock_quantity, checked_at in cursor:
+                key = (price, bool(in_stock), stock_quantity)
+                if run and run[0] == product_id and run[1] == key:
+                    run[3] = checked_at
+                    run[4] += 1
+                    delete.append((row_id,))
+                    continue
+                if run:
+                    keep.append((run[3], run[4], run[2]))
+                run = [product_id, key, row_id, checked_at, 1]
+        if run:
+            keep.append((run[3], run[4], run[2]))
+        
+        await db.executemany('UPDATE price_history SET last_seen_at = ?, checks = ? WHERE id = ?', keep)
+        await db.executemany('DELETE FROM price_history WHERE id = ?', delete)
+        logger.info(f"Миграция: история цен сжата до {len(keep)} интервалов (удалено {len(delete)} повторов)")
+        return len(delete)
+    
+    @staticmethod
+    async def _migrate_history_v2(db) -> int:
+        """Перенос истории цен в компактную схему: секунды Unix, копейки, код наличия"""
+        await db.execute(PRICE_HISTORY_TABLE.format(name='price_history_v2'))
+        rows = []
+        previous = None  # (product_id, checked_at) предыдущего интервала
+        async with db.execute(
+            '''SELECT product_id, price, in_stock, checked_at, last_seen_at, checks FROM price_history
+               WHERE product_id IS NOT NULL AND checked_at IS NOT NULL
+               ORDER BY product_id, checked_at, id'''
+        ) as cursor:
+            async for product_id, price, in_stock, checked_at, last_seen_at, checks in cursor:
+                start = to_epoch(datetime.fromisoformat(str(checked_at)))
+                # Ключ (product_id, checked_at): интервал из той же секунды сдвигается на следующую
+                if previous and previous[0] == product_id and start <= previous[1]:
+                    start = previous[1] + 1
+                end = to_epoch(datetime.fromisoformat(str(last_seen_at))) if last_seen_at else start
+                rows.append((product_id, start, max(start, end), checks or 1, _kopecks(price), stock_code(in_stock)))
+                previous = (product_id, start)
+        
+        await db.executemany(
+            '''INSERT INTO price_history_v2 (product_id, checked_at, last_seen_at, checks, price, stock)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            rows
+        )
+        await db.execute('DROP TABLE price_history')
+        await db.execute('ALTER TABLE price_history_v2 RENAME TO price_history')
+        logger.info(f"Миграция: история цен ({len(rows)} интервалов) перенесена в компактную схему")
+        return len(rows)
+    
+    @staticmethod
+    async def _backfill_rollups(db):
+        """Построение агрегатов по интервалам истории"""
+        buckets = {}  # (product_id, period, bucket) -> [open, high, low, close, sum, checks, in_stock]
+        
+        def flush_product():
+            rows = [(*key[:2], key[2].strftime('%Y-%m-%d %H:%M:%S'), *values) for key, values in buckets.items()]
+            buckets.clear()
+            return rows
+        
+        rows = []
+        product = None
+        async with db.execute(
+            '''SELECT product_id, price / 100.0, stock = 1, checked_at, last_seen_at, checks FROM price_history
+               WHERE price IS NOT NULL ORDER BY product_id, checked_at'''
+        ) as cursor:
+            async for product_id, price, in_stock, checked_at, last_seen_at, checks in cursor:
+                if product_id != product:
+                    rows.extend(flush_product())
+                    product = product_id
+                start = datetime.utcfromtimestamp(checked_at)
+                end = datetime.utcfromtimestamp(last_seen_at)
+                for period in ROLLUP_PERIODS:
+                    for bucket, count in _spread_checks(start, end, checks or 1, period):
+                        values = buckets.get((product_id, period, bucket))
+                        if values is None:
+                            buckets[(product_id, period, bucket)] = [
+                                price, price, price, price, price * count, count, count if in_stock else 0
+                            ]
+                        else:
+                            values[1] = max(values[1], price)
+                            values[2] = min(values[2], price)
+                            values[3] = price
+                            values[4] += price * count
+                            values[5] += count
+                            values[6] += count if in_stock else 0
+        rows.extend(flush_product())
+        
+        await db.executemany(ROLLUP_UPSERT, rows)
+        logger.info(f"Миграция: построено {len(rows)} часовых и дневных агрегатов истории цен")
+    
+    @staticmethod
+    async def _record_history(db, observations: List[tuple]):
+        """Запись наблюдений в историю: новая строка только при изменении цены или наличия
+        
+        observations - кортежи (product_id, price, in_stock, checked_at) по времени,
+        checked_at - секунды Unix. Без изменений у последней строки товара
+        продлевается last_seen_at.
+        """
+        product_ids = sorted({obs[0] for obs in observations})
+        if not product_ids:
+            return
+        
+        # Последний интервал каждого товара: [начало, (цена, код наличия), новая строка или None]
+        runs = {}
+        placeholders = ','.join('?' * len(product_ids))
+        async with db.execute(
+            # Остальные колонки при MAX() SQLite берет из строки с максимумом
+            f'''SELECT product_id, MAX(checked_at), price, stock FROM price_history
+                WHERE product_id IN ({placeholders}) GROUP BY product_id''',
+            product_ids
+        ) as cursor:
+            async for product_id, checked_at, price, stock in cursor:
+                runs[product_id] = [checked_at, (price, stock), None]
+        
+        extended = {}  # (product_id, checked_at) существующей строки -> [last_seen_at, новых проверок]
+        inserts = []   # [product_id, checked_at, last_seen_at, checks, price, stock]
+        for product_id, price, in_stock, checked_at in observations:
+            key = (_kopecks(price), stock_code(in_stock))
+            run = runs.get(product_id)
+            if run and run[1] == key:
+                if run[2] is not None:
+                    run[2][2] = max(run[2][2], checked_at)
+                    run[2][3] += 1
+                else:
+                    extension = extended.setdefault((product_id, run[0]), [checked_at, 0])
+                    extension[0] = max(extension[0], checked_at)
+                    extension[1] += 1
+                continue
+            # Ключ (product_id, checked_at): новый интервал начинается не раньше следующей секунды
+            start = max(checked_at, run[0] + 1) if run else checked_at
+            row = [product_id, start, max(start, checked_at), 1, *key]
+            inserts.append(row)
+            runs[product_id] = [start, key, row]
+        
+        await db.executemany(
+            '''UPDATE price_history SET last_seen_at = MAX(last_seen_at, ?), checks = checks + ?
+               WHERE product_id = ? AND checked_at = ?''',
+            [(last_seen_at, checks, product_id, start)
+             for (product_id, start), (last_seen_at, checks) in extended.items()]
+        )
+        await db.executemany(
+            '''INSERT INTO price_history (product_id, checked_at, last_seen_at, checks, price, stock)
+               VALUES (?, ?, ?, ?, ?, ?)''',
+            inserts
+        )
+        
+        # Агрегаты обновляются той же транзакцией
+        await db.executemany(ROLLUP_UPSERT, [
+            (product_id, period, datetime.utcfromtimestamp(checked_at).strftime(fmt),
+             price, price, price, price, price, 1, 1 if in_stock else 0)
+            for product_id, price, in_stock, checked_at in observations if price is not None
+            for period, (_, fmt) in ROLLUP_PERIODS.items()
+        ])
+    
     async def add_user(self, user_id: int, username: str = None):
         """Добавление пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             await db.execute(
                 'INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)',
                 (user_id, username)
             )
             await db.commit()
     
-    async def add_product(self, user_id: int, url: str) -> int:
+    async def add_product(self, user_id: int, url: str, sku: int = None) -> int:
         """Добавление товара для отслеживания"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute(
-                'INSERT INTO products (user_id, url) VALUES (?, ?)',
-                (user_id, url)
+                'INSERT INTO products (user_id, url, sku) VALUES (?, ?, ?)',
+                (user_id, url, sku or extract_sku(url))
             )
             await db.commit()
             return cursor.lastrowid
     
+    async def get_user_product_by_sku(self, user_id: int, sku: int) -> Optional[Dict]:
+        """Активная подписка пользователя на товар с данным SKU"""
+        async with self._connection() as db:
+            async with db.execute(
+                'SELECT * FROM products WHERE user_id = ? AND sku = ? AND is_active = 1',
+                (user_id, sku)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+    
+    async def set_product_sku(self, product_ids: List[int], sku: int):
+        """Проставление SKU подпискам (после раскрытия короткой ссылки)"""
+        async with self._connection() as db:
+            await db.executemany(
+                'UPDATE products SET sku = ? WHERE id = ?',
+                [(sku, product_id) for product_id in product_ids]
+            )
+            await db.commit()
+    
+    async def get_catalog_item(self, sku: int) -> Optional[Dict]:
+        """Последние данные о товаре из общего каталога"""
+        async with self._connection() as db:
+            async with db.execute(
+                'SELECT * FROM catalog WHERE sku = ?',
+                (sku,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return dict(row) if row else None
+    
+    async def update_catalog_item(self, sku: int, url: str, price: float, in_stock: bool,
+                                  stock_quantity: str = None, product_name: str = None):
+        """Сохранение результата проверки товара в общий каталог"""
+        async with self._connection() as db:
+            await db.execute(
+                CATALOG_UPSERT,
+                (sku, url, product_name, price, in_stock, stock_quantity, datetime.now())
+            )
+            await db.commit()
+    
     async def get_user_products(self, user_id: int) -> List[Dict]:
         """Получение списка товаров пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connection() as db:
             async with db.execute(
                 '''SELECT * FROM products 
                    WHERE user_id = ? AND is_active = 1 
@@ -106,8 +576,7 @@ class Database:
     
     async def get_all_active_products(self) -> List[Dict]:
         """Получение всех активных товаров для мониторинга"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connection() as db:
             async with db.execute(
                 'SELECT * FROM products WHERE is_active = 1'
             ) as cursor:
@@ -118,7 +587,7 @@ class Database:
                                    in_stock: bool, stock_quantity: str = None,
                                    product_name: str = None):
         """Обновление информации о товаре и добавление записи в историю"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             # Обновляем текущую информацию о товаре
             update_query = '''
                 UPDATE products 
@@ -135,34 +604,184 @@ class Database:
             
             await db.execute(update_query, params)
             
-            # Добавляем запись в историю цен
-            await db.execute(
-                '''INSERT INTO price_history (product_id, price, in_stock, stock_quantity) 
-                   VALUES (?, ?, ?, ?)''',
-                (product_id, price, in_stock, stock_quantity)
-            )
+            # Добавляем запись в историю цен (или продлеваем последний интервал)
+            await self._record_history(db, [(product_id, price, in_stock, int(time.time()))])
             await db.commit()
             logger.debug(f"Обновлена цена товара #{product_id}: {price} ₽")
     
-    async def get_price_history(self, product_id: int, limit: int = None) -> List[Dict]:
-        """Получение истории цен товара"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+    async def write_check_results(self, products: List[tuple], catalog: List[tuple], checkpoint: bool = False):
+        """Запись пачки результатов проверки одной транзакцией
+        
+        products - кортежи (product_id, price, in_stock, stock_quantity, product_name,
+        last_check, checked_at), checked_at - секунды Unix, catalog - кортежи
+        параметров CATALOG_UPSERT.
+        checkpoint - перенести WAL в файл базы (данные переживут и сбой питания).
+        """
+        async with self._connection() as db:
+            await db.executemany(
+                '''UPDATE products
+                   SET current_price = ?, last_check = ?, in_stock = ?, stock_quantity = ?,
+                       product_name = COALESCE(NULLIF(?, ''), product_name)
+                   WHERE id = ?''',
+                [(price, last_check, in_stock, stock_quantity, name, product_id)
+                 for product_id, price, in_stock, stock_quantity, name, last_check, _ in products]
+            )
+            await self._record_history(db, [
+                (product_id, price, in_stock, checked_at)
+                for product_id, price, in_stock, _, _, _, checked_at in products
+            ])
+            await db.executemany(CATALOG_UPSERT, catalog)
+            await db.commit()
             
-            query = '''SELECT * FROM price_history 
+            if checkpoint:
+                await db.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        logger.debug(f"Записана пачка: {len(products)} товаров, {len(catalog)} SKU каталога")
+    
+    async def get_price_history(self, product_id: int, limit: int = None) -> List[Dict]:
+        """Получение истории цен товара
+        
+        Каждая запись - интервал с одной ценой и наличием: от checked_at
+        до last_seen_at (секунды Unix), checks - число проверок в интервале.
+        """
+        async with self._connection() as db:
+            query = f'''SELECT {HISTORY_COLUMNS} FROM price_history 
                        WHERE product_id = ? 
                        ORDER BY checked_at ASC'''
+            params = (product_id,)
             
+            # LIMIT параметром - текст запроса один, выражение берется из кэша
             if limit:
-                query += f' LIMIT {limit}'
+                query += ' LIMIT ?'
+                params = (product_id, limit)
+            
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in rows]
+    
+    async def get_history_page(self, product_id: int, limit: int, before: int = None, after: int = None,
+                               since: datetime = None, until: datetime = None) -> Dict:
+        """Страница истории цен, от новых к старым (keyset-пагинация)
+        
+        before/after - checked_at записи-курсора: записи старше или новее нее.
+        since/until - окно по времени (UTC). Возвращает записи страницы и
+        признаки has_older/has_newer для кнопок навигации.
+        """
+        conditions = ['product_id = ?']
+        params = [product_id]
+        if since:
+            conditions.append('checked_at >= ?')
+            params.append(to_epoch(since))
+        if until:
+            conditions.append('checked_at < ?')
+            params.append(to_epoch(until))
+        window = ' AND '.join(conditions)
+        
+        # checked_at уникален в пределах товара - он и есть курсор
+        if after is not None:
+            query = f'''SELECT {HISTORY_COLUMNS} FROM price_history WHERE {window} AND checked_at > ?
+                        ORDER BY checked_at ASC LIMIT ?'''
+            query_params = [*params, after, limit + 1]
+        elif before is not None:
+            query = f'''SELECT {HISTORY_COLUMNS} FROM price_history WHERE {window} AND checked_at < ?
+                        ORDER BY checked_at DESC LIMIT ?'''
+            query_params = [*params, before, limit + 1]
+        else:
+            query = f'''SELECT {HISTORY_COLUMNS} FROM price_history WHERE {window}
+                        ORDER BY checked_at DESC LIMIT ?'''
+            query_params = [*params, limit + 1]
+        
+        async with self._connection() as db:
+            async def exists(condition: str, checked_at: int) -> bool:
+                async with db.execute(
+                    f'SELECT EXISTS(SELECT 1 FROM price_history WHERE {window} AND {condition})',
+                    [*params, checked_at]
+                ) as cursor:
+                    return bool((await cursor.fetchone())[0])
+            
+            async with db.execute(query, query_params) as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+            # Лишняя запись - признак следующей страницы в направлении движения
+            more = len(rows) > limit
+            rows = rows[:limit]
+            if after is not None:
+                rows.reverse()
             
-            async with db.execute(query, (product_id,)) as cursor:
+            if not rows:
+                return {'items': [], 'has_older': False, 'has_newer': False}
+            if after is not None:
+                has_newer, has_older = more, await exists('checked_at < ?', rows[-1]['checked_at'])
+            elif before is not None:
+                has_older, has_newer = more, await exists('checked_at > ?', rows[0]['checked_at'])
+            else:
+                has_older, has_newer = more, False
+        
+        return {'items': rows, 'has_older': has_older, 'has_newer': has_newer}
+    
+    async def get_recent_price_history(self, product_id: int, limit: int) -> List[Dict]:
+        """Последние limit интервалов истории цен (по возрастанию checked_at)"""
+        async with self._connection() as db:
+            async with db.execute(
+                f'''SELECT {HISTORY_COLUMNS} FROM price_history
+                    WHERE product_id = ?
+                    ORDER BY checked_at DESC LIMIT ?''',
+                (product_id, limit)
+            ) as cursor:
+                rows = await cursor.fetchall()
+                return [dict(row) for row in reversed(rows)]
+    
+    async def get_history_version(self, product_id: int) -> Optional[Tuple[int, int]]:
+        """Версия истории цен товара: начало последнего интервала и число проверок в нем
+        
+        Меняется при каждой записанной проверке, в том числе продлевающей интервал.
+        """
+        async with self._connection() as db:
+            async with db.execute(
+                '''SELECT checked_at, checks FROM price_history
+                   WHERE product_id = ?
+                   ORDER BY checked_at DESC LIMIT 1''',
+                (product_id,)
+            ) as cursor:
+                row = await cursor.fetchone()
+                return (row['checked_at'], row['checks']) if row else None
+    
+    async def get_price_rollups(self, product_id: int, period: str, since: datetime) -> List[Dict]:
+        """Часовые ('hour') или дневные ('day') агрегаты цены начиная с since (UTC)
+        
+        bucket - начало корзины в секундах Unix.
+        """
+        length, fmt = ROLLUP_PERIODS[period]
+        async with self._connection() as db:
+            async with db.execute(
+                '''SELECT CAST(strftime('%s', bucket) AS INTEGER) AS bucket,
+                          open, high, low, close, price_sum, checks, in_stock_checks
+                   FROM price_rollups
+                   WHERE product_id = ? AND period = ? AND price_rollups.bucket >= ?
+                   ORDER BY price_rollups.bucket ASC''',
+                (product_id, period, since.strftime(fmt))
+            ) as cursor:
                 rows = await cursor.fetchall()
                 return [dict(row) for row in rows]
     
+    async def get_recent_history(self, product_ids: List[int], since: datetime) -> Dict[int, List[Dict]]:
+        """Интервалы истории цен нескольких товаров, заканчивающиеся не раньше since (UTC)"""
+        if not product_ids:
+            return {}
+        history = {product_id: [] for product_id in product_ids}
+        async with self._connection() as db:
+            placeholders = ','.join('?' * len(product_ids))
+            async with db.execute(
+                f'''SELECT {HISTORY_COLUMNS} FROM price_history
+                    WHERE product_id IN ({placeholders}) AND last_seen_at >= ?
+                    ORDER BY product_id, checked_at ASC''',
+                (*product_ids, to_epoch(since))
+            ) as cursor:
+                async for row in cursor:
+                    history[row['product_id']].append(dict(row))
+        return history
+
     async def delete_product(self, product_id: int, user_id: int) -> bool:
         """Удаление товара (мягкое удаление - деактивация)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             cursor = await db.execute(
                 'UPDATE products SET is_active = 0 WHERE id = ? AND user_id = ?',
                 (product_id, user_id)
@@ -172,8 +791,7 @@ class Database:
     
     async def get_product(self, product_id: int) -> Optional[Dict]:
         """Получение информации о товаре по ID"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._connection() as db:
             async with db.execute(
                 'SELECT * FROM products WHERE id = ?',
                 (product_id,)
@@ -183,7 +801,7 @@ class Database:
     
     async def count_user_products(self, user_id: int) -> int:
         """Подсчет количества активных товаров пользователя"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             async with db.execute(
                 'SELECT COUNT(*) FROM products WHERE user_id = ? AND is_active = 1',
                 (user_id,)
@@ -193,7 +811,7 @@ class Database:
     
     async def get_statistics(self) -> Dict:
         """Получение общей статистики"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._connection() as db:
             stats = {}
             
             # Количество пользователей
@@ -206,8 +824,97 @@ class Database:
             ) as cursor:
                 stats['active_products'] = (await cursor.fetchone())[0]
             
+            # Количество уникальных товаров OZON
+            async with db.execute(
+                'SELECT COUNT(DISTINCT sku) FROM products WHERE is_active = 1'
+            ) as cursor:
+                stats['unique_skus'] = (await cursor.fetchone())[0]
+            
             # Количество записей в истории
             async with db.execute('SELECT COUNT(*) FROM price_history') as cursor:
                 stats['history_records'] = (await cursor.fetchone())[0]
             
             return stats
+
+
+class PriceWriteBuffer:
+    """Буфер результатов проверки: запись пачками по размеру или по времени"""
+    
+    def __init__(self, db: Database, max_size: int = 50, max_delay: float = 5.0):
+        self.db = db
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._products: List[tuple] = []
+        self._catalog: List[tuple] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        
+        self.flushes = 0
+        self.rows_written = 0
+    
+    def __len__(self):
+        return len(self._products) + len(self._catalog)
+    
+    async def add_price(self, product_id: int, price: float, in_stock: bool,
+                        stock_quantity: str = None, product_name: str = None):
+        """Результат проверки подписки (как Database.update_product_price)"""
+        self._products.append((product_id, price, in_stock, stock_quantity, product_name,
+                               datetime.now(), int(time.time())))
+        await self._added()
+    
+    async def add_catalog_item(self, sku: int, url: str, price: float, in_stock: bool,
+                               stock_quantity: str = None, product_name: str = None):
+        """Результат проверки товара каталога (как Database.update_catalog_item)"""
+        self._catalog.append((sku, url, product_name, price, in_stock, stock_quantity, datetime.now()))
+        await self._added()
+    
+    async def _added(self):
+        if len(self) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            # Первая запись в пустом буфере - запись не позже чем через max_delay
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush_later)
+    
+    def _flush_later(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def flush(self, durable: bool = False):
+        """Запись накопленного одной транзакцией"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not len(self) and not durable:
+                return
+            
+            products, self._products = self._products, []
+            catalog, self._catalog = self._catalog, []
+            try:
+                with STAGE_SECONDS.time(stage='db_write'):
+                    await self.db.write_check_results(products, catalog, checkpoint=durable)
+            except Exception as e:
+                # Не потерять результаты: вернуть в буфер до следующей записи
+                self._products[:0] = products
+                self._catalog[:0] = catalog
+                logger.error(f"Ошибка записи пачки ({len(products)} товаров): {e}")
+                raise
+            self.flushes += 1
+            self.rows_written += len(products) + len(catalog)
+
+
+_shared: Dict[str, Database] = {}
+
+
+def database_from_config() -> Database:
+    """Общий для процесса экземпляр базы данных из config.py"""
+    import config
+    
+    if config.DATABASE_PATH not in _shared:
+        _shared[config.DATABASE_PATH] = Database(config.DATABASE_PATH, pool_size=config.DB_POOL_SIZE)
+    return _shared[config.DATABASE_PATH]
@@ -0,0 +1,199 @@
+"""
+Быстрый путь получения цены по HTTP без рендеринга страницы
+
+Берет cookies сохраненной браузерной сессии прокси и запрашивает данные
+товара у JSON API страниц OZON (entrypoint-api) через пул соединений aiohttp.
+Из состояний виджетов извлекаются цена, название и наличие. При любой
+неудаче или ответе антибота возвращается None, и парсер уходит на Playwright.
+"""
+
+import json
+import logging
+import re
+import time
+from typing import Dict, Optional
+
+import aiohttp
+
+from browser_pool import USER_AGENT, build_proxy_config
+from ozon_url import canonical_url
+
+# Настройки по умолчанию
+BASE_URL = "https://www.ozon.ru"
+API_PATH = "/api/entrypoint-api.bx/page/json/v2"
+REQUEST_TIMEOUT = 10  # секунды
+ANTIBOT_COOLDOWN = 900  # секунды без быстрого пути для прокси после антибота
+PRICE_MIN = 100
+PRICE_MAX = 5_000_000
+
+# Порядок полей совпадает с порядком цен в виджете webPrice на странице
+PRICE_FIELDS = ("cardPrice", "price", "originalPrice")
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_price_text(text) -> Optional[float]:
+    """Цена из строки вида '1 299 ₽' (пробелы могут быть неразрывными)"""
+    if text is None:
+        return None
+    digits = re.sub(r"[^\d,.]", "", str(text)).replace(",", ".")
+    try:
+        price = float(digits)
+    except ValueError:
+        return None
+    return price if PRICE_MIN <= price <= PRICE_MAX else None
+
+
+def parse_widget_states(data: Dict) -> Optional[Dict]:
+    """Цена, название и наличие из ответа entrypoint-api"""
+    states = data.get("widgetStates") or {}
+    price_state = heading_state = None
+    out_of_stock = False
+
+    for key, raw in states.items():
+        widget = key.split("-", 1)[0]
+        if widget == "webPrice" and price_state is None:
+            price_state = json.loads(raw)
+        elif widget == "webProductHeading" and heading_state is None:
+            heading_state = json.loads(raw)
+        elif widget == "webOutOfStock":
+            out_of_stock = True
+
+    if not price_state:
+        return None
+
+    price = None
+    for field in PRICE_FIELDS:
+        price = _parse_price_text(price_state.get(field))
+        if price:
+            break
+    if not price:
+        return None
+
+    name = (heading_state or {}).get("title") or (data.get("seo") or {}).get("title") or "Неизвестный товар"
+    in_stock = price_state.get("isAvailable", True) and not out_of_stock
+    return {
+        'name': name.strip()[:100],
+        'price': price,
+        'in_stock': bool(in_stock),
+        'stock_quantity': "В наличии" if in_stock else "Нет в наличии",
+    }
+
+
+class HttpFastPath:
+    """HTTP-клиент с пулом соединений для быстрых проверок цены"""
+
+    def __init__(self, base_url: str = BASE_URL, timeout: float = REQUEST_TIMEOUT,
+                 cooldown: float = ANTIBOT_COOLDOWN):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._blocked_until: Dict[Optional[str], float] = {}
+
+        self.hits = 0
+        self.fallbacks = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            # Cookies свои у каждого прокси - передаются заголовком, а не общим хранилищем
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=50, ttl_dns_cache=300),
+                cookie_jar=aiohttp.DummyCookieJar(),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    @staticmethod
+    def _cookie_header(storage_state_path: str) -> Optional[str]:
+        """Заголовок Cookie из storage_state браузерной сессии"""
+        try:
+            with open(storage_state_path, 'r') as f:
+                cookies = json.load(f).get('cookies') or []
+        except (OSError, ValueError):
+            return None
+        now = time.time()
+        pairs = [
+            f"{c['name']}={c['value']}" for c in cookies
+            if 'ozon' in c.get('domain', '') and (c.get('expires', -1) == -1 or c['expires'] > now)
+        ]
+        return "; ".join(pairs) or None
+
+    def is_available(self, proxy: Optional[str]) -> bool:
+        """Быстрый путь не отключен для прокси после антибота"""
+        return self._blocked_until.get(proxy, 0) <= time.monotonic()
+
+    async def fetch(self, sku: int, proxy: Optional[str], storage_state_path: str) -> Optional[Dict]:
+        """Данные товара по HTTP или None (нужен Playwright)"""
+        result = await self._fetch(sku, proxy, storage_state_path)
+        if result:
+            self.hits += 1
+            result['url'] = canonical_url(sku)
+            result['sku'] = sku
+        else:
+            self.fallbacks += 1
+        return result
+
+    async def _fetch(self, sku: int, proxy: Optional[str], storage_state_path: str) -> Optional[Dict]:
+        cookie = self._cookie_header(storage_state_path)
+        if not cookie:
+            return None
+
+        proxy_url = proxy_auth = None
+        proxy_config = build_proxy_config(proxy)
+        if proxy_config:
+            if not proxy_config['server'].startswith("http://"):
+                return None  # aiohttp не умеет socks5
+            proxy_url = proxy_config['server']
+            if proxy_config.get('username'):
+                proxy_auth = aiohttp.BasicAuth(proxy_config['username'], proxy_config['password'])
+
+        headers = {
+            "User-Agent": USER_AGENT,
+            "Accept": "application/json",
+            "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
+            "Cookie": cookie,
+        }
+        try:
+            async with self._get_session().get(
+                f"{self.base_url}{API_PATH}",
+                params={"url": f"/product/{sku}/"},
+                headers=headers,
+                proxy=proxy_url,
+                proxy_auth=proxy_auth,
+            ) as response:
+                if response.status in (403, 429) or "json" not in response.content_type:
+                    logger.info(f"🚫 Быстрый путь: антибот ({response.status}), переключаюсь на браузер")
+                    self._blocked_until[proxy] = time.monotonic() + self.cooldown
+                    return None
+                if response.status != 200:
+                    logger.debug(f"Быстрый путь: HTTP {response.status}")
+                    return None
+                data = await response.json(content_type=None)
+        except Exception as e:
+            logger.debug(f"Быстрый путь: ошибка запроса: {e}")
+            return None
+
+        try:
+            return parse_widget_states(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            logger.debug(f"Быстрый путь: неожиданный ответ: {e}")
+            return None
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def fast_path_from_config() -> Optional[HttpFastPath]:
+    """Быстрый путь с настройками из config.py (None, если выключен)"""
+    import config
+
+    if not config.FAST_PATH_ENABLED:
+        return None
+    return HttpFastPath(
+        base_url=config.FAST_PATH_BASE_URL,
+        timeout=config.FAST_PATH_TIMEOUT,
+        cooldown=config.FAST_PATH_COOLDOWN,
+    )
@@ -0,0 +1,280 @@
+"""
+Очередь проверок в SQLite для воркеров в отдельных процессах
+
+Координатор (scheduler.py) ставит в очередь товары, срок проверки которых
+наступил, воркеры (worker.py) берут задания в аренду, парсят страницу и
+возвращают результат, координатор забирает готовые результаты и пишет их
+в БД. Аренда ограничена по времени: воркер продлевает ее, пока проверка
+идет, а задание упавшего воркера после истечения аренды снова уходит в
+очередь (и после JOB_MAX_ATTEMPTS аренд считается неудачным).
+
+Очередь - отдельный файл SQLite, воркерам не нужна основная БД. Воркеры
+других машин работают с тем же файлом на общем диске; WAL на сетевой
+файловой системе не работает, поэтому для такой очереди wal=False.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+# Настройки по умолчанию
+LEASE_TIMEOUT = 300  # секунды
+MAX_ATTEMPTS = 3
+BUSY_TIMEOUT = 10000  # миллисекунды
+
+# Состояния задания
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+JOBS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item_key TEXT NOT NULL UNIQUE,
+        url TEXT NOT NULL,
+        sku INTEGER,
+        state TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        worker TEXT,
+        lease_until REAL,
+        enqueued_at REAL NOT NULL,
+        finished_at REAL,
+        result TEXT,
+        error TEXT
+    )
+'''
+
+# Товар в очереди один раз; завершенное, но не забранное задание (координатор
+# перезапускался) ставится заново - его результат мог устареть
+ENQUEUE = f'''
+    INSERT INTO jobs (item_key, url, sku, state, enqueued_at) VALUES (?, ?, ?, '{PENDING}', ?)
+    ON CONFLICT(item_key) DO UPDATE SET
+        url = excluded.url, sku = excluded.sku, state = '{PENDING}', attempts = 0, worker = NULL,
+        lease_until = NULL, enqueued_at = excluded.enqueued_at, finished_at = NULL, result = NULL, error = NULL
+    WHERE state IN ('{DONE}', '{FAILED}')
+'''
+
+
+class JobQueue:
+    """Задания проверки товаров с арендой по времени"""
+
+    def __init__(self, path: str, lease_timeout: float = LEASE_TIMEOUT, max_attempts: int = MAX_ATTEMPTS,
+                 wal: bool = True):
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.wal = wal
+        self._db: Optional[aiosqlite.Connection] = None
+        # Одно соединение на процесс: транзакции его корутин не должны перемешиваться
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.enqueued = 0
+        self.leased = 0
+        self.completed = 0
+        self.requeued = 0
+        self.failed = 0
+
+    async def open(self):
+        """Открытие файла очереди (повторный вызов ничего не делает)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._db is not None:
+                return
+            # Транзакции явные: аренда - BEGIN IMMEDIATE, чтобы два воркера не взяли одно задание
+            db = await aiosqlite.connect(self.path, isolation_level=None)
+            db.row_factory = aiosqlite.Row
+            await db.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT}')
+            await db.execute('PRAGMA journal_mode=WAL' if self.wal else 'PRAGMA journal_mode=DELETE')
+            await db.execute(JOBS_TABLE)
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state, enqueued_at)')
+            self._db = db
+            logger.info(f"Очередь проверок: {self.path}")
+
+    async def close(self):
+        db, self._db = self._db, None
+        if db is not None:
+            await db.close()
+
+    async def _transaction(self, work):
+        """work(db) в одной транзакции с блокировкой записи"""
+        if self._db is None:
+            await self.open()
+        async with self._lock:
+            db = self._db
+            await db.execute('BEGIN IMMEDIATE')
+            try:
+                result = await work(db)
+            except BaseException:
+                await db.execute('ROLLBACK')
+                raise
+            await db.execute('COMMIT')
+            return result
+
+    async def enqueue(self, jobs: List[Tuple[str, str, Optional[int]]]) -> int:
+        """Постановка заданий (ключ товара, ссылка, SKU); товары уже в очереди пропускаются"""
+        now = time.time()
+
+        async def work(db):
+            added = 0
+            for key, url, sku in jobs:
+                cursor = await db.execute(ENQUEUE, (key, url, sku, now))
+                added += cursor.rowcount
+            return added
+
+        added = await self._transaction(work)
+        self.enqueued += added
+        return added
+
+    async def _expire_leases(self, db, now: float):
+        """Задания с истекшей арендой - снова в очередь или в неудачные"""
+        cursor = await db.execute(
+            f"UPDATE jobs SET state = '{FAILED}', finished_at = ?, error = 'Аренда истекла' "
+            f"WHERE state = '{LEASED}' AND lease_until < ? AND attempts >= ?",
+            (now, now, self.max_attempts)
+        )
+        failed = cursor.rowcount
+        cursor = await db.execute(
+            f"UPDATE jobs SET state = '{PENDING}', worker = NULL, lease_until = NULL "
+            f"WHERE state = '{LEASED}' AND lease_until < ?",
+            (now,)
+        )
+        if failed or cursor.rowcount:
+            logger.warning(f"⏳ Аренда истекла: снова в очереди {cursor.rowcount}, неудачных {failed}")
+        self.failed += failed
+        self.requeued += cursor.rowcount
+
+    async def lease(self, worker: str) -> Optional[Dict]:
+        """Самое старое задание в аренду воркеру (None - очередь пуста)"""
+        now = time.time()
+
+        async def work(db):
+            await self._expire_leases(db, now)
+            async with db.execute(
+                f"SELECT id, item_key, url, sku, attempts FROM jobs WHERE state = '{PENDING}' "
+                f"ORDER BY enqueued_at, id LIMIT 1"
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            await db.execute(
+                f"UPDATE jobs SET state = '{LEASED}', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                f"WHERE id = ?",
+                (worker, now + self.lease_timeout, row['id'])
+            )
+            job = dict(row)
+            job['attempts'] += 1
+            return job
+
+        job = await self._transaction(work)
+        if job:
+            self.leased += 1
+        return job
+
+    async def renew(self, job_id: int, worker: str) -> bool:
+        """Продление аренды; False - задание уже отдано другому воркеру"""
+        async def work(db):
+            cursor = await db.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = '{LEASED}'",
+                (time.time() + self.lease_timeout, job_id, worker)
+            )
+            return cursor.rowcount > 0
+
+        return await self._transaction(work)
+
+    async def complete(self, job_id: int, worker: str, result: Optional[Dict]) -> bool:
+        """Результат проверки (None - данных нет); False - аренда уже потеряна"""
+        async def work(db):
+            cursor = await db.execute(
+                f"UPDATE jobs SET state = '{DONE}', finished_at = ?, result = ?, lease_until = NULL "
+                f"WHERE id = ? AND worker = ? AND state = '{LEASED}'",
+                (time.time(), json.dumps(result, ensure_ascii=False), job_id, worker)
+            )
+            return cursor.rowcount > 0
+
+        done = await self._transaction(work)
+        if done:
+            self.completed += 1
+        return done
+
+    async def fail(self, job_id: int, worker: str, error: str) -> Optional[str]:
+        """Ошибка проверки: задание снова в очередь, после max_attempts - неудачное
+
+        Возвращает новое состояние задания (None - аренда уже потеряна).
+        """
+        async def work(db):
+            async with db.execute(
+                f"SELECT attempts FROM jobs WHERE id = ? AND worker = ? AND state = '{LEASED}'", (job_id, worker)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            state = FAILED if row['attempts'] >= self.max_attempts else PENDING
+            await db.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, worker = NULL, lease_until = NULL, error = ? WHERE id = ?",
+                (state, time.time() if state == FAILED else None, error[:500], job_id)
+            )
+            return state
+
+        state = await self._transaction(work)
+        if state == FAILED:
+            self.failed += 1
+        elif state == PENDING:
+            self.requeued += 1
+        return state
+
+    async def collect(self) -> List[Dict]:
+        """Завершенные задания (результат разобран) - забираются из очереди"""
+        async def work(db):
+            async with db.execute(
+                f"SELECT id, item_key, state, attempts, worker, result, error FROM jobs "
+                f"WHERE state IN ('{DONE}', '{FAILED}') ORDER BY finished_at"
+            ) as cursor:
+                rows = [dict(row) for row in await cursor.fetchall()]
+            await db.executemany('DELETE FROM jobs WHERE id = ?', [(row['id'],) for row in rows])
+            return rows
+
+        jobs = await self._transaction(work)
+        for job in jobs:
+            job['result'] = json.loads(job['result']) if job['result'] else None
+        return jobs
+
+    async def counts(self) -> Dict[str, int]:
+        """Число заданий по состояниям"""
+        if self._db is None:
+            await self.open()
+        async with self._lock:
+            async with self._db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state') as cursor:
+                rows = await cursor.fetchall()
+        counts = {state: 0 for state in (PENDING, LEASED, DONE, FAILED)}
+        counts.update({state: count for state, count in rows})
+        return counts
+
+    def stats(self) -> Dict:
+        """Счетчики заданий этого процесса"""
+        return {
+            'enqueued': self.enqueued,
+            'leased': self.leased,
+            'completed': self.completed,
+            'requeued': self.requeued,
+            'failed': self.failed,
+        }
+
+
+def job_queue_from_config() -> JobQueue:
+    """Очередь проверок с настройками из config.py"""
+    import config
+
+    return JobQueue(
+        config.JOB_QUEUE_PATH,
+        lease_timeout=config.JOB_LEASE_TIMEOUT,
+        max_attempts=config.JOB_MAX_ATTEMPTS,
+        wal=config.JOB_QUEUE_WAL,
+    )
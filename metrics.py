@@ -0,0 +1,351 @@
+"""
+Метрики в формате Prometheus
+
+Гистограммы длительности этапов проверки (запуск браузера, warm-up, goto,
+ожидание контента, пауза после загрузки, обход антибота, разбор, запись
+в БД, отправка уведомления), длительность цикла, глубина очереди, счетчики
+исходов проверки по причинам и RSS процессов Chromium. Метрики общие для
+процесса; бот и планировщик отдают их на локальном HTTP-адресе /metrics.
+Счетчики из stats() пулов и очередей подключаются через register_stats.
+Без зависимости prometheus_client: текстовый формат 0.0.4 пишется здесь же.
+"""
+
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Границы гистограмм по умолчанию (секунды): от разбора HTML до цикла проверки
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+CYCLE_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+# Процессы браузера среди потомков (comm в /proc обрезан до 15 символов)
+BROWSER_PROCESS_NAMES = ('chrome', 'chromium', 'headless_shell')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict) -> Tuple:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Метрика {self.name}: метки {sorted(labels)} вместо {list(self.labels)}")
+        return tuple(labels[name] for name in self.labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Счетчик, только растет"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """Текущее значение: задается явно или функцией при каждом чтении"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], Optional[float]]] = None
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], Optional[float]]):
+        """Значение без меток, вычисляемое при чтении метрик (None - не отдавать)"""
+        self._function = function
+
+    def samples(self) -> List[str]:
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception as e:
+                logger.debug(f"Метрика {self.name} не вычислена: {e}")
+                value = None
+            return [f"{self.name} {_format_value(value)}"] if value is not None else []
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    """Распределение значений по границам buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> (число значений в каждом интервале и сверх последней границы, сумма)
+        self._counts: Dict[Tuple, List[int]] = {}
+        self._sums: Dict[Tuple, float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            self._sums[key] = 0.0
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер блока: with STAGE_SECONDS.time(stage='goto'): ..."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def total(self, **labels) -> float:
+        """Сумма значений"""
+        return self._sums.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self._counts.items():
+            total = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                total += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {total}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+
+class Registry:
+    """Метрики процесса и счетчики из stats() объектов"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._stats: List[Tuple[str, str, Callable[[], Dict]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        # Повторная регистрация (перезагрузка модуля) - та же метрика
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def register_stats(self, prefix: str, documentation: str, stats: Callable[[], Dict]):
+        """Числовые поля stats() - метриками {prefix}_{поле}"""
+        self._stats = [entry for entry in self._stats if entry[0] != prefix]
+        self._stats.append((prefix, documentation, stats))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            samples = metric.samples()
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        for prefix, documentation, stats in self._stats:
+            try:
+                values = stats()
+            except Exception as e:
+                logger.debug(f"Статистика {prefix} недоступна: {e}")
+                continue
+            for field, value in values.items():
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    continue
+                name = f"{prefix}_{field}"
+                lines.append(f"# HELP {name} {documentation}: {field}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labels))
+
+
+def gauge(name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labels))
+
+
+def histogram(name: str, documentation: str, labels: Tuple[str, ...] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labels, buckets))
+
+
+def register_stats(prefix: str, documentation: str, stats: Callable[[], Dict]):
+    REGISTRY.register_stats(prefix, documentation, stats)
+
+
+def _processes() -> Dict[int, Tuple[int, str]]:
+    """pid -> (ppid, comm) по /proc"""
+    processes = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat', 'r') as f:
+                data = f.read()
+        except OSError:
+            continue
+        # comm в скобках может содержать пробелы и скобки
+        comm = data[data.index('(') + 1:data.rindex(')')]
+        processes[int(name)] = (int(data[data.rindex(')') + 2:].split()[1]), comm)
+    return processes
+
+
+def _rss(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def process_rss_bytes() -> Optional[int]:
+    """RSS текущего процесса (None не на Linux)"""
+    return _rss(os.getpid()) if os.path.isdir('/proc') else None
+
+
+def browser_rss_bytes() -> Optional[int]:
+    """Суммарный RSS процессов Chromium, запущенных этим процессом (через драйвер Playwright)"""
+    if not os.path.isdir('/proc'):
+        return None
+    processes = _processes()
+    children: Dict[int, List[int]] = {}
+    for pid, (ppid, _) in processes.items():
+        children.setdefault(ppid, []).append(pid)
+
+    total = 0
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        if processes[pid][1].startswith(BROWSER_PROCESS_NAMES):
+            total += _rss(pid)
+    return total
+
+
+# Метрики конвейера проверки (общие для бота и планировщика)
+STAGE_SECONDS = histogram(
+    'ozon_stage_seconds', 'Длительность этапа проверки товара', ('stage',)
+)
+PARSE_ATTEMPTS = counter(
+    'ozon_parse_attempts_total', 'Попытки получить товар по исходу', ('result',)
+)
+CHECKS = counter(
+    'ozon_checks_total', 'Проверки товаров каталога по исходу', ('result',)
+)
+CYCLE_SECONDS = histogram(
+    'ozon_check_cycle_seconds', 'Длительность цикла проверки', buckets=CYCLE_BUCKETS
+)
+QUEUE_DEPTH = gauge(
+    'ozon_queue_depth', 'Товаров в очереди проверки', ('state',)
+)
+gauge('ozon_browser_rss_bytes', 'RSS процессов Chromium').set_function(browser_rss_bytes)
+gauge('ozon_process_rss_bytes', 'RSS процесса').set_function(process_rss_bytes)
+
+
+class MetricsServer:
+    """HTTP-адрес /metrics для Prometheus"""
+
+    def __init__(self, host: str, port: int, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner = None
+
+    async def start(self):
+        from aiohttp import web
+
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            # Метрики не должны мешать работе бота
+            logger.warning(f"Адрес метрик {self.host}:{self.port} недоступен: {e}")
+            await self.close()
+            return
+        logger.info(f"📊 Метрики: http://{self.host}:{self.port}/metrics")
+
+    async def _handle(self, request):
+        from aiohttp import web
+
+        return web.Response(body=self.registry.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def metrics_server_from_config(port: int) -> Optional[MetricsServer]:
+    """Сервер метрик с настройками из config.py (None, если метрики выключены)"""
+    import config
+
+    if not config.METRICS_ENABLED:
+        return None
+    return MetricsServer(config.METRICS_HOST, port)
@@ -0,0 +1,248 @@
+"""
+Очередь уведомлений Telegram с учетом лимитов
+
+Планировщик только кладет уведомления в очередь и сразу продолжает
+проверку цен - отправкой занимаются отдельные задачи. События одного
+чата за цикл проверки собираются в одно сообщение-дайджест. Общий темп
+ограничен корзиной токенов (Telegram - не больше 30 сообщений в секунду),
+в один чат - не чаще раза в секунду. На ответ RetryAfter отправка
+приостанавливается на указанное время, сетевые ошибки повторяются
+с экспоненциальной паузой.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import STAGE_SECONDS
+
+# Настройки по умолчанию
+GLOBAL_RATE = 25  # сообщений в секунду на бота (запас до лимита 30)
+CHAT_INTERVAL = 1.0  # секунды между сообщениями в один чат
+DIGEST_MAX_DELAY = 60  # секунды ожидания конца цикла проверки
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0  # секунды, удваивается с каждой попыткой
+SENDERS = 4
+MESSAGE_LIMIT = 4096  # символов в сообщении Telegram
+
+logger = logging.getLogger(__name__)
+
+
+def _is_transient(error: Exception) -> bool:
+    """Ошибка сети или сервера Telegram - отправку стоит повторить"""
+    if isinstance(error, (asyncio.TimeoutError, OSError)):
+        return True
+    # aiogram уже загружен - ошибка пришла из его запроса
+    from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+    return isinstance(error, (TelegramNetworkError, TelegramServerError))
+
+
+def build_digest(messages: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Сообщения чата одним текстом (или несколькими, если не влезают в лимит)"""
+    if len(messages) == 1:
+        return [messages[0][:limit]]
+    header = f"🔔 <b>Изменения по отслеживаемым товарам: {len(messages)}</b>\n"
+    parts = []
+    current = header
+    for message in messages:
+        message = message.strip()[:limit - len(header) - 2]
+        if len(current) + len(message) + 2 > limit:
+            parts.append(current)
+            current = header
+        current += "\n" + message + "\n"
+    parts.append(current)
+    return parts
+
+
+class TokenBucket:
+    """Корзина токенов: в среднем rate операций в секунду, всплеск до capacity
+
+    По умолчанию capacity = 1 - ровный темп: в любом окне в секунду не больше rate.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """Отправка уведомлений отдельными задачами с дайджестами по чатам"""
+
+    def __init__(self, send: Callable[[int, str], Awaitable], rate: float = GLOBAL_RATE,
+                 chat_interval: float = CHAT_INTERVAL, max_delay: float = DIGEST_MAX_DELAY,
+                 retries: int = MAX_RETRIES, senders: int = SENDERS):
+        self._send = send
+        self._bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.max_delay = max_delay
+        self.retries = retries
+        self.senders = senders
+
+        self._pending: Dict[int, List[str]] = {}
+        # Чаты, ожидающие конца цикла или своего интервала
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._queued = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._next_send: Dict[int, float] = {}
+        self._paused_until = 0.0
+        # Результаты цикла не записаны - уведомления ждут следующего release()
+        self._holding = False
+        self._tasks: List[asyncio.Task] = []
+
+        self.events = 0
+        self.sent = 0
+        self.retried = 0
+        self.dropped = 0
+
+    def start(self):
+        """Запуск задач отправки"""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._sender()) for _ in range(self.senders)]
+
+    def notify(self, chat_id: int, text: str):
+        """Уведомление в очередь (не ждет отправки)"""
+        self.events += 1
+        self._pending.setdefault(chat_id, []).append(text)
+        if chat_id not in self._timers and chat_id not in self._queued and not self._holding:
+            # Дайджест уходит в конце цикла, но не позже max_delay
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(
+                self.max_delay, self._release, chat_id
+            )
+
+    def release(self):
+        """Конец цикла проверки: накопленные дайджесты - на отправку"""
+        self._holding = False
+        for chat_id in list(self._pending):
+            self._release(chat_id)
+
+    def hold(self):
+        """Результаты цикла не записаны: дайджесты (и новые события) ждут следующего release()
+
+        Таймеры max_delay отменяются - иначе пользователь узнает о цене, которой нет в истории.
+        """
+        self._holding = True
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+
+    def _release(self, chat_id: int):
+        timer = self._timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+        if chat_id not in self._pending or chat_id in self._queued or self._ready is None:
+            return
+        wait = self._next_send.get(chat_id, 0) - time.monotonic()
+        if wait > 0:
+            # Чату недавно писали - отправка после его интервала (события продолжают копиться)
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(wait, self._release, chat_id)
+            return
+        self._queued.add(chat_id)
+        self._ready.put_nowait(chat_id)
+
+    async def _sender(self):
+        while True:
+            chat_id = await self._ready.get()
+            try:
+                messages = self._pending.pop(chat_id, [])
+                for text in build_digest(messages) if messages else []:
+                    await self._deliver(chat_id, text)
+            except Exception as e:
+                logger.error(f"Ошибка очереди уведомлений: {e}")
+            finally:
+                self._queued.discard(chat_id)
+                self._ready.task_done()
+                if chat_id in self._pending and chat_id not in self._timers and not self._holding:
+                    # Пока шла отправка, пришли новые события
+                    self._release(chat_id)
+
+    async def _deliver(self, chat_id: int, text: str):
+        attempt = 0
+        while True:
+            wait = max(self._paused_until, self._next_send.get(chat_id, 0)) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self._bucket.acquire()
+            try:
+                with STAGE_SECONDS.time(stage='notification'):
+                    await self._send(chat_id, text)
+            except Exception as e:
+                retry_after = getattr(e, 'retry_after', None)
+                if retry_after is not None:
+                    # Ограничение Telegram действует на бота - пауза для всех отправок
+                    self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                    self.retried += 1
+                    logger.warning(f"⏳ Telegram просит подождать {retry_after} с")
+                    continue
+                if attempt < self.retries and _is_transient(e):
+                    attempt += 1
+                    self.retried += 1
+                    await asyncio.sleep(RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                    continue
+                self.dropped += 1
+                logger.error(f"Ошибка отправки → {chat_id}: {e}")
+                return
+            self.sent += 1
+            self._next_send[chat_id] = time.monotonic() + self.chat_interval
+            logger.info(f"✅ Уведомление → {chat_id}")
+            return
+
+    def stats(self) -> Dict:
+        """Статистика уведомлений"""
+        return {
+            'events': self.events,
+            'sent': self.sent,
+            'pending_chats': len(self._pending),
+            'retried': self.retried,
+            'dropped': self.dropped,
+        }
+
+    async def close(self, timeout: float = 30):
+        """Отправка накопленного и остановка задач"""
+        if not self._tasks:
+            return
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for chat_id in list(self._pending):
+            self._next_send.pop(chat_id, None)
+            self._release(chat_id)
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Не отправлено уведомлений для {len(self._pending)} чатов")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def notifier_from_config(send: Callable[[int, str], Awaitable]) -> NotificationDispatcher:
+    """Очередь уведомлений с настройками из config.py"""
+    import config
+
+    return NotificationDispatcher(
+        send,
+        rate=config.NOTIFY_RATE,
+        chat_interval=config.NOTIFY_CHAT_INTERVAL,
+        max_delay=config.NOTIFY_DIGEST_DELAY,
+        retries=config.NOTIFY_RETRIES,
+    )
@@ -0,0 +1,34 @@
+"""
+Канонизация ссылок OZON по артикулу (SKU)
+
+Один и тот же товар встречается под разными ссылками: со сменой слага,
+с параметрами запроса, в старом формате /context/detail/id/. Все они
+сводятся к числовому SKU. Короткие ссылки /t/... содержат SKU только
+после редиректа, поэтому для них SKU определяется после загрузки страницы.
+"""
+
+import re
+from typing import Optional
+
+_SKU_PATTERNS = [
+    # /product/nabor-igrovoy-1628022641/ и /product/1628022641
+    re.compile(r'ozon\.ru/product/(?:[^/?#]*-)?(\d{4,})(?:[/?#]|$)'),
+    # Старый формат /context/detail/id/1628022641/
+    re.compile(r'ozon\.ru/context/detail/id/(\d{4,})(?:[/?#]|$)'),
+]
+
+
+def extract_sku(url: Optional[str]) -> Optional[int]:
+    """Числовой SKU товара из ссылки OZON (None для коротких ссылок)"""
+    if not url:
+        return None
+    for pattern in _SKU_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def canonical_url(sku: int) -> str:
+    """Каноническая ссылка на товар по SKU"""
+    return f"https://www.ozon.ru/product/{sku}/"
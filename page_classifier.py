@@ -0,0 +1,181 @@
+"""
+Классификатор страниц OZON за один проход по HTML
+
+Страница один раз приводится к нижнему регистру, и один скомпилированный
+шаблон за проход находит ключевые слова антибота, фразы об отсутствии
+товара и знак ₽, от которого берется кандидат в цену. Как только кандидат
+найден, проход продолжается с той же позиции шаблоном без ₽ - знаков рубля
+на странице тысячи. Найденное ключевое слово антибота завершает проход.
+
+Фраза об отсутствии товара учитывается только в виджете статуса наличия
+(STOCK_WIDGETS): "нет в наличии" бывает и в описании, и в карточках
+похожих товаров. То же правило - widgets_out_of_stock() - применяется к
+виджетам, которые извлекаются прямо на странице (parser.EXTRACT_SCRIPT).
+"""
+
+import re
+from typing import List, Optional
+
+ANTIBOT_KEYWORDS = [
+    'antibot', 'доступ ограничен', 'access denied', 'captcha',
+    'подтвердите, что вы не робот', 'я не робот', 'recaptcha',
+    'hcaptcha', 'cloudflare', 'checking your browser', 'just a moment',
+    'fastly', 'bot management', 'challenge', 'fab_chlg_',
+]
+
+# Признаки контента OZON (регистр важен)
+OZON_INDICATORS = [
+    'data-widget="webProductHeading"',
+    'data-widget="webPrice"',
+    'ozon.ru/product/',
+]
+
+STOCK_OUT_PHRASES = ['нет в наличии', 'закончился', 'товар закончился']
+
+# Виджеты статуса наличия: фраза вне их текста не значит, что товара нет
+STOCK_WIDGETS = ['webOutOfStock', 'webAddToCart']
+
+# Страница такого размера без признаков OZON - заглушка антибота
+ANTIBOT_SIZE_RANGE = (150000, 250000)
+
+ANTIBOT = 'antibot'
+PRODUCT = 'product'
+OUT_OF_STOCK = 'out_of_stock'
+UNKNOWN = 'unknown'
+
+RUBLE = '₽'
+
+
+def _alternation(words: List[str]):
+    # Длинные варианты первыми: при общем начале побеждает самое полное совпадение
+    return re.compile('|'.join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+
+_KEYWORDS = {keyword: ANTIBOT for keyword in ANTIBOT_KEYWORDS}
+_KEYWORDS.update({phrase: OUT_OF_STOCK for phrase in STOCK_OUT_PHRASES})
+
+_MATCHER = _alternation(list(_KEYWORDS) + [RUBLE])
+_KEYWORD_MATCHER = _alternation(list(_KEYWORDS))
+_STOCK_MATCHER = _alternation(STOCK_OUT_PHRASES)
+
+_WIDGET_MARKER = 'data-widget="'
+_STOCK_WIDGET_NAMES = {widget.lower() for widget in STOCK_WIDGETS}
+
+# Цена после знака рубля: ₽\s*(\d[\d\s]{2,})
+_PRICE_AFTER = re.compile(r'\s*(\d[\d\s]{2,})')
+_PRICE_AFTER_RUBLE = re.compile(r'₽\s*(\d[\d\s]{2,})')
+
+
+def _price_before(text: str, pos: int) -> Optional[str]:
+    """Кандидат (\\d[\\d\\s]{2,})\\s*₽, заканчивающийся знаком рубля в позиции pos"""
+    start = pos
+    while start > 0 and (text[start - 1].isdecimal() or text[start - 1].isspace()):
+        start -= 1
+    # Совпадение начинается с первой цифры непрерывного блока перед ₽
+    while start < pos and not text[start].isdecimal():
+        start += 1
+    if pos - start >= 3:
+        return text[start:pos]
+    return None
+
+
+def _in_stock_widget(text: str, pos: int) -> bool:
+    """Позиция pos в тексте (нижний регистр) внутри виджета статуса наличия
+
+    Виджет - от его атрибута data-widget до атрибута следующего виджета.
+    """
+    marker = text.rfind(_WIDGET_MARKER, 0, pos)
+    if marker == -1:
+        return False
+    start = marker + len(_WIDGET_MARKER)
+    return text[start:text.find('"', start)] in _STOCK_WIDGET_NAMES
+
+
+def widgets_out_of_stock(html: str) -> bool:
+    """Фраза об отсутствии товара в виджете статуса наличия"""
+    text = html.lower()
+    return any(_in_stock_widget(text, match.start()) for match in _STOCK_MATCHER.finditer(text))
+
+
+class PageClass:
+    """Результат классификации страницы"""
+
+    def __init__(self, kind: str, antibot_keyword: Optional[str], has_indicators: bool,
+                 out_of_stock: bool, price_before: Optional[str], price_after: Optional[str],
+                 text: str = ''):
+        self.kind = kind
+        self.antibot_keyword = antibot_keyword
+        self.has_indicators = has_indicators
+        self.out_of_stock = out_of_stock
+        self._price_before = price_before
+        self._price_after = price_after
+        self._text = text
+
+    @property
+    def is_antibot(self) -> bool:
+        return self.kind == ANTIBOT
+
+    def price_candidates(self) -> List[str]:
+        """Первый кандидат вида "1 299 ₽", затем первый вида "₽ 1 299"
+
+        Второй нужен, только если первый не подошел, поэтому ищется по запросу.
+        """
+        if self._price_after is None and self._text:
+            match = _PRICE_AFTER_RUBLE.search(self._text)
+            self._price_after = match.group(1) if match else ''
+            self._text = ''
+        return [c for c in (self._price_before, self._price_after) if c]
+
+    def __repr__(self):
+        return (f"PageClass(kind={self.kind!r}, antibot_keyword={self.antibot_keyword!r}, "
+                f"out_of_stock={self.out_of_stock}, price_before={self._price_before!r})")
+
+
+def classify_page(html: str) -> PageClass:
+    """Классификация страницы и поиск кандидата в цену за один проход"""
+    # Цифры, пробелы и ₽ при смене регистра не меняются - цену ищем в той же копии
+    text = html.lower()
+    antibot_keyword = None
+    out_of_stock = False
+    price_before = price_after = None
+
+    matcher = _MATCHER
+    pos = 0
+    while True:
+        match = matcher.search(text, pos)
+        if match is None:
+            break
+        pos = match.end()
+        found = match.group()
+
+        if found == RUBLE:
+            if price_after is None:
+                tail = _PRICE_AFTER.match(text, pos)
+                if tail:
+                    price_after = tail.group(1)
+            price_before = _price_before(text, match.start())
+            if price_before:
+                matcher = _KEYWORD_MATCHER
+        elif _KEYWORDS[found] == ANTIBOT:
+            # Дальше смотреть незачем
+            antibot_keyword = found
+            break
+        elif not out_of_stock:
+            out_of_stock = _in_stock_widget(text, match.start())
+
+    has_indicators = any(indicator in html for indicator in OZON_INDICATORS)
+
+    if antibot_keyword is not None:
+        kind = ANTIBOT
+    elif ANTIBOT_SIZE_RANGE[0] < len(html) < ANTIBOT_SIZE_RANGE[1] and not has_indicators:
+        kind = ANTIBOT
+    elif out_of_stock:
+        kind = OUT_OF_STOCK
+    elif has_indicators or price_before or price_after:
+        kind = PRODUCT
+    else:
+        kind = UNKNOWN
+
+    # Кандидат "₽ 1 299" до первого "1 299 ₽" найден в проходе, иначе ищется по запросу
+    return PageClass(kind, antibot_keyword, has_indicators, out_of_stock,
+                     price_before, price_after, '' if price_after else text)
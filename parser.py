@@ -8,17 +8,50 @@ import re
 import asyncio
 import random
 import logging
-import os
+import time
+from contextlib import asynccontextmanager
 from typing import Dict, Optional, List
 
-from bs4 import BeautifulSoup
+from browser_pool import BrowserPool, pool_from_config
+from http_fast_path import HttpFastPath, fast_path_from_config
+from ozon_url import extract_sku
+from metrics import PARSE_ATTEMPTS, STAGE_SECONDS
+from page_classifier import PageClass, STOCK_WIDGETS, classify_page, widgets_out_of_stock
+from proxy_health import ANTIBOT, FAILED, OK, ProxyHealth, proxy_health_from_config
+from proxy_registry import ProxyRegistry
 
 # Настройки
+# Главная OZON для warm-up (нагрузочный прогон подменяет ее локальным стендом)
+BASE_URL = "https://www.ozon.ru"
 HEADLESS_MODE = True
 PARSER_TIMEOUT = 30000  # миллисекунды
 PAGE_LOAD_DELAY = 5
 PRICE_MIN = 100
 PRICE_MAX = 5_000_000
+# dom - извлечение нужных виджетов прямо на странице, html - разбор page.content()
+EXTRACTION_MODE = "dom"
+
+# Из документа нужны только заголовок и виджет цены
+WIDGET_MARKERS = ('data-widget="webProductHeading"', '<h1', 'data-widget="webPrice"')
+WIDGET_FRAGMENT_SIZE = 20_000
+
+# Виджеты статуса наличия - наличие по ним определяется тем же правилом, что и в classify_page
+STOCK_WIDGETS_SELECTOR = ', '.join(f'[data-widget="{widget}"]' for widget in STOCK_WIDGETS)
+
+# Извлечение на странице: в Python возвращаются только нужные строки
+EXTRACT_SCRIPT = """
+    (stockWidgets) => {
+        const heading = document.querySelector('h1[data-widget="webProductHeading"]')
+            || document.querySelector('h1');
+        const price = document.querySelector('[data-widget="webPrice"]');
+        const stock = Array.from(document.querySelectorAll(stockWidgets), node => node.outerHTML);
+        return {
+            name: heading ? heading.textContent : null,
+            priceText: price ? price.textContent : null,
+            stockHtml: stock.join(''),
+        };
+    }
+"""
 
 logger = logging.getLogger(__name__)
 
@@ -26,145 +59,114 @@ logger = logging.getLogger(__name__)
 class OzonParser:
     """Парсер OZON с обходом антибот защиты через Playwright"""
     
-    def __init__(self):
-        self.playwright = None
-        self.browser = None
-        self.context = None
-        self.page = None
+    def __init__(self, pool: Optional[BrowserPool] = None, max_per_proxy: Optional[int] = None,
+                 fast_path: Optional[HttpFastPath] = None, extraction_mode: str = EXTRACTION_MODE,
+                 health: Optional[ProxyHealth] = None, base_url: str = BASE_URL):
+        self.pool = pool or BrowserPool(headless=HEADLESS_MODE, timeout=PARSER_TIMEOUT)
+        self.extraction_mode = extraction_mode
+        self.base_url = base_url
+        # HTTP без рендеринга, Playwright - запасной вариант
+        self.fast_path = fast_path
         self._proxy_list: List[str] = []
         self._proxy_index = 0
+        # Общий реестр прокси: изменения подхватываются без перезапуска
+        self.registry: Optional[ProxyRegistry] = None
+        # Выбор прокси по здоровью (None - по кругу)
+        self.health = health
+        # Лимит одновременных проверок через один прокси (None - без лимита)
+        self.max_per_proxy = max_per_proxy
+        self._proxy_in_use: Dict[Optional[str], int] = {}
+        self._proxy_released = asyncio.Condition()
+        # Статистика warm-up (пропуск при действующей сохраненной сессии)
+        self.warmups_run = 0
+        self.warmups_skipped = 0
+    
+    def use_registry(self, registry: ProxyRegistry):
+        """Прокси из реестра (список обновляется при изменении файла)"""
+        self.registry = registry
+        registry.subscribe(self._set_proxies)
+    
+    def _set_proxies(self, proxies: List[str]):
+        self._proxy_list = proxies
     
     def load_proxies(self, proxy_file: str = None):
         """Загрузка прокси из файла"""
-        if proxy_file and os.path.exists(proxy_file):
-            try:
-                self._proxy_list = []
-                with open(proxy_file, 'r') as f:
-                    for line in f:
-                        proxy = line.strip()
-                        if proxy:
-                            self._proxy_list.append(proxy)
-                logger.info(f"✅ Загружено {len(self._proxy_list)} прокси")
-            except Exception as e:
-                logger.error(f"Ошибка загрузки прокси: {e}")
+        if proxy_file:
+            self.use_registry(ProxyRegistry(proxy_file))
     
-    def _get_next_proxy(self) -> Optional[str]:
-        """Получить следующий прокси (ротация)"""
-        if not self._proxy_list:
+    def _get_next_proxy(self, candidates: Optional[List[str]] = None, trial: bool = True) -> Optional[str]:
+        """Получить следующий прокси: по здоровью или по кругу"""
+        candidates = self._proxy_list if candidates is None else candidates
+        if not candidates:
             return None
-        proxy = self._proxy_list[self._proxy_index % len(self._proxy_list)]
+        if self.health:
+            return self.health.choose(candidates, trial)
+        proxy = candidates[self._proxy_index % len(candidates)]
         self._proxy_index += 1
         return proxy
     
-    async def _human_delay(self, min_sec: float = 1.0, max_sec: float = 3.0):
-        """Имитация человеческой задержки между действиями"""
-        await asyncio.sleep(random.uniform(min_sec, max_sec))
+    def _record_check(self, proxy: Optional[str], outcome: str, latency: Optional[float] = None,
+                      traffic: Optional[Dict] = None):
+        """Учет исхода проверки в статистике прокси"""
+        if self.health and self._proxy_list:
+            self.health.record(proxy, outcome, latency, (traffic or {}).get('loaded_bytes', 0))
     
-    async def _setup_browser(self, proxy: Optional[str] = None):
-        """Инициализация браузера Playwright с настройками маскировки"""
-        from playwright.async_api import async_playwright
-        
-        self.playwright = await async_playwright().start()
-        
-        # Настройка прокси
-        proxy_config = None
-        if proxy:
-            # Формат: IP:PORT:LOGIN:PASSWORD или socks5://...
-            if proxy.startswith("socks5://") or proxy.startswith("http://"):
-                proxy_config = {"server": proxy}
-            else:
-                parts = proxy.split(":")
-                if len(parts) >= 4:
-                    ip, port, login, password = parts[0], parts[1], parts[2], ":".join(parts[3:])
-                    proxy_config = {
-                        "server": f"http://{ip}:{port}",
-                        "username": login,
-                        "password": password
-                    }
-                elif len(parts) == 2:
-                    proxy_config = {"server": f"http://{proxy}"}
-            
-            if proxy_config:
-                logger.info(f"🌐 Используется прокси: {proxy[:40]}...")
-        
-        # Запуск браузера с параметрами для обхода детекции
-        self.browser = await self.playwright.chromium.launch(
-            headless=HEADLESS_MODE,
-            args=[
-                '--no-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-blink-features=AutomationControlled',
-                '--disable-features=IsolateOrigins,site-per-process',
-            ]
-        )
-        
-        # Создание контекста с маскировкой
-        self.context = await self.browser.new_context(
-            viewport={"width": 1920, "height": 1080},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            locale="ru-RU",
-            timezone_id="Europe/Moscow",
-            proxy=proxy_config,
-            java_script_enabled=True,
-            bypass_csp=True,
-            ignore_https_errors=True,
-            extra_http_headers={
-                "Accept-Language": "ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8",
-                "Accept-Encoding": "gzip, deflate, br",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "none",
-                "Sec-Fetch-User": "?1",
-                "Cache-Control": "max-age=0",
-            }
-        )
+    def warmup_skip_rate(self) -> float:
+        """Доля проверок, обошедшихся без warm-up"""
+        total = self.warmups_run + self.warmups_skipped
+        return self.warmups_skipped / total if total else 0.0
+    
+    @asynccontextmanager
+    async def _proxy_slot(self, trial: bool = True):
+        """Захват прокси с учетом лимита одновременных проверок
         
-        # Скрипты для маскировки автоматизации
-        await self.context.add_init_script("""
-            // Удаляем navigator.webdriver
-            Object.defineProperty(navigator, 'webdriver', {
-                get: () => undefined
-            });
-            
-            // Добавляем window.chrome
-            window.chrome = {
-                runtime: {},
-                loadTimes: function() {},
-                csi: function() {},
-                app: {}
-            };
-            
-            // Настраиваем plugins
-            Object.defineProperty(navigator, 'plugins', {
-                get: () => [1, 2, 3, 4, 5]
-            });
-            
-            // Настраиваем languages
-            Object.defineProperty(navigator, 'languages', {
-                get: () => ['ru-RU', 'ru', 'en-US', 'en']
-            });
-            
-            // Маскируем permissions
-            const originalQuery = window.navigator.permissions.query;
-            window.navigator.permissions.query = (parameters) => (
-                parameters.name === 'notifications' ?
-                    Promise.resolve({ state: Notification.permission }) :
-                    originalQuery(parameters)
-            );
-        """)
+        trial=False - без прокси на испытании: исход такой проверки не учитывается.
+        """
+        if self.registry:
+            # stat файла не чаще раза в секунду
+            self.registry.refresh()
+        if not self.max_per_proxy:
+            proxy = self._get_next_proxy(trial=trial)
+            try:
+                yield proxy
+            finally:
+                self._release_trial(proxy)
+            return
         
-        self.page = await self.context.new_page()
-        self.page.set_default_timeout(PARSER_TIMEOUT)
-        self.page.set_default_navigation_timeout(PARSER_TIMEOUT)
+        async with self._proxy_released:
+            proxy = None
+            while True:
+                # Выбираем среди прокси со свободным слотом
+                if self._proxy_list:
+                    free = [p for p in self._proxy_list if self._proxy_in_use.get(p, 0) < self.max_per_proxy]
+                    if free:
+                        proxy = self._get_next_proxy(free, trial)
+                        break
+                elif self._proxy_in_use.get(None, 0) < self.max_per_proxy:
+                    break
+                await self._proxy_released.wait()
+            self._proxy_in_use[proxy] = self._proxy_in_use.get(proxy, 0) + 1
         
-        logger.info("✅ Браузер Playwright запущен")
+        try:
+            yield proxy
+        finally:
+            self._release_trial(proxy)
+            async with self._proxy_released:
+                self._proxy_in_use[proxy] -= 1
+                self._proxy_released.notify_all()
+    
+    def _release_trial(self, proxy: Optional[str]):
+        """Испытание прокси, исход которого не учтен (ошибка до загрузки страницы), снова доступно"""
+        if self.health:
+            self.health.release(proxy)
     
-    async def _simulate_human_behavior(self):
+    async def _human_delay(self, min_sec: float = 1.0, max_sec: float = 3.0):
+        """Имитация человеческой задержки между действиями"""
+        await asyncio.sleep(random.uniform(min_sec, max_sec))
+    
+    async def _simulate_human_behavior(self, page):
         """Имитация человеческого поведения на странице"""
-        if not self.page:
+        if not page:
             return
         
         try:
@@ -172,14 +174,14 @@ class OzonParser:
             for _ in range(random.randint(2, 4)):
                 x = random.randint(100, 800)
                 y = random.randint(100, 600)
-                await self.page.mouse.move(x, y, steps=random.randint(5, 15))
+                await page.mouse.move(x, y, steps=random.randint(5, 15))
                 await self._human_delay(0.1, 0.3)
             
             # Плавный скролл
             scroll_steps = random.randint(2, 5)
             for _ in range(scroll_steps):
                 scroll_amount = random.randint(100, 300)
-                await self.page.evaluate(f"""
+                await page.evaluate(f"""
                     window.scrollBy({{
                         top: {scroll_amount},
                         left: 0,
@@ -189,22 +191,22 @@ class OzonParser:
                 await self._human_delay(0.3, 0.7)
             
             # Возврат наверх
-            await self.page.evaluate("window.scrollTo({top: 0, behavior: 'smooth'});")
+            await page.evaluate("window.scrollTo({top: 0, behavior: 'smooth'});")
             await self._human_delay(0.3, 0.5)
             
         except Exception as e:
             logger.debug(f"Ошибка при имитации поведения: {e}")
     
-    async def _warm_up(self):
+    async def _warm_up(self, page):
         """Warm-up: загрузка главной страницы для создания сессии"""
-        if not self.page:
+        if not page:
             return False
         
         try:
             logger.info("🔥 Warm-up: загружаю главную страницу OZON...")
-            await self.page.goto("https://www.ozon.ru", wait_until='domcontentloaded', timeout=30000)
+            await page.goto(self.base_url, wait_until='domcontentloaded', timeout=30000)
             await self._human_delay(2, 4)
-            await self._simulate_human_behavior()
+            await self._simulate_human_behavior(page)
             await self._human_delay(1, 2)
             logger.info("✅ Warm-up завершен")
             return True
@@ -212,55 +214,17 @@ class OzonParser:
             logger.warning(f"⚠️ Warm-up не удался: {e}")
             return False
     
-    async def _close_browser(self):
-        """Закрытие браузера"""
-        try:
-            if self.page:
-                await self.page.close()
-                self.page = None
-            if self.context:
-                await self.context.close()
-                self.context = None
-            if self.browser:
-                await self.browser.close()
-                self.browser = None
-            if self.playwright:
-                await self.playwright.stop()
-                self.playwright = None
-        except Exception:
-            pass
-    
-    def _detect_antibot(self, html: str) -> bool:
+    def _detect_antibot(self, html: str, page_class: Optional[PageClass] = None) -> bool:
         """Обнаружение антибот защиты"""
-        html_lower = html.lower()
-        
-        antibot_keywords = [
-            'antibot', 'доступ ограничен', 'access denied', 'captcha',
-            'подтвердите, что вы не робот', 'я не робот', 'recaptcha',
-            'hcaptcha', 'cloudflare', 'checking your browser', 'just a moment',
-            'fastly', 'bot management', 'challenge', 'fab_chlg_',
-        ]
-        
-        for keyword in antibot_keywords:
-            if keyword in html_lower:
-                logger.debug(f"🔍 Обнаружен антибот: {keyword}")
-                return True
-        
-        # Проверка по размеру HTML без контента OZON
-        if 150000 < len(html) < 250000:
-            ozon_indicators = [
-                'data-widget="webProductHeading"',
-                'data-widget="webPrice"',
-                'ozon.ru/product/',
-            ]
-            if not any(indicator in html for indicator in ozon_indicators):
-                return True
-        
-        return False
+        page_class = page_class or classify_page(html)
+        if page_class.antibot_keyword:
+            logger.debug(f"🔍 Обнаружен антибот: {page_class.antibot_keyword}")
+        # Без ключевого слова - страница размера заглушки без контента OZON
+        return page_class.is_antibot
     
-    async def _bypass_antibot(self, max_attempts: int = 3) -> bool:
+    async def _bypass_antibot(self, page, max_attempts: int = 3) -> bool:
         """Попытка обхода антибот защиты"""
-        if not self.page:
+        if not page:
             return False
         
         logger.info("🔄 Пытаюсь обойти антибот защиту...")
@@ -271,30 +235,30 @@ class OzonParser:
                 
                 # 1. Ищем и нажимаем кнопку "Обновить"
                 try:
-                    reload_button = await self.page.query_selector("#reload-button")
+                    reload_button = await page.query_selector("#reload-button")
                     if reload_button:
                         await reload_button.click()
                         logger.info("✅ Нажата кнопка 'Обновить'")
                         await self._human_delay(8, 12)
                         
-                        html = await self.page.content()
+                        html = await page.content()
                         if not self._detect_antibot(html):
                             return True
                 except Exception:
                     pass
                 
                 # 2. Имитация человеческого поведения
-                await self._simulate_human_behavior()
+                await self._simulate_human_behavior(page)
                 await self._human_delay(2, 4)
                 
-                html = await self.page.content()
+                html = await page.content()
                 if not self._detect_antibot(html):
                     return True
                 
                 # 3. Ожидание автоматического прохождения
                 for _ in range(5):
                     await self._human_delay(2, 4)
-                    html = await self.page.content()
+                    html = await page.content()
                     if not self._detect_antibot(html):
                         logger.info("✅ Антибот пройден автоматически!")
                         return True
@@ -302,10 +266,10 @@ class OzonParser:
                 # 4. Перезагрузка страницы
                 if attempt < max_attempts:
                     logger.info("🔄 Перезагружаю страницу...")
-                    await self.page.reload(wait_until='domcontentloaded', timeout=30000)
+                    await page.reload(wait_until='domcontentloaded', timeout=30000)
                     await self._human_delay(3, 6)
                     
-                    html = await self.page.content()
+                    html = await page.content()
                     if not self._detect_antibot(html):
                         return True
                     
@@ -315,9 +279,9 @@ class OzonParser:
         logger.warning("⚠️ Не удалось обойти антибот защиту")
         return False
     
-    async def _wait_for_content(self):
+    async def _wait_for_content(self, page):
         """Ожидание появления контента товара"""
-        if not self.page:
+        if not page:
             return
         
         selectors = [
@@ -328,7 +292,7 @@ class OzonParser:
         
         for selector in selectors:
             try:
-                await self.page.wait_for_selector(selector, timeout=8000)
+                await page.wait_for_selector(selector, timeout=8000)
                 return
             except Exception:
                 continue
@@ -348,124 +312,273 @@ class OzonParser:
         except Exception:
             return "Неизвестный товар"
     
-    def _parse_price(self, html: str, soup) -> Optional[float]:
+    def _price_from_widget_text(self, price_text: str) -> Optional[float]:
+        """Цена из текста виджета webPrice"""
+        # Ищем цену (число с пробелами + ₽)
+        match = re.search(r'([\d\s]+)\s*₽', price_text)
+        if match:
+            price = float(match.group(1).replace(' ', '').replace('\xa0', ''))
+            if PRICE_MIN <= price <= PRICE_MAX:
+                return price
+        return None
+    
+    def _parse_price(self, html: str, soup, page_class: Optional[PageClass] = None) -> Optional[float]:
         """Парсинг цены"""
         try:
             # 1. Поиск по data-widget="webPrice"
             price_widget = soup.find(attrs={'data-widget': 'webPrice'})
             if price_widget:
-                price_text = price_widget.get_text()
-                # Ищем цену (число с пробелами + ₽)
-                match = re.search(r'([\d\s]+)\s*₽', price_text)
-                if match:
-                    price = float(match.group(1).replace(' ', '').replace('\xa0', ''))
-                    if PRICE_MIN <= price <= PRICE_MAX:
-                        return price
-            
-            # 2. Поиск по паттернам в HTML
-            patterns = [
-                r'(\d[\d\s]{2,})\s*₽',
-                r'₽\s*(\d[\d\s]{2,})',
-            ]
+                price = self._price_from_widget_text(price_widget.get_text())
+                if price:
+                    return price
             
-            for pattern in patterns:
-                match = re.search(pattern, html)
-                if match:
-                    price = float(match.group(1).replace(' ', '').replace('\xa0', ''))
-                    if PRICE_MIN <= price <= PRICE_MAX:
-                        return price
+            # 2. Кандидаты "1 299 ₽" и "₽ 1 299", найденные классификатором
+            page_class = page_class or classify_page(html)
+            for candidate in page_class.price_candidates():
+                price = float(candidate.replace(' ', '').replace('\xa0', ''))
+                if PRICE_MIN <= price <= PRICE_MAX:
+                    return price
             
             return None
         except Exception:
             return None
     
-    def _parse_stock(self, html: str) -> tuple:
+    def _parse_stock(self, html: str, page_class: Optional[PageClass] = None) -> tuple:
         """Парсинг наличия"""
-        text = html.lower()
-        if any(p in text for p in ['нет в наличии', 'закончился', 'товар закончился']):
+        page_class = page_class or classify_page(html)
+        if page_class.out_of_stock:
             return False, "Нет в наличии"
         return True, "В наличии"
     
+    def _widget_fragments(self, html: str) -> str:
+        """Куски HTML вокруг заголовка и виджета цены (без разбора всего документа)"""
+        fragments = []
+        for marker in WIDGET_MARKERS:
+            idx = html.find(marker)
+            if idx != -1:
+                start = html.rfind('<', 0, idx + 1)
+                fragments.append(html[start:start + WIDGET_FRAGMENT_SIZE])
+        return ''.join(fragments)
+    
+    def _parse_html(self, html: str, page_class: Optional[PageClass] = None) -> Optional[Dict]:
+        """Разбор сохраненного HTML: дерево строится только для нужных виджетов"""
+        page_class = page_class or classify_page(html)
+        # bs4 нужен только для разбора HTML - импорт при первом использовании
+        from bs4 import BeautifulSoup, SoupStrainer
+        
+        strainer = SoupStrainer(lambda name, attrs: name == 'h1' or (attrs or {}).get('data-widget') == 'webPrice')
+        soup = BeautifulSoup(self._widget_fragments(html) or html, 'html.parser', parse_only=strainer)
+        price = self._parse_price(html, soup, page_class)
+        if not price:
+            return None
+        in_stock, stock_text = self._parse_stock(html, page_class)
+        return {
+            'name': self._parse_name(soup),
+            'price': price,
+            'in_stock': in_stock,
+            'stock_quantity': stock_text,
+        }
+    
+    async def _extract_in_page(self, page) -> Optional[Dict]:
+        """Извлечение названия, цены и наличия на странице без копии DOM"""
+        try:
+            data = await page.evaluate(EXTRACT_SCRIPT, STOCK_WIDGETS_SELECTOR)
+        except Exception as e:
+            logger.debug(f"Ошибка извлечения на странице: {e}")
+            return None
+        
+        price = self._price_from_widget_text(data['priceText']) if data.get('priceText') else None
+        if not price:
+            return None
+        in_stock = not widgets_out_of_stock(data.get('stockHtml') or '')
+        return {
+            'name': (data.get('name') or '').strip()[:100] or "Неизвестный товар",
+            'price': price,
+            'in_stock': in_stock,
+            'stock_quantity': "В наличии" if in_stock else "Нет в наличии",
+        }
+    
+    async def _try_fast_path(self, url: str) -> Optional[Dict]:
+        """Попытка получить данные по HTTP с cookies сохраненной сессии"""
+        sku = extract_sku(url)
+        if not self.fast_path or not self.pool.sessions or not sku:
+            return None
+        
+        # Исход быстрого пути в статистику прокси не идет - прокси на испытании не берем
+        async with self._proxy_slot(trial=False) as proxy:
+            if proxy is None and self._proxy_list:
+                # Все прокси в карантине или на испытании - проверит браузер
+                return None
+            if not self.fast_path.is_available(proxy):
+                return None
+            storage_state = self.pool.sessions.load_path(proxy)
+            if not storage_state:
+                return None
+            result = await self.fast_path.fetch(sku, proxy, storage_state)
+        
+        if result:
+            logger.info(f"⚡ Быстрый путь: {result['name'][:40]}... = {result['price']:.0f} ₽")
+        return result
+    
     async def parse_product_async(self, url: str) -> Optional[Dict]:
         """Асинхронный парсинг товара"""
         max_attempts = 2
         
+        with STAGE_SECONDS.time(stage='fast_path'):
+            result = await self._try_fast_path(url)
+        if result:
+            PARSE_ATTEMPTS.inc(result='fast_path')
+            return result
+        
         for attempt in range(1, max_attempts + 1):
+            # Исход проверки через захваченный прокси еще не учтен
+            unrecorded = False
             try:
                 logger.info(f"🔄 Попытка {attempt}/{max_attempts} парсинга: {url[:50]}...")
                 
-                # Получаем прокси
-                proxy = self._get_next_proxy()
-                
-                # Инициализация браузера
-                await self._setup_browser(proxy)
-                
-                # Warm-up при первой попытке
-                if attempt == 1:
-                    await self._warm_up()
-                
-                # Загрузка страницы товара
-                logger.info("📥 Загружаю страницу товара...")
-                try:
-                    await self.page.goto(url, wait_until='domcontentloaded', timeout=PARSER_TIMEOUT)
-                except Exception as e:
-                    logger.warning(f"⚠️ Таймаут загрузки: {e}")
-                
-                await self._wait_for_content()
-                await self._human_delay(PAGE_LOAD_DELAY, PAGE_LOAD_DELAY + 2)
-                
-                html = await self.page.content()
-                logger.info(f"📄 Страница загружена ({len(html):,} байт)")
-                
-                # Проверка на антибот
-                if self._detect_antibot(html):
-                    logger.warning("🚫 Обнаружена антибот защита")
-                    if await self._bypass_antibot():
-                        html = await self.page.content()
-                    else:
-                        await self._close_browser()
-                        continue
+                # Прокси (с учетом лимита) и страница из пула браузеров
+                async with self._proxy_slot() as proxy, self.pool.lease(proxy) as page:
+                    unrecorded = True
+                    # Warm-up при первой попытке, если у контекста нет живой сессии
+                    if attempt == 1:
+                        if self.pool.needs_warm_up(page):
+                            self.warmups_run += 1
+                            with STAGE_SECONDS.time(stage='warm_up'):
+                                warmed = await self._warm_up(page)
+                            if warmed:
+                                await self.pool.save_session(page)
+                        else:
+                            self.warmups_skipped += 1
+                            logger.info(f"🍪 Warm-up пропущен: сессия действительна ({self.warmup_skip_rate():.0%} пропусков)")
+                    
+                    # Загрузка страницы товара
+                    logger.info("📥 Загружаю страницу товара...")
+                    started = time.monotonic()
+                    outcome = OK
+                    try:
+                        with STAGE_SECONDS.time(stage='goto'):
+                            await page.goto(url, wait_until='domcontentloaded', timeout=PARSER_TIMEOUT)
+                    except Exception as e:
+                        logger.warning(f"⚠️ Таймаут загрузки: {e}")
+                        outcome = FAILED
+                    
+                    with STAGE_SECONDS.time(stage='wait_for_content'):
+                        await self._wait_for_content(page)
+                    latency = time.monotonic() - started
+                    with STAGE_SECONDS.time(stage='page_load_delay'):
+                        await self._human_delay(PAGE_LOAD_DELAY, PAGE_LOAD_DELAY + 2)
+                    final_url = page.url
+                    
+                    traffic = self.pool.traffic(page)
+                    if traffic:
+                        logger.info(
+                            f"🧹 Отброшено запросов: {traffic['blocked']} "
+                            f"(~{traffic['saved_bytes'] // 1024:,} КБ сэкономлено), "
+                            f"загружено {traffic['loaded_bytes'] // 1024:,} КБ"
+                        )
+                    
+                    # Цена найдена на странице - это точно не антибот, весь HTML не нужен
+                    result = None
+                    if self.extraction_mode == 'dom':
+                        with STAGE_SECONDS.time(stage='extract'):
+                            result = await self._extract_in_page(page)
+                    
+                    if result is None:
+                        html = await page.content()
+                        logger.info(f"📄 Страница загружена ({len(html):,} байт)")
+                        
+                        # Проверка на антибот (классификация переиспользуется при разборе)
+                        page_class = classify_page(html)
+                        if self._detect_antibot(html, page_class):
+                            logger.warning("🚫 Обнаружена антибот защита")
+                            self.pool.flag_session(page)
+                            with STAGE_SECONDS.time(stage='bypass_antibot'):
+                                bypassed = await self._bypass_antibot(page)
+                            if bypassed:
+                                if self.health and self._proxy_list:
+                                    self.health.record_antibot(proxy)
+                                html = await page.content()
+                                page_class = None
+                                final_url = page.url
+                                await self.pool.save_session(page)
+                            else:
+                                # Контекст скомпрометирован - пул пересоздаст его
+                                self.pool.discard(page)
+                                unrecorded = False
+                                self._record_check(proxy, ANTIBOT, traffic=traffic)
+                                PARSE_ATTEMPTS.inc(result='antibot')
+                                continue
+                    
+                    # Страница загружена через прокси, даже если цены на ней нет
+                    unrecorded = False
+                    self._record_check(proxy, outcome, latency, traffic)
                 
                 # Парсинг данных
-                soup = BeautifulSoup(html, 'html.parser')
-                name = self._parse_name(soup)
-                price = self._parse_price(html, soup)
+                if result is None:
+                    with STAGE_SECONDS.time(stage='parse'):
+                        result = self._parse_html(html, page_class)
                 
-                if price:
-                    in_stock, stock_text = self._parse_stock(html)
-                    result = {
-                        'name': name,
-                        'price': price,
-                        'in_stock': in_stock,
-                        'stock_quantity': stock_text,
-                    }
-                    logger.info(f"✅ НАЙДЕНО: {name[:40]}... = {price:.0f} ₽")
-                    await self._close_browser()
+                if result:
+                    # SKU по итоговой ссылке (короткие /t/ раскрываются редиректом)
+                    result['url'] = final_url
+                    result['sku'] = extract_sku(final_url) or extract_sku(url)
+                    logger.info(f"✅ НАЙДЕНО: {result['name'][:40]}... = {result['price']:.0f} ₽")
+                    PARSE_ATTEMPTS.inc(result='ok')
                     return result
                 else:
                     logger.warning("❌ Цена не найдена")
-                    await self._close_browser()
+                    PARSE_ATTEMPTS.inc(result='no_price')
                     
             except Exception as e:
                 logger.error(f"❌ Ошибка в попытке {attempt}: {e}")
-                await self._close_browser()
+                PARSE_ATTEMPTS.inc(result='error')
+                if unrecorded:
+                    self._record_check(proxy, FAILED)
         
         logger.error("❌ Все попытки парсинга неудачны")
         return None
     
+    async def close(self):
+        """Закрытие пула браузеров и HTTP-сессии"""
+        if self.health:
+            await self.health.close()
+        if self.fast_path:
+            await self.fast_path.close()
+        await self.pool.close()
+    
     def parse_product(self, url: str, **kwargs) -> Optional[Dict]:
-        """Синхронная обертка для парсинга (для совместимости)"""
+        """Синхронная обертка для ручного теста (__main__)
+        
+        Бот и планировщик вызывают parse_product_async в своем цикле событий.
+        """
         try:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self.parse_product_async(url))
-            loop.close()
+            try:
+                result = loop.run_until_complete(self.parse_product_async(url))
+            finally:
+                # Браузеры привязаны к этому циклу событий - закрываем вместе с ним
+                loop.run_until_complete(self.close())
+                loop.close()
             return result
         except Exception as e:
             logger.error(f"Ошибка парсинга: {e}")
             return None
 
 
+def parser_from_config(max_per_proxy: Optional[int] = None) -> OzonParser:
+    """Парсер с настройками из config.py (общий для бота и планировщика)"""
+    import config
+    
+    return OzonParser(
+        pool=pool_from_config(),
+        max_per_proxy=max_per_proxy,
+        fast_path=fast_path_from_config(),
+        extraction_mode=config.EXTRACTION_MODE,
+        health=proxy_health_from_config(),
+    )
+
+
 # Тест
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -0,0 +1,405 @@
+"""
+Здоровье прокси и выбор прокси по нему
+
+По каждому прокси копится статистика проверок через браузер: доля
+успешных, доля страниц антибота, задержка страницы (p50/p95) и трафик.
+Прокси выбирается случайно с весом по этой статистике, а не по кругу,
+поэтому мертвый или заблокированный прокси почти не получает проверок.
+После нескольких неудач подряд прокси уходит в карантин (с каждым разом
+дольше), по окончании карантина - на испытание одной проверкой. Статистика
+хранится в JSON под RUNTIME_DIR и переживает перезапуск. Бот, планировщик
+и воркеры пишут в один файл под блокировкой: счетчики проверок процессов
+складываются, а скользящие доли, задержки и карантин берутся из более
+свежей записи прокси.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+# Настройки по умолчанию
+QUARANTINE_FAILURES = 3  # неудач подряд до карантина
+QUARANTINE_BASE = 600  # секунды, удваивается с каждым карантином
+QUARANTINE_MAX = 6 * 3600
+SMOOTHING = 0.2  # вес новой проверки в скользящих долях
+LATENCY_WINDOW = 50  # последних проверок для p50/p95
+LATENCY_REF = 15.0  # секунды; страница медленнее снижает вес прокси
+MIN_WEIGHT = 0.02  # даже слабый прокси иногда проверяется
+PROBATION_WEIGHT = 0.5
+SAVE_INTERVAL = 30  # секунды между записями файла
+
+# Счетчики, которые складываются при слиянии статистики процессов
+COUNTERS = ('checks', 'successes', 'antibot_hits', 'bytes')
+
+# Исходы проверки
+OK = 'ok'
+ANTIBOT = 'antibot'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def proxy_key(proxy: Optional[str]) -> str:
+    """Ключ прокси в файле статистики (без пароля прокси)"""
+    return hashlib.sha1((proxy or "direct").encode()).hexdigest()[:16]
+
+
+def _percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+
+class ProxyStats:
+    """Статистика одного прокси"""
+
+    def __init__(self):
+        self.checks = 0
+        self.successes = 0
+        self.antibot_hits = 0
+        self.bytes = 0
+        # Скользящие доли: новый прокси считается здоровым
+        self.ok_rate = 1.0
+        self.antibot_rate = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.failures_in_row = 0
+        self.quarantines = 0
+        self.quarantined_until = 0.0
+        self.probation = False
+        self.updated_at = 0.0
+        # Приращения счетчиков этого процесса, еще не записанные в файл
+        self.pending = dict.fromkeys(COUNTERS, 0)
+
+    def count(self, name: str, amount: int = 1):
+        setattr(self, name, getattr(self, name) + amount)
+        self.pending[name] += amount
+
+    def merge(self, saved: "ProxyStats"):
+        """Слияние с записью из файла: счетчики из файла плюс свои незаписанные"""
+        for name in COUNTERS:
+            setattr(self, name, getattr(saved, name) + self.pending[name])
+        if saved.updated_at > self.updated_at:
+            self.ok_rate = saved.ok_rate
+            self.antibot_rate = saved.antibot_rate
+            self.latencies = saved.latencies
+            self.failures_in_row = saved.failures_in_row
+            self.quarantines = saved.quarantines
+            self.quarantined_until = saved.quarantined_until
+            self.probation = saved.probation
+            self.updated_at = saved.updated_at
+
+    def p50(self) -> Optional[float]:
+        return _percentile(list(self.latencies), 0.5)
+
+    def p95(self) -> Optional[float]:
+        return _percentile(list(self.latencies), 0.95)
+
+    def weight(self) -> float:
+        """Вес прокси при выборе"""
+        if self.probation:
+            return PROBATION_WEIGHT
+        p50 = self.p50() or 0
+        weight = self.ok_rate * (1 - self.antibot_rate) * LATENCY_REF / max(LATENCY_REF, p50)
+        return max(MIN_WEIGHT, weight)
+
+    def to_dict(self) -> Dict:
+        return {
+            'checks': self.checks,
+            'successes': self.successes,
+            'antibot_hits': self.antibot_hits,
+            'bytes': self.bytes,
+            'ok_rate': self.ok_rate,
+            'antibot_rate': self.antibot_rate,
+            'latencies': [round(value, 2) for value in self.latencies],
+            'failures_in_row': self.failures_in_row,
+            'quarantines': self.quarantines,
+            'quarantined_until': self.quarantined_until,
+            'probation': self.probation,
+            'updated_at': self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ProxyStats":
+        stats = cls()
+        for name, value in data.items():
+            if name == 'latencies':
+                stats.latencies.extend(value)
+            elif hasattr(stats, name):
+                setattr(stats, name, value)
+        return stats
+
+
+class ProxyHealth:
+    """Статистика прокси, карантин и взвешенный выбор"""
+
+    def __init__(self, path: Optional[str] = None, quarantine_failures: int = QUARANTINE_FAILURES,
+                 quarantine_base: float = QUARANTINE_BASE, quarantine_max: float = QUARANTINE_MAX):
+        self.path = path
+        self.quarantine_failures = quarantine_failures
+        self.quarantine_base = quarantine_base
+        self.quarantine_max = quarantine_max
+        self._stats: Dict[str, ProxyStats] = {}
+        # Прокси на испытании, проверка которых уже идет
+        self._trials = set()
+        self._saved_at = 0.0
+        # Запись файла в потоке, начатая из цикла событий
+        self._saving: Optional[asyncio.Future] = None
+        self.reload()
+
+    def get(self, proxy: Optional[str]) -> ProxyStats:
+        key = proxy_key(proxy)
+        if key not in self._stats:
+            self._stats[key] = ProxyStats()
+        return self._stats[key]
+
+    def _available(self, proxy: str, now: float) -> bool:
+        stats = self.get(proxy)
+        if stats.quarantined_until > now:
+            return False
+        if stats.quarantined_until:
+            # Карантин закончился - одна проверка на испытание
+            stats.quarantined_until = 0.0
+            stats.probation = True
+            logger.info(f"🩺 Прокси {proxy_key(proxy)}: конец карантина, испытание")
+        return not (stats.probation and proxy_key(proxy) in self._trials)
+
+    def choose(self, proxies: Iterable[str], trial: bool = True) -> Optional[str]:
+        """Прокси для проверки: случайный с весом по здоровью
+
+        Если все прокси в карантине, берется тот, чей карантин кончается раньше.
+        trial=False - без прокси на испытании (проверка, исход которой не учитывается);
+        если все прокси в карантине или на испытании - None.
+        Испытание прокси заканчивается record() или release().
+        """
+        proxies = list(proxies)
+        if not proxies:
+            return None
+        now = time.time()
+        candidates = [proxy for proxy in proxies
+                      if self._available(proxy, now) and (trial or not self.get(proxy).probation)]
+        if not candidates:
+            if not trial:
+                return None
+            return min(proxies, key=lambda proxy: self.get(proxy).quarantined_until)
+        proxy = random.choices(candidates, weights=[self.get(p).weight() for p in candidates])[0]
+        if self.get(proxy).probation:
+            self._trials.add(proxy_key(proxy))
+        return proxy
+
+    def release(self, proxy: Optional[str]):
+        """Конец проверки через прокси: испытание без учтенного исхода снова доступно"""
+        self._trials.discard(proxy_key(proxy))
+
+    def record(self, proxy: Optional[str], outcome: str, latency: Optional[float] = None,
+               loaded_bytes: int = 0):
+        """Учет проверки через прокси: OK, ANTIBOT (страница антибота не пройдена) или FAILED
+
+        Антибот, пройденный при проверке, учитывается отдельно - record_antibot().
+        """
+        stats = self.get(proxy)
+        self._trials.discard(proxy_key(proxy))
+        success = outcome == OK
+        stats.count('checks')
+        stats.count('successes', success)
+        stats.count('bytes', loaded_bytes)
+        stats.ok_rate += SMOOTHING * (success - stats.ok_rate)
+        if outcome == ANTIBOT:
+            self.record_antibot(proxy)
+        else:
+            stats.antibot_rate *= 1 - SMOOTHING
+        if latency is not None and success:
+            stats.latencies.append(latency)
+        stats.updated_at = time.time()
+
+        if success:
+            if stats.probation:
+                logger.info(f"🩺 Прокси {proxy_key(proxy)}: испытание пройдено")
+                stats.quarantines = max(0, stats.quarantines - 1)
+            stats.probation = False
+            stats.failures_in_row = 0
+        else:
+            stats.failures_in_row += 1
+            if stats.probation or stats.failures_in_row >= self.quarantine_failures:
+                self._quarantine(proxy, stats)
+        self._save_soon()
+
+    def record_antibot(self, proxy: Optional[str]):
+        """Страница антибота через прокси (даже если ее удалось пройти)"""
+        stats = self.get(proxy)
+        stats.count('antibot_hits')
+        stats.antibot_rate += SMOOTHING * (1 - stats.antibot_rate)
+
+    def _quarantine(self, proxy: Optional[str], stats: ProxyStats):
+        duration = min(self.quarantine_max, self.quarantine_base * 2 ** stats.quarantines)
+        stats.quarantines += 1
+        stats.quarantined_until = time.time() + duration
+        stats.probation = False
+        stats.failures_in_row = 0
+        logger.warning(f"🚧 Прокси {proxy_key(proxy)} в карантине на {duration / 60:.0f} мин")
+
+    def describe(self, proxy: Optional[str]) -> str:
+        """Краткая статистика прокси для /proxy_list"""
+        stats = self._stats.get(proxy_key(proxy))
+        if not stats or not stats.checks:
+            return "нет проверок"
+        parts = [
+            f"{stats.successes}/{stats.checks} ок",
+            f"антибот {stats.antibot_hits / stats.checks:.0%}",
+        ]
+        if stats.latencies:
+            parts.append(f"{stats.p50():.0f}/{stats.p95():.0f} с")
+        parts.append(f"{stats.bytes / stats.checks / 1024:,.0f} КБ")
+        if stats.quarantined_until > time.time():
+            parts.append(f"🚧 карантин до {time.strftime('%H:%M', time.localtime(stats.quarantined_until))}")
+        elif stats.probation:
+            parts.append("🩺 испытание")
+        return ", ".join(parts)
+
+    def _read(self) -> Dict[str, ProxyStats]:
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return {key: ProxyStats.from_dict(value) for key, value in data.items()}
+
+    def reload(self):
+        """Слияние со статистикой из файла (ее пишут и другие процессы)"""
+        for key, saved in self._read().items():
+            if key in self._stats:
+                self._stats[key].merge(saved)
+            else:
+                self._stats[key] = saved
+
+    def _due(self, force: bool = False) -> bool:
+        """Пора писать файл (не чаще SAVE_INTERVAL)"""
+        if not self.path or (not force and time.monotonic() - self._saved_at < SAVE_INTERVAL):
+            return False
+        self._saved_at = time.monotonic()
+        return True
+
+    def _snapshot(self) -> Dict[str, ProxyStats]:
+        """Копия статистики с незаписанными приращениями - для записи вне цикла событий"""
+        snapshot = {}
+        for key, stats in self._stats.items():
+            copy = ProxyStats.from_dict(stats.to_dict())
+            copy.pending = dict(stats.pending)
+            snapshot[key] = copy
+        return snapshot
+
+    def _write_merged(self, snapshot: Dict[str, ProxyStats]) -> Dict[str, ProxyStats]:
+        """Слияние снимка с файлом и запись; возвращает записанную статистику
+
+        Чтение, слияние и запись - под блокировкой, иначе приращения другого процесса теряются.
+        """
+        tmp_path = None
+        try:
+            with open(f"{self.path}.lock", 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                saved = self._read()
+                for key, stats in snapshot.items():
+                    if key in saved:
+                        stats.merge(saved[key])
+                    saved[key] = stats
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or '.', suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({key: stats.to_dict() for key, stats in saved.items()}, f)
+                os.replace(tmp_path, self.path)
+                tmp_path = None
+                return saved
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def _apply_saved(self, snapshot: Dict[str, ProxyStats], saved: Dict[str, ProxyStats]):
+        """Записанные приращения снимаются с незаписанных, счетчики и состояние - из файла"""
+        for key, stats in snapshot.items():
+            live = self._stats[key]
+            for name in COUNTERS:
+                live.pending[name] -= stats.pending[name]
+        for key, stats in saved.items():
+            if key in self._stats:
+                self._stats[key].merge(stats)
+            else:
+                stats.pending = dict.fromkeys(COUNTERS, 0)
+                self._stats[key] = stats
+
+    def _save_soon(self):
+        """Запись после проверки: в цикле событий - в потоке, чтобы блокировка файла его не держала"""
+        if self._saving is not None and not self._saving.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.save()
+            return
+        if not self._due():
+            return
+        snapshot = self._snapshot()
+        self._saving = loop.run_in_executor(None, self._write_merged, snapshot)
+        self._saving.add_done_callback(lambda future: self._saved(snapshot, future))
+
+    def _saved(self, snapshot: Dict[str, ProxyStats], future: asyncio.Future):
+        if future.cancelled():
+            return
+        if future.exception():
+            logger.debug(f"Не удалось сохранить статистику прокси: {future.exception()}")
+            return
+        self._apply_saved(snapshot, future.result())
+
+    def save(self, force: bool = False):
+        """Запись статистики (не чаще SAVE_INTERVAL, атомарная замена файла) в текущем потоке"""
+        if self._saving is not None and not self._saving.done():
+            return
+        if not self._due(force):
+            return
+        snapshot = self._snapshot()
+        try:
+            saved = self._write_merged(snapshot)
+        except OSError as e:
+            logger.debug(f"Не удалось сохранить статистику прокси: {e}")
+            return
+        self._apply_saved(snapshot, saved)
+
+    async def close(self):
+        """Последняя запись статистики после начатой в потоке"""
+        if self._saving is not None:
+            try:
+                await self._saving
+            except Exception:
+                pass
+        if not self._due(force=True):
+            return
+        snapshot = self._snapshot()
+        try:
+            saved = await asyncio.get_running_loop().run_in_executor(None, self._write_merged, snapshot)
+        except OSError as e:
+            logger.debug(f"Не удалось сохранить статистику прокси: {e}")
+            return
+        self._apply_saved(snapshot, saved)
+
+
+def proxy_health_from_config() -> ProxyHealth:
+    """Статистика прокси с настройками из config.py"""
+    import config
+
+    return ProxyHealth(
+        config.PROXY_STATS_PATH,
+        quarantine_failures=config.PROXY_QUARANTINE_FAILURES,
+        quarantine_base=config.PROXY_QUARANTINE_BASE,
+        quarantine_max=config.PROXY_QUARANTINE_MAX,
+    )
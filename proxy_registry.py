@@ -0,0 +1,156 @@
+"""
+Общий реестр прокси
+
+Список прокси хранится в proxies.txt (его можно править и вручную), а
+процессы держат его в памяти. Реестр проверяет mtime, размер и inode
+файла не чаще раза в REFRESH_INTERVAL и перечитывает список только после
+изменения - прокси, добавленные через бота, планировщик начинает
+использовать без перезапуска. Подписчики получают новый список при
+каждом изменении. Запись - атомарной заменой файла.
+"""
+
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# Настройки по умолчанию
+REFRESH_INTERVAL = 1.0  # секунды между проверками файла
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_proxy(proxy: str) -> str:
+    """Нормализация формата прокси (пустая строка, если формат неверный)"""
+    proxy = (proxy or "").replace("\u00a0", " ").replace("\u200b", "").strip()
+    if not proxy:
+        return ""
+
+    # IP:PORT:LOGIN:PASSWORD или IP:PORT
+    if re.match(r"^\d{1,3}(\.\d{1,3}){3}:\d{2,5}(:.+:.+)?$", proxy):
+        return proxy
+
+    # socks5:// или http:// URL
+    if proxy.startswith(("socks5://", "http://", "https://")):
+        return proxy
+
+    return ""
+
+
+class ProxyRegistry:
+    """Список прокси в памяти с подхватом изменений файла"""
+
+    def __init__(self, path: str, refresh_interval: float = REFRESH_INTERVAL):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self._proxies: List[str] = []
+        self._signature: Optional[Tuple] = None
+        self._checked_at = 0.0
+        self._listeners: List[Callable[[List[str]], None]] = []
+        self.refresh(force=True)
+
+    def _stat(self) -> Optional[Tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def refresh(self, force: bool = False) -> bool:
+        """Перечитать файл, если он изменился (True - список обновлен)
+
+        force - проверить файл сразу, не дожидаясь REFRESH_INTERVAL.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return False
+        self._checked_at = now
+        signature = self._stat()
+        if signature == self._signature:
+            return False
+
+        proxies = []
+        try:
+            with open(self.path, 'r') as f:
+                for line in f:
+                    normalized = normalize_proxy(line)
+                    if normalized and normalized not in proxies:
+                        proxies.append(normalized)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Ошибка загрузки прокси: {e}")
+            return False
+        self._signature = signature
+        if proxies == self._proxies:
+            return False
+        self._set(proxies)
+        logger.info(f"✅ Загружено {len(proxies)} прокси")
+        return True
+
+    def proxies(self) -> List[str]:
+        """Текущий список прокси"""
+        self.refresh()
+        return list(self._proxies)
+
+    def subscribe(self, callback: Callable[[List[str]], None]):
+        """Вызов callback с текущим списком и после каждого изменения"""
+        self._listeners.append(callback)
+        callback(list(self._proxies))
+
+    def _set(self, proxies: List[str]):
+        self._proxies = proxies
+        for callback in self._listeners:
+            callback(list(proxies))
+
+    def _write(self, proxies: List[str]):
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Свой временный файл: список одновременно могут переписывать бот и планировщик
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write("\n".join(proxies) + ("\n" if proxies else ""))
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._signature = self._stat()
+        self._set(proxies)
+
+    def add(self, candidates: Iterable[str]) -> List[str]:
+        """Добавление прокси; возвращает добавленные (без неверных и дубликатов)"""
+        # Перед записью - свежий список (файл мог изменить другой процесс)
+        self.refresh(force=True)
+        proxies = list(self._proxies)
+        added = []
+        for candidate in candidates:
+            normalized = normalize_proxy(candidate)
+            if normalized and normalized not in proxies:
+                proxies.append(normalized)
+                added.append(normalized)
+        if added:
+            self._write(proxies)
+        return added
+
+    def remove(self, index: int) -> Optional[str]:
+        """Удаление прокси по номеру в списке (с нуля)"""
+        self.refresh(force=True)
+        proxies = list(self._proxies)
+        if index < 0 or index >= len(proxies):
+            return None
+        removed = proxies.pop(index)
+        self._write(proxies)
+        return removed
+
+
+def proxy_registry_from_config() -> ProxyRegistry:
+    """Реестр прокси с настройками из config.py"""
+    import config
+
+    return ProxyRegistry(config.PROXY_STORAGE_PATH, refresh_interval=config.PROXY_REFRESH_INTERVAL)
@@ -0,0 +1,142 @@
+"""
+Фильтрация сетевых запросов контекста Playwright
+
+Для чтения цены не нужны картинки, шрифты, видео, трекеры и реклама.
+Политика отбрасывает тяжелые типы ресурсов и сторонние домены, оставляя
+домены OZON и список разрешенных доменов (например, для антибот-челленджа).
+Экономия считается по каждой странице: число отброшенных запросов и оценка
+сэкономленных байт по типу ресурса.
+"""
+
+import logging
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+# Настройки по умолчанию
+BLOCK_RESOURCE_TYPES = ("image", "media", "font")
+FIRST_PARTY_DOMAINS = ("ozon.ru", "ozone.ru")
+ALLOW_DOMAINS = (
+    "challenges.cloudflare.com",
+    "hcaptcha.com",
+    "recaptcha.net",
+    "google.com",
+    "gstatic.com",
+)
+
+# Средний размер отброшенного ресурса (байт) - точный размер без загрузки неизвестен
+BLOCKED_SIZE_ESTIMATE = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 50_000,
+    "stylesheet": 30_000,
+    "script": 60_000,
+}
+DEFAULT_SIZE_ESTIMATE = 10_000
+
+logger = logging.getLogger(__name__)
+
+
+def _matches(host: str, domains: Iterable[str]) -> bool:
+    """Хост совпадает с доменом или является его поддоменом"""
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class _PageTraffic:
+    """Счетчики трафика одной страницы"""
+
+    def __init__(self):
+        self.blocked = 0
+        self.blocked_by_type: Dict[str, int] = {}
+        self.saved_bytes = 0
+        self.loaded_bytes = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            'blocked': self.blocked,
+            'blocked_by_type': dict(self.blocked_by_type),
+            'saved_bytes': self.saved_bytes,
+            'loaded_bytes': self.loaded_bytes,
+        }
+
+
+class RequestFilter:
+    """Политика маршрутизации запросов для контекстов пула"""
+
+    def __init__(self, block_types: Iterable[str] = BLOCK_RESOURCE_TYPES,
+                 block_third_party: bool = True,
+                 first_party_domains: Iterable[str] = FIRST_PARTY_DOMAINS,
+                 allow_domains: Iterable[str] = ALLOW_DOMAINS):
+        self.block_types = frozenset(block_types)
+        self.block_third_party = block_third_party
+        self.first_party_domains = tuple(first_party_domains)
+        self.allow_domains = tuple(allow_domains)
+
+        self._pages: Dict = {}
+        self.total_blocked = 0
+        self.total_saved_bytes = 0
+
+    def block_reason(self, resource_type: str, url: str) -> Optional[str]:
+        """Причина блокировки запроса или None, если запрос нужен"""
+        host = (urlsplit(url).hostname or "").lower()
+        if not host or _matches(host, self.allow_domains):
+            return None
+        if self.block_third_party and not _matches(host, self.first_party_domains):
+            return "third-party"
+        if resource_type in self.block_types:
+            return resource_type
+        return None
+
+    async def attach(self, context):
+        """Установка политики на контекст"""
+        await context.route("**/*", self._handle_route)
+        context.on("response", self._on_response)
+
+    def reset(self, page):
+        """Начало новой аренды страницы - обнуление счетчиков"""
+        self._pages[page] = _PageTraffic()
+
+    def forget(self, page):
+        """Страница закрыта - счетчики больше не нужны"""
+        self._pages.pop(page, None)
+
+    def page_stats(self, page) -> Dict:
+        """Трафик страницы с начала текущей аренды"""
+        traffic = self._pages.get(page)
+        return traffic.as_dict() if traffic else _PageTraffic().as_dict()
+
+    def _traffic_for(self, request) -> Optional[_PageTraffic]:
+        try:
+            return self._pages.get(request.frame.page)
+        except Exception:
+            # Запросы service worker не привязаны к странице
+            return None
+
+    async def _handle_route(self, route):
+        request = route.request
+        try:
+            reason = self.block_reason(request.resource_type, request.url)
+            if reason is None:
+                await route.continue_()
+                return
+
+            size = BLOCKED_SIZE_ESTIMATE.get(request.resource_type, DEFAULT_SIZE_ESTIMATE)
+            self.total_blocked += 1
+            self.total_saved_bytes += size
+            traffic = self._traffic_for(request)
+            if traffic:
+                traffic.blocked += 1
+                traffic.blocked_by_type[reason] = traffic.blocked_by_type.get(reason, 0) + 1
+                traffic.saved_bytes += size
+            await route.abort("blockedbyclient")
+        except Exception as e:
+            # Страница закрылась, пока запрос ждал решения
+            logger.debug(f"Ошибка маршрутизации запроса: {e}")
+
+    def _on_response(self, response):
+        try:
+            length = int(response.headers.get("content-length", 0))
+        except (TypeError, ValueError):
+            return
+        traffic = self._traffic_for(response.request)
+        if traffic:
+            traffic.loaded_bytes += length
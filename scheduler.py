@@ -2,13 +2,30 @@
 Планировщик автоматической проверки цен
 """
 
+# Учет времени импортов - до остальных модулей
+import startup_report
+startup_report.install()
+
 import asyncio
 import logging
-from aiogram import Bot
+import time
+from datetime import datetime, timedelta
 
-from config import BOT_TOKEN, CHECK_INTERVAL, PARSER_DELAY, LOG_LEVEL, LOG_FORMAT, PROXY_STORAGE_PATH
-from database import Database
-from parser import OzonParser
+from config import (BOT_TOKEN, CHECK_INTERVAL, PARSER_DELAY, LOG_LEVEL, LOG_FORMAT,
+                    CHECK_WORKERS, MAX_CHECKS_PER_PROXY, ADAPTIVE_INTERVALS, CHECK_INTERVAL_MIN,
+                    CHECK_INTERVAL_MAX, VOLATILITY_WINDOW, SCHEDULE_REFRESH, WRITE_BATCH_SIZE,
+                    WRITE_BATCH_DELAY, METRICS_PORT_SCHEDULER, METRICS_PORT_WORKERS, JOB_QUEUE_ENABLED,
+                    WORKER_PROCESSES, JOB_POLL_INTERVAL, JOB_LEASE_TIMEOUT,
+                    JOB_WAIT_TIMEOUT)
+from database import PriceWriteBuffer, database_from_config
+from parser import parser_from_config
+from proxy_registry import proxy_registry_from_config
+from ozon_url import canonical_url
+from check_schedule import CheckQueue, check_interval, parse_timestamp
+from notifier import notifier_from_config
+from metrics import CHECKS, CYCLE_SECONDS, QUEUE_DEPTH, metrics_server_from_config, register_stats
+from job_queue import DONE, job_queue_from_config
+from worker import WorkerProcesses
 
 logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
 logger = logging.getLogger(__name__)
@@ -18,54 +35,355 @@ class PriceChecker:
     """Автоматическая проверка цен"""
     
     def __init__(self):
-        self.bot = Bot(token=BOT_TOKEN)
-        self.db = Database("ozon_tracker.db")
-        self.parser = OzonParser()
-        self.parser.load_proxies(PROXY_STORAGE_PATH)
+        self._bot = None
+        self.db = database_from_config()
+        # Результаты проверки пишутся пачками, а не транзакцией на товар
+        self.writes = PriceWriteBuffer(self.db, WRITE_BATCH_SIZE, WRITE_BATCH_DELAY)
+        # Страницы загружают воркеры через очередь проверок или сам планировщик
+        self.jobs = job_queue_from_config() if JOB_QUEUE_ENABLED else None
+        self.parser = None
+        if self.jobs is None:
+            self.parser = parser_from_config(
+                max_per_proxy=MAX_CHECKS_PER_PROXY if CHECK_WORKERS > 1 else None
+            )
+            # Прокси, добавленные через бота, подхватываются без перезапуска
+            self.parser.use_registry(proxy_registry_from_config())
+        # Уведомления отправляются отдельными задачами и не задерживают проверку
+        self.notifier = notifier_from_config(self._send_message)
+        self.metrics = metrics_server_from_config(METRICS_PORT_SCHEDULER)
+        self.workers = None
+        if self.jobs and WORKER_PROCESSES:
+            self.workers = WorkerProcesses(WORKER_PROCESSES, METRICS_PORT_WORKERS if self.metrics else None)
+        if self.metrics:
+            self._register_metrics()
+        
+        # Очередь проверок по сроку и подписки каждого товара каталога
+        self.queue = CheckQueue()
+        self.items = {}
+    
+    def _register_metrics(self):
+        """Счетчики пулов и очередей - в метрики Prometheus"""
+        if self.parser:
+            register_stats('ozon_browser_pool', 'Пул браузеров', self.parser.pool.stats)
+        if self.jobs:
+            register_stats('ozon_jobs', 'Задания очереди проверок', self.jobs.stats)
+        if self.workers:
+            register_stats('ozon_workers', 'Локальные процессы воркеров', self.workers.stats)
+        register_stats('ozon_db_pool', 'Соединения с БД', self.db.stats)
+        register_stats('ozon_notifications', 'Очередь уведомлений', self.notifier.stats)
+        register_stats('ozon_write_buffer', 'Запись результатов пачками', lambda: {
+            'pending': len(self.writes),
+            'flushes': self.writes.flushes,
+            'rows_written': self.writes.rows_written,
+        })
+    
+    @property
+    def bot(self):
+        """Бот для уведомлений: aiogram импортируется несколько секунд - при первом уведомлении"""
+        if self._bot is None:
+            from aiogram import Bot
+            self._bot = Bot(token=BOT_TOKEN)
+        return self._bot
+    
+    async def _send_message(self, chat_id: int, text: str):
+        await self.bot.send_message(chat_id, text, parse_mode="HTML", disable_web_page_preview=True)
+    
+    @staticmethod
+    def _item_key(product: dict):
+        """Ключ товара каталога: SKU, а до раскрытия короткой ссылки - сама ссылка"""
+        return product.get('sku') or product['url']
+    
+    @classmethod
+    def _group_by_sku(cls, products: list) -> list:
+        """Группировка подписок по SKU: каждый товар OZON загружается один раз"""
+        groups = {}
+        for product in products:
+            groups.setdefault(cls._item_key(product), []).append(product)
+        return list(groups.values())
+    
+    @staticmethod
+    def _item_url(subscribers: list) -> str:
+        """Ссылка для загрузки товара каталога"""
+        sku = subscribers[0].get('sku')
+        return canonical_url(sku) if sku else subscribers[0]['url']
+    
+    @staticmethod
+    def _item_label(subscribers: list) -> str:
+        """Подпись товара каталога для логов"""
+        sku = subscribers[0].get('sku')
+        name = f"SKU {sku}" if sku else f"Товар #{subscribers[0]['id']}"
+        return f"{name} (подписок: {len(subscribers)})"
+    
+    async def _intervals(self, keys: list) -> dict:
+        """Интервалы следующей проверки товаров по недавней истории цен"""
+        if not ADAPTIVE_INTERVALS:
+            return {key: CHECK_INTERVAL for key in keys}
+        
+        # История самой старой подписки - самая длинная
+        heads = {key: min(self.items[key], key=lambda p: p['id']) for key in keys}
+        now = datetime.utcnow()
+        history = await self.db.get_recent_history(
+            [head['id'] for head in heads.values()],
+            now - timedelta(seconds=VOLATILITY_WINDOW)
+        )
+        return {
+            key: check_interval(history[head['id']], head['added_at'], now,
+                                CHECK_INTERVAL, CHECK_INTERVAL_MIN, CHECK_INTERVAL_MAX)
+            for key, head in heads.items()
+        }
+    
+    async def refresh_schedule(self):
+        """Синхронизация очереди проверок с активными подписками"""
+        products = await self.db.get_all_active_products()
+        self.items = {self._item_key(group[0]): group for group in self._group_by_sku(products)}
+        self.queue.retain(self.items)
+        
+        new_keys = [key for key in self.items if key not in self.queue]
+        if not new_keys:
+            return
+        
+        # Новые товары (и все после перезапуска) - от времени последней проверки
+        intervals = await self._intervals(new_keys)
+        now = time.time()
+        for key in new_keys:
+            checks = [parse_timestamp(p['last_check']) for p in self.items[key]]
+            checks = [c for c in checks if c]
+            self.queue.schedule(key, max(checks).timestamp() + intervals[key] if checks else now)
+        QUEUE_DEPTH.set(len(self.queue), state='scheduled')
+        logger.info(f"Активных товаров: {len(products)}, уникальных SKU: {len(self.items)}, "
+                    f"новых в очереди: {len(new_keys)}")
     
     async def check_prices(self):
-        """Проверка всех товаров"""
-        logger.info("=== Начало проверки цен ===")
+        """Проверка товаров, срок проверки которых наступил"""
+        due = self.queue.pop_due(time.time())
+        if not due:
+            return
+        items = [self.items[key] for key in due]
+        QUEUE_DEPTH.set(len(due), state='due')
+        QUEUE_DEPTH.set(len(self.queue), state='scheduled')
+        logger.info(f"=== Начало проверки цен: {len(items)} из {len(self.items)} SKU ===")
         
         try:
-            products = await self.db.get_all_active_products()
-            logger.info(f"Активных товаров: {len(products)}")
+            started = time.monotonic()
+            if self.jobs:
+                checked = await self._check_queued(due)
+            elif CHECK_WORKERS > 1:
+                checked = await self._check_concurrent(items)
+            else:
+                checked = await self._check_sequential(items)
+            elapsed = time.monotonic() - started
+            CYCLE_SECONDS.observe(elapsed)
             
-            for i, product in enumerate(products, 1):
-                try:
-                    logger.info(f"[{i}/{len(products)}] Товар #{product['id']}")
-                    await self.check_single_product(product)
+            throughput = len(items) / elapsed * 60 if elapsed > 0 else 0
+            logger.info(
+                f"=== Проверка завершена за {elapsed:.1f} с: успешно {checked}/{len(items)} SKU, "
+                f"{throughput:.1f} SKU/мин ==="
+            )
+            logger.info(f"🗄 Соединения с БД: {self.db.stats()}")
+            if self.jobs:
+                logger.info(f"🛠 Очередь проверок: {self.jobs.stats()}")
+            else:
+                logger.info(f"Пул браузеров: {self.parser.pool.stats()}")
+                logger.info(
+                    f"🍪 Warm-up: выполнено {self.parser.warmups_run}, пропущено {self.parser.warmups_skipped} "
+                    f"({self.parser.warmup_skip_rate():.0%})"
+                )
+            if self.parser and self.parser.fast_path:
+                logger.info(
+                    f"⚡ Быстрый путь: успешно {self.parser.fast_path.hits}, "
+                    f"через браузер {self.parser.fast_path.fallbacks}"
+                )
+            
+        except Exception as e:
+            logger.error(f"Ошибка в цикле проверки: {e}")
+        
+        # Конец цикла: сначала все результаты на диске до расчета интервалов и следующего чтения подписок
+        flushed = False
+        try:
+            await self.writes.flush(durable=True)
+            flushed = True
+            logger.info(f"💾 Запись пачками: всего {self.writes.rows_written} строк за {self.writes.flushes} транзакций")
+        except Exception as e:
+            logger.error(f"Ошибка записи результатов: {e}")
+        
+        # Затем уведомления - только о ценах, уже записанных в БД; события каждого чата - одним сообщением
+        if flushed:
+            self.notifier.release()
+        else:
+            # Результаты остались в буфере записи - уведомления ждут их записи в следующем цикле
+            self.notifier.hold()
+        logger.info(f"📨 Уведомления: {self.notifier.stats()}")
+        
+        # Следующий срок - по истории с учетом только что записанных цен
+        try:
+            intervals = await self._intervals(due)
+        except Exception as e:
+            logger.error(f"Ошибка расчета интервалов: {e}")
+            intervals = {key: CHECK_INTERVAL for key in due}
+        now = time.time()
+        for key in due:
+            self.queue.schedule(key, now + intervals[key])
+        QUEUE_DEPTH.set(0, state='due')
+        QUEUE_DEPTH.set(len(self.queue), state='scheduled')
+        
+        values = sorted(intervals.values())
+        logger.info(
+            f"⏰ Интервалы проверенных SKU: от {values[0] / 60:.0f} до {values[-1] / 60:.0f} мин "
+            f"(медиана {values[len(values) // 2] / 60:.0f} мин)"
+        )
+    
+    async def _check_sequential(self, items: list) -> int:
+        """Последовательная проверка товаров по одному"""
+        checked = 0
+        for i, subscribers in enumerate(items, 1):
+            try:
+                logger.info(f"[{i}/{len(items)}] {self._item_label(subscribers)}")
+                if await self.check_catalog_item(subscribers):
+                    checked += 1
+                
+                if i < len(items):
+                    await asyncio.sleep(PARSER_DELAY)
                     
-                    if i < len(products):
-                        await asyncio.sleep(PARSER_DELAY)
-                        
+            except Exception as e:
+                logger.error(f"Ошибка: {self._item_label(subscribers)}: {e}")
+        return checked
+    
+    async def _check_concurrent(self, items: list) -> int:
+        """Параллельная проверка товаров пулом из CHECK_WORKERS воркеров"""
+        queue = asyncio.Queue()
+        for item in enumerate(items, 1):
+            queue.put_nowait(item)
+        checked = 0
+        
+        async def worker():
+            nonlocal checked
+            while True:
+                try:
+                    i, subscribers = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    logger.info(f"[{i}/{len(items)}] {self._item_label(subscribers)}")
+                    if await self.check_catalog_item(subscribers):
+                        checked += 1
                 except Exception as e:
-                    logger.error(f"Ошибка товара #{product['id']}: {e}")
-            
-            logger.info("=== Проверка завершена ===")
+                    logger.error(f"Ошибка: {self._item_label(subscribers)}: {e}")
+                
+                if not queue.empty():
+                    await asyncio.sleep(PARSER_DELAY)
+        
+        workers = min(CHECK_WORKERS, len(items))
+        logger.info(f"Воркеров: {workers}, лимит на прокси: {MAX_CHECKS_PER_PROXY}")
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        return checked
+    
+    async def _check_queued(self, due: list) -> int:
+        """Проверка товаров процессами воркеров через очередь проверок"""
+        waiting = {str(key): self.items[key] for key in due}
+        added = await self.jobs.enqueue([
+            (job_key, self._item_url(subscribers), subscribers[0].get('sku'))
+            for job_key, subscribers in waiting.items()
+        ])
+        logger.info(f"В очередь проверок: {added} новых заданий из {len(waiting)}")
+        
+        checked = 0
+        progress = warned = time.monotonic()
+        while waiting:
+            for job in await self.jobs.collect():
+                subscribers = waiting.pop(job['item_key'], None)
+                if subscribers is None:
+                    # Результат для прошлого запуска планировщика или товара, который уже не отслеживается
+                    continue
+                progress = warned = time.monotonic()
+                if job['state'] == DONE:
+                    if await self.apply_catalog_result(subscribers, job['result']):
+                        checked += 1
+                else:
+                    logger.error(f"❌ {self._item_label(subscribers)}: {job['error']} (аренд: {job['attempts']})")
+                    CHECKS.inc(result='error')
+            if not waiting:
+                break
             
+            counts = await self.jobs.counts()
+            QUEUE_DEPTH.set(counts['pending'], state='pending')
+            QUEUE_DEPTH.set(counts['leased'], state='leased')
+            if time.monotonic() - progress > JOB_WAIT_TIMEOUT:
+                # Задания остаются в очереди: следующий цикл их не дублирует и заберет результаты,
+                # а товары снова в расписании по обычным интервалам
+                logger.error(
+                    f"❌ Нет результатов {JOB_WAIT_TIMEOUT} с - не дождались {len(waiting)} SKU "
+                    f"(в очереди {counts['pending']}, в работе {counts['leased']}), цикл завершен"
+                )
+                CHECKS.inc(len(waiting), result='error')
+                break
+            if time.monotonic() - warned > JOB_LEASE_TIMEOUT:
+                logger.warning(
+                    f"⚠️ Нет результатов {JOB_LEASE_TIMEOUT} с, ждут {len(waiting)} SKU "
+                    f"(в очереди {counts['pending']}, в работе {counts['leased']}) - воркеры запущены?"
+                )
+                warned = time.monotonic()
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+        QUEUE_DEPTH.set(0, state='pending')
+        QUEUE_DEPTH.set(0, state='leased')
+        return checked
+    
+    async def check_catalog_item(self, subscribers: list) -> bool:
+        """Проверка одного товара OZON и раздача результата всем подписчикам"""
+        try:
+            # Парсим в цикле событий планировщика, чтобы воркеры делили пул браузеров
+            product_data = await self.parser.parse_product_async(self._item_url(subscribers))
         except Exception as e:
-            logger.error(f"Ошибка в цикле проверки: {e}")
+            logger.error(f"❌ {self._item_label(subscribers)}: {e}")
+            CHECKS.inc(result='error')
+            return False
+        return await self.apply_catalog_result(subscribers, product_data)
     
-    async def check_single_product(self, product: dict):
-        """Проверка одного товара"""
+    async def apply_catalog_result(self, subscribers: list, product_data: dict) -> bool:
+        """Запись результата проверки товара OZON и раздача всем подписчикам"""
+        sku = subscribers[0].get('sku')
         try:
-            # Парсим в отдельном потоке
-            product_data = await asyncio.get_event_loop().run_in_executor(
-                None, lambda: self.parser.parse_product(product['url'])
-            )
-            
             if not product_data or product_data['price'] is None:
-                logger.warning(f"Нет данных для товара #{product['id']}")
-                return
+                logger.warning(f"Нет данных: {self._item_label(subscribers)}")
+                CHECKS.inc(result='no_data')
+                return False
+            
+            # Короткая ссылка раскрылась - запоминаем SKU подписок
+            if not sku and product_data.get('sku'):
+                sku = product_data['sku']
+                await self.db.set_product_sku([p['id'] for p in subscribers], sku)
             
+            if sku:
+                await self.writes.add_catalog_item(
+                    sku,
+                    product_data.get('url') or canonical_url(sku),
+                    product_data['price'],
+                    product_data['in_stock'],
+                    product_data['stock_quantity'],
+                    product_data['name']
+                )
+            
+            for product in subscribers:
+                await self.apply_result(product, product_data)
+            
+            logger.info(f"✅ {self._item_label(subscribers)}: {product_data['price']}₽")
+            CHECKS.inc(result='ok')
+            return True
+            
+        except Exception as e:
+            logger.error(f"❌ {self._item_label(subscribers)}: {e}")
+            CHECKS.inc(result='error')
+            return False
+    
+    async def apply_result(self, product: dict, product_data: dict):
+        """Обновление подписки и уведомление подписчика"""
+        try:
             new_price = product_data['price']
             old_price = product['current_price']
             new_stock = product_data['in_stock']
             old_stock = product['in_stock']
             
-            # Обновляем БД
-            await self.db.update_product_price(
+            # Обновляем БД (через буфер пачки)
+            await self.writes.add_price(
                 product['id'],
                 new_price,
                 new_stock,
@@ -73,17 +391,15 @@ class PriceChecker:
                 product_data['name']
             )
             
-            # Уведомления
-            await self.send_notifications(product, old_price, new_price, old_stock, new_stock)
-            
-            logger.info(f"✅ #{product['id']}: {new_price}₽")
+            # Уведомления (в очередь отправки)
+            self.send_notifications(product, old_price, new_price, old_stock, new_stock)
             
         except Exception as e:
             logger.error(f"❌ Товар #{product['id']}: {e}")
     
-    async def send_notifications(self, product: dict, old_price: float, 
-                                 new_price: float, old_stock: bool, new_stock: bool):
-        """Отправка уведомлений"""
+    def send_notifications(self, product: dict, old_price: float, 
+                           new_price: float, old_stock: bool, new_stock: bool):
+        """Постановка уведомлений в очередь (события цикла уходят одним сообщением на чат)"""
         user_id = product['user_id']
         
         # Снижение цены
@@ -102,11 +418,7 @@ class PriceChecker:
 
 <a href="{product['url']}">Перейти к товару</a>
 """
-            try:
-                await self.bot.send_message(user_id, message, parse_mode="HTML", disable_web_page_preview=True)
-                logger.info(f"✅ Уведомление о снижении → {user_id}")
-            except Exception as e:
-                logger.error(f"Ошибка отправки: {e}")
+            self.notifier.notify(user_id, message)
         
         # Повышение цены (>5%)
         elif old_price and new_price > old_price:
@@ -124,10 +436,7 @@ class PriceChecker:
 
 <a href="{product['url']}">Перейти к товару</a>
 """
-                try:
-                    await self.bot.send_message(user_id, message, parse_mode="HTML", disable_web_page_preview=True)
-                except Exception as e:
-                    logger.error(f"Ошибка отправки: {e}")
+                self.notifier.notify(user_id, message)
         
         # Появление в наличии
         if not old_stock and new_stock:
@@ -139,10 +448,7 @@ class PriceChecker:
 
 <a href="{product['url']}">Перейти к товару</a>
 """
-            try:
-                await self.bot.send_message(user_id, message, parse_mode="HTML", disable_web_page_preview=True)
-            except Exception as e:
-                logger.error(f"Ошибка отправки: {e}")
+            self.notifier.notify(user_id, message)
         
         # Закончился товар
         if old_stock and not new_stock:
@@ -153,24 +459,56 @@ class PriceChecker:
 
 <a href="{product['url']}">Ссылка</a>
 """
-            try:
-                await self.bot.send_message(user_id, message, parse_mode="HTML", disable_web_page_preview=True)
-            except Exception as e:
-                logger.error(f"Ошибка отправки: {e}")
+            self.notifier.notify(user_id, message)
     
     async def run(self):
         """Основной цикл"""
         await self.db.init_db()
-        logger.info(f"📅 Планировщик запущен. Интервал: {CHECK_INTERVAL//60} мин")
+        if ADAPTIVE_INTERVALS:
+            logger.info(f"📅 Планировщик запущен. Интервалы: {CHECK_INTERVAL_MIN//60}-{CHECK_INTERVAL_MAX//60} мин")
+        else:
+            logger.info(f"📅 Планировщик запущен. Интервал: {CHECK_INTERVAL//60} мин")
+        self.notifier.start()
+        if self.metrics:
+            await self.metrics.start()
+        if self.jobs:
+            await self.jobs.open()
+            logger.info(f"🛠 Проверка воркерами через очередь, локальных процессов: {WORKER_PROCESSES}")
+        if self.workers:
+            self.workers.start()
+        startup_report.report(logger, "Планировщик готов к проверкам")
         
-        while True:
+        try:
+            while True:
+                try:
+                    await self.refresh_schedule()
+                    await self.check_prices()
+                except Exception as e:
+                    logger.error(f"Критическая ошибка: {e}")
+                
+                # Спим до ближайшего срока, но список товаров перечитываем регулярно
+                next_due = self.queue.next_due()
+                delay = SCHEDULE_REFRESH if next_due is None else next_due - time.time()
+                delay = max(1, min(delay, SCHEDULE_REFRESH))
+                if next_due:
+                    logger.debug(f"⏰ Следующая проверка через {max(0, next_due - time.time()) / 60:.0f} мин")
+                await asyncio.sleep(delay)
+        finally:
+            if self.workers:
+                await self.workers.close()
+            if self.parser:
+                await self.parser.close()
+            if self.jobs:
+                await self.jobs.close()
             try:
-                await self.check_prices()
-            except Exception as e:
-                logger.error(f"Критическая ошибка: {e}")
-            
-            logger.info(f"⏰ Следующая проверка через {CHECK_INTERVAL//60} мин")
-            await asyncio.sleep(CHECK_INTERVAL)
+                await self.writes.flush(durable=True)
+            finally:
+                await self.db.close()
+                await self.notifier.close()
+                if self.metrics:
+                    await self.metrics.close()
+                if self._bot is not None:
+                    await self._bot.session.close()
 
 
 async def main():
@@ -0,0 +1,80 @@
+"""
+Хранилище сессий OZON (cookies и localStorage) по прокси
+
+Состояние контекста Playwright сохраняется в файл под RUNTIME_DIR после
+успешного warm-up или прохождения антибота. Новые контексты для того же
+прокси стартуют с этим состоянием и не тратят время на warm-up, пока
+сессия не устарела и не была помечена антиботом.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+# Настройки по умолчанию
+SESSION_MAX_AGE = 6 * 3600  # секунды
+
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Файлы storage_state Playwright, по одному на прокси"""
+
+    def __init__(self, directory: str, max_age: float = SESSION_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+
+    def path(self, proxy: Optional[str]) -> str:
+        """Путь к файлу сессии прокси (без пароля прокси в имени)"""
+        key = hashlib.sha1((proxy or "direct").encode()).hexdigest()[:16]
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load_path(self, proxy: Optional[str]) -> Optional[str]:
+        """Путь к сохраненной сессии, если она существует и не устарела"""
+        path = self.path(proxy)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Сессия жива, пока есть хоть одна неистекшая cookie
+        now = time.time()
+        cookies = state.get('cookies') or []
+        if not any(c.get('expires', -1) == -1 or c.get('expires', 0) > now for c in cookies):
+            return None
+        return path
+
+    async def save(self, proxy: Optional[str], context):
+        """Сохранение состояния контекста (атомарная замена файла)"""
+        path = self.path(proxy)
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Свой временный файл: сессию того же прокси сохраняют и другие процессы воркеров
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            os.close(fd)
+            await context.storage_state(path=tmp_path)
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except Exception as e:
+            logger.debug(f"Не удалось сохранить сессию: {e}")
+        finally:
+            if tmp_path:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+
+    def invalidate(self, proxy: Optional[str]):
+        """Удаление сессии, помеченной антиботом"""
+        try:
+            os.remove(self.path(proxy))
+        except OSError:
+            pass
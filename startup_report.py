@@ -0,0 +1,89 @@
+"""
+Отчет о времени запуска бота и планировщика
+
+Точка входа импортирует модуль первым и вызывает install(): до вызова
+report() учитывается время первого импорта каждого модуля (как у
+python -X importtime - с вложенными импортами). report() пишет в лог
+время до готовности и самые тяжелые импорты точки входа и снимает учет.
+
+Полное дерево импортов модуля без запуска:
+
+    python -m startup_report bot
+"""
+
+import builtins
+import logging
+import sys
+import threading
+import time
+from typing import List, Tuple
+
+# Момент импорта модуля - почти начало процесса, если точка входа импортирует его первым
+STARTED = time.perf_counter()
+
+# Сколько самых тяжелых импортов показывать в отчете
+TOP_IMPORTS = 6
+
+_original_import = builtins.__import__
+# (глубина вложенности, модуль, секунды) в порядке завершения импорта
+_records: List[Tuple[int, str, float]] = []
+_depth = 0
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _depth
+    # Относительные, повторные и импорты из других потоков - без учета
+    if level or name in sys.modules or threading.current_thread() is not threading.main_thread():
+        return _original_import(name, globals, locals, fromlist, level)
+    started = time.perf_counter()
+    _depth += 1
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        _depth -= 1
+        _records.append((_depth, name, time.perf_counter() - started))
+
+
+def install():
+    """Включение учета импортов"""
+    builtins.__import__ = _timed_import
+
+
+def uninstall():
+    builtins.__import__ = _original_import
+
+
+def heaviest_imports(limit: int = TOP_IMPORTS) -> List[Tuple[str, float]]:
+    """Самые долгие импорты верхнего уровня (с вложенными)"""
+    top = [(name, seconds) for depth, name, seconds in _records if depth == 0]
+    return sorted(top, key=lambda item: item[1], reverse=True)[:limit]
+
+
+def report(logger: logging.Logger, what: str):
+    """Запись в лог времени запуска и завершение учета импортов"""
+    uninstall()
+    elapsed = time.perf_counter() - STARTED
+    imported = sum(seconds for depth, _, seconds in _records if depth == 0)
+    heaviest = ", ".join(f"{name} {seconds:.2f}" for name, seconds in heaviest_imports())
+    logger.info(f"⏱ {what} через {elapsed:.2f} с после запуска (импорт модулей {imported:.2f} с: {heaviest})")
+
+
+def _print_tree(records: List[Tuple[int, str, float]], min_ms: float):
+    # Импорт завершается после вложенных - дерево печатается в обратном порядке
+    for depth, name, seconds in reversed(records):
+        if seconds * 1000 >= min_ms:
+            print(f"{seconds * 1000:10.1f} мс  {'  ' * depth}{name}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    # Точка входа импортирует этот же модуль, а не вторую копию
+    sys.modules.setdefault('startup_report', sys.modules[__name__])
+    install()
+    started = time.perf_counter()
+    __import__(sys.argv[1])
+    uninstall()
+    print(f"Импорт {sys.argv[1]}: {(time.perf_counter() - started) * 1000:.0f} мс (показаны импорты от 1 мс)")
+    _print_tree(_records, min_ms=1.0)
@@ -0,0 +1,217 @@
+"""
+Схема базы: миграция истории цен и постраничное чтение истории
+"""
+
+import asyncio
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import database
+from database import SCHEMA_VERSION, Database
+
+OLD_PRODUCTS = '''
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, url TEXT NOT NULL, product_name TEXT,
+        current_price REAL, last_check TIMESTAMP, in_stock BOOLEAN DEFAULT 1, stock_quantity TEXT,
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, is_active BOOLEAN DEFAULT 1
+    )
+'''
+OLD_HISTORY = '''
+    CREATE TABLE price_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, product_id INTEGER, price REAL, in_stock BOOLEAN,
+        stock_quantity TEXT, checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+# Цена 100 три проверки, 105 две, снова 100 - три интервала
+OLD_ROWS = [
+    (1, 100.0, 1, 'В наличии', '2026-01-01 10:00:00'),
+    (1, 100.0, 1, 'В наличии', '2026-01-01 10:10:00'),
+    (1, 100.0, 1, 'В наличии', '2026-01-01 10:20:00'),
+    (1, 105.5, 1, 'В наличии', '2026-01-01 10:30:00'),
+    (1, 105.5, 1, 'В наличии', '2026-01-01 10:40:00'),
+    (1, 100.0, 0, 'Нет в наличии', '2026-01-01 10:50:00'),
+]
+
+
+def make_old_database(path):
+    db = sqlite3.connect(path)
+    db.execute(OLD_PRODUCTS)
+    db.execute(OLD_HISTORY)
+    db.execute("INSERT INTO products (user_id, url) VALUES (1, 'https://www.ozon.ru/product/kukhnya-1628022641/')")
+    db.executemany(
+        'INSERT INTO price_history (product_id, price, in_stock, stock_quantity, checked_at) VALUES (?, ?, ?, ?, ?)',
+        OLD_ROWS
+    )
+    db.commit()
+    db.close()
+
+
+def schema(path):
+    db = sqlite3.connect(path)
+    try:
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+        columns = [row[1] for row in db.execute('PRAGMA table_info(price_history)')]
+        rows = db.execute(
+            'SELECT checked_at, last_seen_at, checks, price, stock FROM price_history ORDER BY checked_at'
+        ).fetchall()
+    finally:
+        db.close()
+    return version, columns, rows
+
+
+def old_schema(path):
+    db = sqlite3.connect(path)
+    try:
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+        columns = [row[1] for row in db.execute('PRAGMA table_info(price_history)')]
+        count = db.execute('SELECT COUNT(*) FROM price_history').fetchone()[0]
+    finally:
+        db.close()
+    return version, columns, count
+
+
+async def init(path):
+    db = Database(str(path), pool_size=1)
+    try:
+        await db.init_db()
+    finally:
+        await db.close()
+
+
+def test_migration_compacts_history(tmp_path):
+    path = tmp_path / 'old.db'
+    make_old_database(path)
+    asyncio.run(init(path))
+
+    version, columns, rows = schema(path)
+    assert version == SCHEMA_VERSION
+    assert columns == ['product_id', 'checked_at', 'last_seen_at', 'checks', 'price', 'stock']
+    # Секунды Unix, копейки, код наличия
+    start = 1767261600  # 2026-01-01 10:00:00 UTC
+    assert rows == [
+        (start, start + 1200, 3, 10000, database.STOCK_IN),
+        (start + 1800, start + 2400, 2, 10550, database.STOCK_IN),
+        (start + 3000, start + 3000, 1, 10000, database.STOCK_OUT),
+    ]
+
+
+def test_migration_sets_sku(tmp_path):
+    path = tmp_path / 'old.db'
+    make_old_database(path)
+    asyncio.run(init(path))
+
+    db = sqlite3.connect(path)
+    assert db.execute('SELECT sku FROM products').fetchone()[0] == 1628022641
+    db.close()
+
+
+def test_failed_migration_rolls_back(tmp_path, monkeypatch):
+    path = tmp_path / 'old.db'
+    make_old_database(path)
+
+    async def crash(db):
+        raise RuntimeError('сбой посреди миграции')
+
+    monkeypatch.setattr(Database, '_backfill_rollups', staticmethod(crash))
+    with pytest.raises(RuntimeError):
+        asyncio.run(init(path))
+
+    version, columns, rows = old_schema(path)
+    assert version == 0
+    assert 'id' in columns
+    assert rows == len(OLD_ROWS)
+
+
+def test_concurrent_init_migrates_once(tmp_path):
+    path = tmp_path / 'old.db'
+    make_old_database(path)
+
+    async def both():
+        await asyncio.gather(init(path), init(path))
+
+    asyncio.run(both())
+    version, _, rows = schema(path)
+    assert version == SCHEMA_VERSION
+    assert len(rows) == 3
+
+
+def test_init_new_database_is_idempotent(tmp_path):
+    path = tmp_path / 'new.db'
+    asyncio.run(init(path))
+    asyncio.run(init(path))
+    version, columns, rows = schema(path)
+    assert version == SCHEMA_VERSION
+    assert 'id' not in columns
+    assert rows == []
+
+
+# 25 интервалов истории товара 1 с шагом в минуту, начиная с HISTORY_START
+HISTORY_START = 1767261600
+HISTORY_SIZE = 25
+
+
+def history_database(path):
+    asyncio.run(init(path))
+    db = sqlite3.connect(path)
+    db.executemany(
+        'INSERT INTO price_history (product_id, checked_at, last_seen_at, checks, price, stock) VALUES (?, ?, ?, 1, ?, 1)',
+        [(1, HISTORY_START + 60 * i, HISTORY_START + 60 * i, 10000 + i) for i in range(HISTORY_SIZE)]
+        + [(2, HISTORY_START + 60 * i, HISTORY_START + 60 * i, 500) for i in range(3)]
+    )
+    db.commit()
+    db.close()
+
+
+def page(path, **kwargs):
+    async def read():
+        db = Database(str(path), pool_size=1)
+        try:
+            return await db.get_history_page(1, 10, **kwargs)
+        finally:
+            await db.close()
+
+    return asyncio.run(read())
+
+
+def minutes(result):
+    return [(item['checked_at'] - HISTORY_START) // 60 for item in result['items']]
+
+
+def test_history_pages_walk_older_and_back(tmp_path):
+    path = tmp_path / 'history.db'
+    history_database(path)
+
+    first = page(path)
+    assert minutes(first) == list(range(24, 14, -1))
+    assert (first['has_older'], first['has_newer']) == (True, False)
+
+    second = page(path, before=first['items'][-1]['checked_at'])
+    assert minutes(second) == list(range(14, 4, -1))
+    assert (second['has_older'], second['has_newer']) == (True, True)
+
+    last = page(path, before=second['items'][-1]['checked_at'])
+    assert minutes(last) == [4, 3, 2, 1, 0]
+    assert (last['has_older'], last['has_newer']) == (False, True)
+
+    # Назад к новым - та же вторая страница
+    back = page(path, after=last['items'][0]['checked_at'])
+    assert minutes(back) == minutes(second)
+    assert (back['has_older'], back['has_newer']) == (True, True)
+
+
+def test_history_page_window(tmp_path):
+    path = tmp_path / 'history.db'
+    history_database(path)
+
+    result = page(path, since=datetime.utcfromtimestamp(HISTORY_START + 60 * 5),
+                  until=datetime.utcfromtimestamp(HISTORY_START + 60 * 12))
+    assert minutes(result) == list(range(11, 4, -1))
+    assert (result['has_older'], result['has_newer']) == (False, False)
+
+
+def test_history_page_empty(tmp_path):
+    path = tmp_path / 'history.db'
+    history_database(path)
+    assert page(path, before=HISTORY_START) == {'items': [], 'has_older': False, 'has_newer': False}
@@ -0,0 +1,160 @@
+"""
+Быстрый путь: разбор ответа entrypoint-api и переход на браузер
+"""
+
+import asyncio
+import copy
+import json
+import os
+from contextlib import asynccontextmanager
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from http_fast_path import API_PATH, HttpFastPath, parse_widget_states
+from parser import OzonParser
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SKU = 1628022641
+URL = f"https://www.ozon.ru/product/nabor-igrovoy-dlya-devochki-kuhnya-s-produktami-i-posudu-{SKU}/"
+
+with open(os.path.join(FIXTURES, 'entrypoint_api_product.json'), 'r', encoding='utf-8') as f:
+    RESPONSE = json.load(f)
+
+PRICE_STATE = 'webPrice-3121879-default-1'
+
+
+def response(**price_changes) -> dict:
+    """Сохраненный ответ с измененным состоянием виджета цены"""
+    data = copy.deepcopy(RESPONSE)
+    state = json.loads(data['widgetStates'][PRICE_STATE])
+    state.update(price_changes)
+    data['widgetStates'][PRICE_STATE] = json.dumps({k: v for k, v in state.items() if v is not None},
+                                                   ensure_ascii=False)
+    return data
+
+
+def test_saved_response_price_name_stock():
+    result = parse_widget_states(RESPONSE)
+    # Цена с Ozon Картой - первая в виджете, неразрывные пробелы не мешают
+    assert result == {
+        'name': 'Набор игровой для девочки Кухня с продуктами и посудой',
+        'price': 1299.0,
+        'in_stock': True,
+        'stock_quantity': 'В наличии',
+    }
+
+
+def test_price_fields_in_widget_order():
+    assert parse_widget_states(response(cardPrice=None))['price'] == 1387.0
+    assert parse_widget_states(response(cardPrice=None, price=None))['price'] == 2990.0
+    # Цена вне PRICE_MIN..PRICE_MAX - следующее поле
+    assert parse_widget_states(response(cardPrice='5 ₽'))['price'] == 1387.0
+
+
+def test_out_of_stock_widget_and_availability():
+    data = copy.deepcopy(RESPONSE)
+    data['widgetStates']['webOutOfStock-3829334-default-1'] = '{}'
+    assert parse_widget_states(data)['in_stock'] is False
+    unavailable = parse_widget_states(response(isAvailable=False))
+    assert unavailable['in_stock'] is False
+    assert unavailable['stock_quantity'] == 'Нет в наличии'
+
+
+def test_heading_missing_falls_back_to_seo_title():
+    data = copy.deepcopy(RESPONSE)
+    del data['widgetStates']['webProductHeading-3385933-default-1']
+    assert parse_widget_states(data)['name'].startswith('Набор игровой для девочки')
+
+
+def test_no_price_widget_or_price():
+    data = copy.deepcopy(RESPONSE)
+    del data['widgetStates'][PRICE_STATE]
+    assert parse_widget_states(data) is None
+    assert parse_widget_states({}) is None
+    assert parse_widget_states(response(cardPrice=None, price=None, originalPrice=None)) is None
+
+
+class FakeSessions:
+    def __init__(self, path: str):
+        self.path = path
+
+    def load_path(self, proxy):
+        return self.path
+
+
+class FakePool:
+    """Пул браузеров: считает переходы на браузер, страницу не выдает"""
+
+    def __init__(self, sessions: FakeSessions):
+        self.sessions = sessions
+        self.leases = 0
+
+    @asynccontextmanager
+    async def lease(self, proxy=None):
+        self.leases += 1
+        raise RuntimeError("браузер в тесте не запускается")
+        yield
+
+
+def check(tmp_path, body: str, content_type: str = 'application/json'):
+    """parse_product_async против стенда entrypoint-api с ответом body"""
+    storage_state = tmp_path / 'session.json'
+    storage_state.write_text(json.dumps({'cookies': [{'name': '__Secure-ab', 'value': '1', 'domain': '.ozon.ru'}]}))
+
+    async def scenario():
+        requests = []
+
+        async def api(request):
+            requests.append(request.query['url'])
+            return web.Response(text=body, content_type=content_type)
+
+        app = web.Application()
+        app.router.add_get(API_PATH, api)
+        async with TestServer(app) as server:
+            fast_path = HttpFastPath(base_url=str(server.make_url('')))
+            pool = FakePool(FakeSessions(str(storage_state)))
+            parser = OzonParser(pool=pool, fast_path=fast_path)
+            try:
+                result = await parser.parse_product_async(URL)
+            finally:
+                await fast_path.close()
+        return result, requests, pool.leases, fast_path
+
+    return asyncio.run(scenario())
+
+
+def test_fast_path_answers_without_browser(tmp_path):
+    result, requests, leases, fast_path = check(tmp_path, json.dumps(RESPONSE, ensure_ascii=False))
+    assert requests == [f"/product/{SKU}/"]
+    assert result['price'] == 1299.0 and result['sku'] == SKU
+    assert leases == 0
+    assert fast_path.hits == 1
+
+
+def test_malformed_widget_state_falls_back_to_browser(tmp_path):
+    data = copy.deepcopy(RESPONSE)
+    data['widgetStates'][PRICE_STATE] = '{"cardPrice": "1 299'
+    result, _, leases, fast_path = check(tmp_path, json.dumps(data, ensure_ascii=False))
+    assert result is None
+    assert leases == 2
+    assert fast_path.fallbacks == 1
+
+
+def test_response_without_widget_states_falls_back_to_browser(tmp_path):
+    result, _, leases, fast_path = check(tmp_path, '{"layout": []}')
+    assert result is None and leases == 2
+    assert fast_path.fallbacks == 1
+
+
+def test_html_instead_of_json_blocks_fast_path(tmp_path):
+    result, _, leases, fast_path = check(tmp_path, '<html>Доступ ограничен</html>', content_type='text/html')
+    assert result is None and leases == 2
+    # Антибот: быстрый путь для прокси отключен на ANTIBOT_COOLDOWN
+    assert not fast_path.is_available(None)
+
+
+def test_broken_json_body_falls_back_to_browser(tmp_path):
+    result, _, leases, fast_path = check(tmp_path, '{"widgetStates": {')
+    assert result is None and leases == 2
+    assert fast_path.fallbacks == 1 and fast_path.is_available(None)
@@ -0,0 +1,225 @@
+"""
+Очередь проверок: аренда, истечение аренды, повторы; воркер и продление аренды
+"""
+
+import asyncio
+import multiprocessing
+
+from job_queue import DONE, FAILED, LEASED, PENDING, JobQueue
+from worker import Worker
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def opened(path, **kwargs) -> JobQueue:
+    queue = JobQueue(str(path), **kwargs)
+    await queue.open()
+    return queue
+
+
+def test_enqueue_skips_items_already_queued(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db')
+        first = await queue.enqueue([('1', 'u1', 1), ('2', 'u2', 2)])
+        again = await queue.enqueue([('1', 'u1', 1), ('3', 'u3', 3)])
+        counts = await queue.counts()
+        await queue.close()
+        return first, again, counts
+
+    first, again, counts = run(scenario())
+    assert (first, again) == (2, 1)
+    assert counts[PENDING] == 3
+
+
+def test_lease_complete_collect(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db')
+        await queue.enqueue([('1', 'u1', 1), ('2', 'u2', 2)])
+        job = await queue.lease('w1')
+        other = await queue.lease('w2')
+        empty = await queue.lease('w3')
+        completed = await queue.complete(job['id'], 'w1', {'price': 1299.0})
+        collected = await queue.collect()
+        counts = await queue.counts()
+        await queue.close()
+        return job, other, empty, completed, collected, counts
+
+    job, other, empty, completed, collected, counts = run(scenario())
+    # Самое старое задание первым, одно задание - одному воркеру
+    assert job['item_key'] == '1' and other['item_key'] == '2'
+    assert empty is None
+    assert completed
+    assert [(j['item_key'], j['state'], j['result']) for j in collected] == [('1', DONE, {'price': 1299.0})]
+    assert counts == {PENDING: 0, LEASED: 1, DONE: 0, FAILED: 0}
+
+
+def test_expired_lease_is_requeued_then_failed(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db', lease_timeout=0.05, max_attempts=2)
+        await queue.enqueue([('1', 'u1', 1)])
+        crashed = await queue.lease('crashed')
+        await asyncio.sleep(0.1)
+        retried = await queue.lease('w2')
+        # Результат потерявшего аренду воркера не принимается
+        late = await queue.complete(crashed['id'], 'crashed', {'price': 1.0})
+        await asyncio.sleep(0.1)
+        after_max = await queue.lease('w3')
+        collected = await queue.collect()
+        await queue.close()
+        return crashed, retried, late, after_max, collected, queue.stats()
+
+    crashed, retried, late, after_max, collected, stats = run(scenario())
+    assert retried['id'] == crashed['id'] and retried['attempts'] == 2
+    assert not late
+    assert after_max is None
+    assert [(j['state'], j['attempts']) for j in collected] == [(FAILED, 2)]
+    assert stats['requeued'] == 1 and stats['failed'] == 1
+
+
+def test_fail_requeues_until_max_attempts(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db', max_attempts=2)
+        await queue.enqueue([('1', 'u1', 1)])
+        states = []
+        for _ in range(2):
+            job = await queue.lease('w')
+            states.append(await queue.fail(job['id'], 'w', 'Таймаут'))
+        stranger = await queue.fail(job['id'], 'other', 'x')
+        collected = await queue.collect()
+        await queue.close()
+        return states, stranger, collected
+
+    states, stranger, collected = run(scenario())
+    assert states == [PENDING, FAILED]
+    assert stranger is None
+    assert collected[0]['error'] == 'Таймаут'
+
+
+def test_finished_job_is_enqueued_afresh(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db')
+        await queue.enqueue([('1', 'u1', 1)])
+        job = await queue.lease('w')
+        await queue.complete(job['id'], 'w', None)
+        # Координатор перезапустился и не забрал результат - товар проверяется заново
+        added = await queue.enqueue([('1', 'u1', 1)])
+        counts = await queue.counts()
+        await queue.close()
+        return added, counts
+
+    added, counts = run(scenario())
+    assert added == 1
+    assert counts[PENDING] == 1 and counts[DONE] == 0
+
+
+def _lease_all(path, name, results):
+    async def scenario():
+        queue = await opened(path)
+        leased = []
+        while True:
+            job = await queue.lease(name)
+            if job is None:
+                break
+            leased.append(job['id'])
+            await queue.complete(job['id'], name, None)
+        await queue.close()
+        return leased
+
+    results.put(asyncio.run(scenario()))
+
+
+def test_processes_never_share_a_job(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+
+    async def fill():
+        queue = await opened(path)
+        await queue.enqueue([(str(i), f'u{i}', i) for i in range(200)])
+        await queue.close()
+
+    run(fill())
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_lease_all, args=(path, f'w{i}', results)) for i in range(4)]
+    for process in processes:
+        process.start()
+    leased = [job_id for _ in processes for job_id in results.get(timeout=60)]
+    for process in processes:
+        process.join()
+    assert len(leased) == 200
+    assert len(set(leased)) == 200
+
+
+class SlowParser:
+    """Парсер для воркера: проверка длится delay секунд"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def parse_product_async(self, url: str):
+        await asyncio.sleep(self.delay)
+        return {'price': 1299.0, 'url': url}
+
+
+def test_worker_renews_lease_during_long_check(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db', lease_timeout=0.15)
+        await queue.enqueue([('1', 'u1', 1)])
+        worker = Worker(queue, 'w1', parser=SlowParser(0.5))
+        job = await queue.lease(worker.name)
+        processing = asyncio.ensure_future(worker.process(job))
+        await asyncio.sleep(0.3)
+        # Аренда продлена - другой воркер задание не получает
+        stolen = await queue.lease('w2')
+        await processing
+        collected = await queue.collect()
+        await queue.close()
+        return stolen, collected
+
+    stolen, collected = run(scenario())
+    assert stolen is None
+    assert [(j['state'], j['result']['price']) for j in collected] == [(DONE, 1299.0)]
+
+
+def test_worker_abandons_check_when_renewal_keeps_failing(tmp_path):
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db', lease_timeout=0.15)
+        await queue.enqueue([('1', 'u1', 1)])
+        worker = Worker(queue, 'w1', parser=SlowParser(5))
+        job = await queue.lease(worker.name)
+
+        async def locked(job_id, name):
+            raise RuntimeError('database is locked')
+
+        queue.renew = locked
+        await asyncio.wait_for(worker.process(job), 2)
+        counts = await queue.counts()
+        await queue.close()
+        return job, counts
+
+    job, counts = run(scenario())
+    assert job['abandoned']
+    # Проверка прервана и задание сразу вернулось в очередь
+    assert counts[PENDING] == 1 and counts[LEASED] == 0
+
+
+def test_coordinator_stops_waiting_without_workers(tmp_path, monkeypatch):
+    import scheduler
+
+    monkeypatch.setattr(scheduler, 'JOB_WAIT_TIMEOUT', 0.3)
+    monkeypatch.setattr(scheduler, 'JOB_POLL_INTERVAL', 0.05)
+
+    async def scenario():
+        queue = await opened(tmp_path / 'jobs.db')
+        coordinator = scheduler.PriceChecker.__new__(scheduler.PriceChecker)
+        coordinator.jobs = queue
+        coordinator.items = {1: [{'sku': 1, 'url': 'https://www.ozon.ru/product/1/'}]}
+        checked = await asyncio.wait_for(coordinator._check_queued([1]), 5)
+        counts = await queue.counts()
+        await queue.close()
+        return checked, counts
+
+    checked, counts = run(scenario())
+    # Задание ждет воркеров в очереди, а цикл проверки завершился
+    assert checked == 0
+    assert counts[PENDING] == 1
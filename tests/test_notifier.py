@@ -0,0 +1,153 @@
+"""
+Очередь уведомлений: темп отправки, дайджесты, RetryAfter
+"""
+
+import asyncio
+import time
+
+from notifier import NotificationDispatcher, TokenBucket, build_digest
+
+
+class RetryAfter(Exception):
+    """Как TelegramRetryAfter aiogram: ответ 429 с паузой"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+class Recorder:
+    """send() для диспетчера: запоминает (время, чат, текст), может отвечать ошибками"""
+
+    def __init__(self, errors=()):
+        self.sent = []
+        self.errors = list(errors)
+
+    async def __call__(self, chat_id: int, text: str):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((time.monotonic(), chat_id, text))
+
+
+def test_token_bucket_paces_steadily():
+    async def run():
+        bucket = TokenBucket(rate=50)
+        started = time.monotonic()
+        stamps = []
+        for _ in range(26):
+            await bucket.acquire()
+            stamps.append(time.monotonic() - started)
+        return stamps
+
+    stamps = asyncio.run(run())
+    # Первый сразу, дальше не чаще раза в 1/50 с: 25 интервалов - не меньше 0.5 с
+    assert stamps[0] < 0.01
+    assert stamps[-1] >= 0.5 - 0.01
+    # Без всплеска: в любом окне 0.1 с не больше 5 + 1 операций
+    assert all(sum(1 for s in stamps if start <= s < start + 0.1) <= 6 for start in stamps)
+
+
+def test_events_of_one_chat_go_as_one_digest():
+    async def run():
+        send = Recorder()
+        dispatcher = NotificationDispatcher(send, rate=100, chat_interval=0, max_delay=60)
+        dispatcher.start()
+        for i in range(3):
+            dispatcher.notify(1, f"событие {i}")
+        dispatcher.notify(2, "другой чат")
+        await asyncio.sleep(0.05)
+        held = len(send.sent)
+        dispatcher.release()
+        await dispatcher.close()
+        return held, send.sent, dispatcher.stats()
+
+    held, sent, stats = asyncio.run(run())
+    # До конца цикла ничего не отправляется
+    assert held == 0
+    texts = {chat_id: text for _, chat_id, text in sent}
+    assert len(sent) == 2
+    assert 'Изменения по отслеживаемым товарам: 3' in texts[1]
+    assert all(f"событие {i}" in texts[1] for i in range(3))
+    assert texts[2] == "другой чат"
+    assert stats['events'] == 4 and stats['sent'] == 2
+
+
+def test_held_digests_wait_for_next_release():
+    async def run():
+        send = Recorder()
+        dispatcher = NotificationDispatcher(send, rate=100, chat_interval=0, max_delay=0.1)
+        dispatcher.start()
+        dispatcher.notify(1, "цена не записана")
+        # Запись результатов цикла не удалась
+        dispatcher.hold()
+        dispatcher.notify(1, "следующий цикл")
+        await asyncio.sleep(0.3)
+        held = len(send.sent)
+        dispatcher.release()
+        await dispatcher.close()
+        return held, send.sent
+
+    held, sent = asyncio.run(run())
+    # Ни max_delay, ни новые события не отправляют удержанное
+    assert held == 0
+    assert len(sent) == 1
+    assert "цена не записана" in sent[0][2] and "следующий цикл" in sent[0][2]
+
+
+def test_chat_interval_between_digests():
+    async def run():
+        send = Recorder()
+        dispatcher = NotificationDispatcher(send, rate=100, chat_interval=0.3, max_delay=60)
+        dispatcher.start()
+        dispatcher.notify(1, "первое")
+        dispatcher.release()
+        await asyncio.sleep(0.05)
+        dispatcher.notify(1, "второе")
+        dispatcher.release()
+        await asyncio.sleep(0.5)
+        await dispatcher.close()
+        return send.sent
+
+    sent = asyncio.run(run())
+    assert [text for _, _, text in sent] == ["первое", "второе"]
+    assert sent[1][0] - sent[0][0] >= 0.3 - 0.01
+
+
+def test_retry_after_pauses_and_resends():
+    async def run():
+        send = Recorder(errors=[RetryAfter(0.2)])
+        dispatcher = NotificationDispatcher(send, rate=100, chat_interval=0)
+        dispatcher.start()
+        started = time.monotonic()
+        dispatcher.notify(1, "цена снизилась")
+        dispatcher.release()
+        await dispatcher.close()
+        return send.sent, started, dispatcher.stats()
+
+    sent, started, stats = asyncio.run(run())
+    assert len(sent) == 1
+    assert sent[0][0] - started >= 0.2 - 0.01
+    assert stats['retried'] == 1 and stats['dropped'] == 0
+
+
+def test_permanent_error_drops_message():
+    async def run():
+        send = Recorder(errors=[ValueError("chat not found")])
+        dispatcher = NotificationDispatcher(send, rate=100, chat_interval=0)
+        dispatcher.start()
+        dispatcher.notify(1, "цена снизилась")
+        dispatcher.release()
+        await dispatcher.close()
+        return send.sent, dispatcher.stats()
+
+    sent, stats = asyncio.run(run())
+    assert sent == []
+    assert stats['dropped'] == 1
+
+
+def test_build_digest_splits_long_text():
+    messages = ["x" * 1000 for _ in range(10)]
+    parts = build_digest(messages, limit=4096)
+    assert len(parts) > 1
+    assert all(len(part) <= 4096 for part in parts)
+    assert sum(part.count("x" * 1000) for part in parts) == 10
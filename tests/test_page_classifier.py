@@ -0,0 +1,69 @@
+"""
+Классификатор страниц на корпусе benchmarks/fixtures
+"""
+
+import re
+
+import pytest
+
+from benchmarks.classifier import _price, agree, check_after, check_before
+from benchmarks.corpus import load_corpus
+from page_classifier import ANTIBOT, OUT_OF_STOCK, PRODUCT, classify_page, widgets_out_of_stock
+
+CORPUS = load_corpus()
+
+
+def test_corpus_covers_all_kinds():
+    assert {fixture.kind for fixture in CORPUS} == {'product', 'out_of_stock', 'no_price', 'antibot'}
+
+
+@pytest.mark.parametrize('fixture', CORPUS, ids=lambda f: f.name)
+def test_classify_page_matches_manifest(fixture):
+    page_class = classify_page(fixture.html)
+    expected = fixture.expected
+
+    assert page_class.is_antibot == expected['antibot']
+    if fixture.is_antibot:
+        assert page_class.kind == ANTIBOT
+        return
+    assert page_class.out_of_stock == (not expected['in_stock'])
+    assert page_class.kind == (OUT_OF_STOCK if not expected['in_stock'] else PRODUCT)
+    assert _price(page_class) == expected['price']
+
+
+@pytest.mark.parametrize('fixture', CORPUS, ids=lambda f: f.name)
+def test_classifier_agrees_with_legacy_checks(fixture):
+    # Наличие сверяется с manifest.json: прежняя проверка искала фразы по всей странице
+    assert agree(check_before(fixture.html), check_after(fixture.html))
+
+
+def test_stock_phrase_outside_status_widgets_is_ignored():
+    fixture = next(f for f in CORPUS if f.name == 'product_stock_phrase.html')
+    assert check_before(fixture.html)[1]
+    assert not classify_page(fixture.html).out_of_stock
+
+
+@pytest.mark.parametrize('fixture', [f for f in CORPUS if not f.is_antibot], ids=lambda f: f.name)
+def test_in_page_stock_rule_matches_html_path(fixture):
+    # EXTRACT_SCRIPT возвращает outerHTML виджетов статуса наличия
+    widgets = re.findall(r'<div data-widget="(?:webOutOfStock|webAddToCart)">.*?</div>', fixture.html)
+    assert widgets_out_of_stock(''.join(widgets)) == classify_page(fixture.html).out_of_stock
+
+
+def test_stock_phrase_inside_status_widget():
+    html = '<div data-widget="webAddToCart"><span>Нет в наличии</span></div><div data-widget="webReviews"></div>'
+    assert classify_page(html).out_of_stock
+    assert widgets_out_of_stock(html)
+    assert not widgets_out_of_stock('<div data-widget="webReviews">Нет в наличии</div>')
+
+
+def test_price_after_ruble_found_on_demand():
+    page_class = classify_page('<div data-widget="webPrice">₽ 2 490</div>')
+    assert page_class.price_candidates() == ['2 490']
+    assert _price(page_class) == 2490.0
+
+
+def test_antibot_keyword_stops_scan():
+    page_class = classify_page('<title>Just a moment...</title><span>1 299 ₽</span>')
+    assert page_class.is_antibot
+    assert page_class.antibot_keyword == 'just a moment'
@@ -0,0 +1,159 @@
+"""
+Здоровье прокси: карантин, испытание, взвешенный выбор, общий файл статистики
+"""
+
+import asyncio
+import os
+import threading
+import time
+
+from proxy_health import ANTIBOT, FAILED, OK, ProxyHealth
+
+PROXIES = ['1.1.1.1:8080', '2.2.2.2:8080']
+BAD, GOOD = PROXIES
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def quarantined(tmp_path, base: float = 0.05) -> ProxyHealth:
+    """Статистика, в которой BAD только что ушел в карантин"""
+    health = ProxyHealth(str(tmp_path / 'stats.json'), quarantine_failures=3, quarantine_base=base)
+    for _ in range(3):
+        health.record(BAD, FAILED)
+    return health
+
+
+def test_failures_in_row_quarantine_proxy(tmp_path):
+    health = quarantined(tmp_path, base=60)
+    assert health.get(BAD).quarantined_until > time.time()
+    assert all(health.choose(PROXIES) == GOOD for _ in range(200))
+
+
+def test_all_quarantined_picks_earliest_end(tmp_path):
+    health = quarantined(tmp_path, base=60)
+    for _ in range(3):
+        health.record(GOOD, FAILED)
+    # Карантин GOOD начался позже - и кончится позже
+    assert health.choose(PROXIES) == BAD
+
+
+def test_probation_single_trial(tmp_path):
+    health = quarantined(tmp_path)
+    time.sleep(0.06)
+    picks = [health.choose([BAD]) for _ in range(3)]
+    assert health.get(BAD).probation
+    # Испытание одно: пока оно идет, BAD берется только как последний вариант
+    assert all(health.choose(PROXIES) == GOOD for _ in range(200))
+    assert picks[0] == BAD
+
+
+def test_probation_success_and_failure(tmp_path):
+    health = quarantined(tmp_path)
+    time.sleep(0.06)
+    health.choose([BAD])
+    health.record(BAD, OK)
+    stats = health.get(BAD)
+    assert not stats.probation and stats.quarantines == 0
+
+    for _ in range(3):
+        health.record(BAD, FAILED)
+    time.sleep(0.06)
+    health.choose([BAD])
+    health.record(BAD, FAILED)
+    # Провал испытания - сразу новый карантин, вдвое длиннее
+    assert health.get(BAD).quarantines == 2
+    assert health.get(BAD).quarantined_until - time.time() > 0.05
+
+
+def test_released_trial_is_available_again(tmp_path):
+    health = quarantined(tmp_path)
+    time.sleep(0.06)
+    assert health.choose([BAD]) == BAD
+    health.release(BAD)
+    assert any(health.choose(PROXIES) == BAD for _ in range(2000))
+
+
+def test_selection_without_trial_skips_probation(tmp_path):
+    health = quarantined(tmp_path)
+    time.sleep(0.06)
+    assert health.choose([BAD]) == BAD
+    health.release(BAD)
+    assert all(health.choose(PROXIES, trial=False) == GOOD for _ in range(500))
+    assert BAD in [health.choose(PROXIES) for _ in range(2000)]
+
+
+def test_selection_without_trial_never_falls_back_to_quarantine(tmp_path):
+    health = quarantined(tmp_path, base=60)
+    for _ in range(3):
+        health.record(GOOD, FAILED)
+    assert health.choose(PROXIES, trial=False) is None
+
+
+def test_weight_prefers_healthy_proxy(tmp_path):
+    health = ProxyHealth(str(tmp_path / 'stats.json'), quarantine_failures=100)
+    for _ in range(10):
+        health.record(GOOD, OK, latency=3)
+        health.record(BAD, ANTIBOT)
+    picks = [health.choose(PROXIES) for _ in range(2000)]
+    assert picks.count(GOOD) > 0.9 * len(picks)
+    assert BAD in picks
+
+
+def test_counters_of_processes_are_summed(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    bot, scheduler = ProxyHealth(path), ProxyHealth(path)
+    for _ in range(5):
+        bot.record(GOOD, OK, latency=2)
+    for _ in range(7):
+        scheduler.record(GOOD, OK, latency=2)
+    bot.save(force=True)
+    scheduler.save(force=True)
+    bot.save(force=True)
+
+    assert ProxyHealth(path).get(GOOD).checks == 12
+    assert bot.get(GOOD).checks == 12
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_reload_keeps_unsaved_counts(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    health = ProxyHealth(path)
+    health.record(GOOD, OK)
+    health.save(force=True)
+    health.record(GOOD, OK)
+    # /proxy_list перечитывает файл до записи - своя проверка не теряется
+    health.reload()
+    health.reload()
+    assert health.get(GOOD).checks == 2
+    health.save(force=True)
+    assert ProxyHealth(path).get(GOOD).checks == 2
+
+
+def test_save_from_event_loop_runs_in_thread(tmp_path):
+    path = str(tmp_path / 'stats.json')
+    writers = []
+
+    async def scenario():
+        health = ProxyHealth(path)
+        write = health._write_merged
+
+        def recorded_write(snapshot):
+            writers.append(threading.current_thread())
+            return write(snapshot)
+
+        health._write_merged = recorded_write
+        health.record(GOOD, OK)
+        # Запись уже идет в потоке - проверки копятся до следующей
+        health.record(GOOD, OK)
+        await health._saving
+        health.record(GOOD, OK)
+        await health.close()
+        return health
+
+    health = run(scenario())
+    assert writers and threading.main_thread() not in writers
+    assert health.get(GOOD).checks == 3
+    assert ProxyHealth(path).get(GOOD).checks == 3
+    assert not any(health.get(GOOD).pending.values())
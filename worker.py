@@ -0,0 +1,247 @@
+"""
+Воркер проверки цен: задания из очереди проверок, парсинг, результат в очередь
+
+    python worker.py [--name host-1] [--metrics-port 9110]
+
+Воркер не пишет в основную БД и не шлет уведомлений - только берет в
+аренду задания job_queue, загружает страницы своим пулом браузеров и
+возвращает результат координатору (scheduler.py). Каждый процесс воркера -
+отдельный Chromium и отдельное ядро; воркеры других машин запускаются так
+же и работают с общим файлом очереди (JOB_QUEUE_PATH).
+
+Планировщик сам запускает WORKER_PROCESSES локальных воркеров и
+перезапускает упавшие (WorkerProcesses).
+"""
+
+# Учет времени импортов - до остальных модулей
+import startup_report
+startup_report.install()
+
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, List, Optional
+
+from config import (CHECK_WORKERS, JOB_POLL_INTERVAL, LOG_FORMAT, LOG_LEVEL, MAX_CHECKS_PER_PROXY,
+                    PARSER_DELAY)
+from job_queue import JobQueue, job_queue_from_config
+from metrics import MetricsServer, register_stats
+from parser import OzonParser, parser_from_config
+from proxy_registry import proxy_registry_from_config
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед перезапуском упавшего воркера (секунды), удваивается до максимума
+RESTART_DELAY = 5
+RESTART_DELAY_MAX = 300
+# Сколько ждать завершения воркера после SIGTERM (секунды)
+STOP_TIMEOUT = 30
+# Неудачных продлений аренды подряд (раз в треть аренды), после которых проверка прерывается
+RENEW_ATTEMPTS = 2
+
+
+class Worker:
+    """Процесс проверки: CHECK_WORKERS заданий одновременно через общий пул браузеров"""
+
+    def __init__(self, jobs: JobQueue, name: Optional[str] = None, concurrency: int = CHECK_WORKERS,
+                 metrics: Optional[MetricsServer] = None, parser: Optional[OzonParser] = None):
+        self.jobs = jobs
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.concurrency = max(1, concurrency)
+        self.parser = parser
+        if self.parser is None:
+            self.parser = parser_from_config(
+                max_per_proxy=MAX_CHECKS_PER_PROXY if self.concurrency > 1 else None
+            )
+            self.parser.use_registry(proxy_registry_from_config())
+        self.metrics = metrics
+        self._stopping: Optional[asyncio.Event] = None
+
+        if self.metrics:
+            register_stats('ozon_browser_pool', 'Пул браузеров', self.parser.pool.stats)
+            register_stats('ozon_jobs', 'Задания очереди проверок', self.jobs.stats)
+
+    async def _renew(self, job: Dict, check: asyncio.Future):
+        """Продление аренды, пока идет проверка; без аренды проверка прерывается
+
+        Иначе аренда истечет посреди проверки и товар проверит еще и другой воркер.
+        """
+        failures = 0
+        while True:
+            await asyncio.sleep(self.jobs.lease_timeout / 3)
+            try:
+                if await self.jobs.renew(job['id'], self.name):
+                    failures = 0
+                    continue
+                logger.warning(f"Задание #{job['id']} отдано другому воркеру - проверка прервана")
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Не удалось продлить аренду задания #{job['id']} ({failures}/{RENEW_ATTEMPTS}): {e}")
+                if failures < RENEW_ATTEMPTS:
+                    continue
+                logger.error(f"Аренда задания #{job['id']} не продлена - проверка прервана")
+            job['abandoned'] = True
+            check.cancel()
+            return
+
+    async def process(self, job: Dict):
+        """Проверка одного задания"""
+        logger.info(f"[#{job['id']}, попытка {job['attempts']}] {job['url'][:60]}")
+        check = asyncio.ensure_future(self.parser.parse_product_async(job['url']))
+        renewal = asyncio.ensure_future(self._renew(job, check))
+        try:
+            result = await check
+        except asyncio.CancelledError:
+            if not job.get('abandoned'):
+                raise
+            # Задание вернется в очередь: сразу, если аренда еще наша, иначе по ее истечении
+            try:
+                await self.jobs.fail(job['id'], self.name, "Аренда не продлена")
+            except Exception as e:
+                logger.debug(f"Задание #{job['id']} не возвращено в очередь: {e}")
+            return
+        except Exception as e:
+            logger.error(f"❌ Задание #{job['id']}: {e}")
+            await self.jobs.fail(job['id'], self.name, str(e))
+            return
+        finally:
+            renewal.cancel()
+
+        if not await self.jobs.complete(job['id'], self.name, result):
+            logger.warning(f"Задание #{job['id']}: аренда потеряна, результат отброшен")
+
+    async def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                job = await self.jobs.lease(self.name)
+            except Exception as e:
+                logger.error(f"Ошибка очереди проверок: {e}")
+                job = None
+            if job is None:
+                # Очередь пуста - ждем новых заданий (или остановки)
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self.process(job)
+            except Exception as e:
+                # Задание вернется в очередь по истечении аренды
+                logger.error(f"Ошибка задания #{job['id']}: {e}")
+            await asyncio.sleep(PARSER_DELAY)
+
+    def stop(self):
+        """Остановка после текущих заданий"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        await self.jobs.open()
+        if self.metrics:
+            await self.metrics.start()
+        logger.info(f"🛠 Воркер {self.name}: одновременных проверок {self.concurrency}")
+        startup_report.report(logger, "Воркер готов к проверкам")
+        try:
+            await asyncio.gather(*(self._loop() for _ in range(self.concurrency)))
+        finally:
+            await self.parser.close()
+            await self.jobs.close()
+            if self.metrics:
+                await self.metrics.close()
+            logger.info(f"Воркер {self.name} остановлен: {self.jobs.stats()}")
+
+
+class WorkerProcesses:
+    """Локальные процессы воркеров планировщика с перезапуском упавших"""
+
+    def __init__(self, count: int, metrics_port: Optional[int] = None):
+        self.count = count
+        self.metrics_port = metrics_port
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self.restarts = 0
+
+    def _command(self, index: int) -> List[str]:
+        command = [sys.executable, os.path.abspath(__file__), '--name', f"{socket.gethostname()}-{index}"]
+        if self.metrics_port:
+            command += ['--metrics-port', str(self.metrics_port + index)]
+        return command
+
+    async def _supervise(self, index: int):
+        delay = RESTART_DELAY
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(*self._command(index))
+            self._processes[index] = process
+            logger.info(f"🛠 Воркер {index} запущен (pid {process.pid})")
+            started = time.monotonic()
+            code = await process.wait()
+            if self._stopping:
+                return
+            if time.monotonic() - started > RESTART_DELAY_MAX:
+                delay = RESTART_DELAY
+            # Его задания вернутся в очередь по истечении аренды
+            self.restarts += 1
+            logger.error(f"Воркер {index} завершился с кодом {code}, перезапуск через {delay} с")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX)
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._supervise(i)) for i in range(self.count)]
+
+    def stats(self) -> Dict:
+        return {
+            'processes': sum(1 for p in self._processes.values() if p.returncode is None),
+            'restarts': self.restarts,
+        }
+
+    async def close(self):
+        """SIGTERM воркерам: текущие задания доделываются, после STOP_TIMEOUT - SIGKILL"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        processes = [p for p in self._processes.values() if p.returncode is None]
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        self._processes.clear()
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    arguments = argparse.ArgumentParser(description="Воркер проверки цен из очереди проверок")
+    arguments.add_argument('--name', help="имя воркера в аренде заданий (по умолчанию хост:pid)")
+    arguments.add_argument('--metrics-port', type=int, help="порт метрик Prometheus воркера")
+    return arguments.parse_args(argv)
+
+
+async def main(argv: List[str]):
+    import config
+
+    args = parse_args(argv)
+    jobs = job_queue_from_config()
+    metrics = None
+    if args.metrics_port and config.METRICS_ENABLED:
+        metrics = MetricsServer(config.METRICS_HOST, args.metrics_port)
+
+    worker = Worker(jobs, args.name, metrics=metrics)
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL, format=LOG_FORMAT)
+    asyncio.run(main(sys.argv[1:]))